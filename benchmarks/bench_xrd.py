@@ -0,0 +1,148 @@
+"""ingestion and peak search benchmarks on synthetic files, run with
+
+    python -m pytest benchmarks/bench_xrd.py -s
+
+(not collected by the default test run). Environment variables:
+    XRD_BENCHMARK_SIZES      points of the synthetic scans, default "1000,100000,1000000" (up to 1e7)
+    XRD_BENCHMARK_TOLERANCE  allowed slow down / memory increase over the baseline, default 1 (+100%)
+    XRD_BENCHMARK_SAVE       "1" to write the measures as the new baseline.json instead of checking them
+
+Times are stored in units of a fixed numpy workload measured at the start of the run, so that the
+baseline can be compared across machines of different speed. Memory is the tracemalloc peak."""
+import os
+import gc
+import json
+import time
+import tracemalloc
+import numpy as np
+import pytest
+
+from benchmarks.generators import write_xrd_file, alpha1
+from notebooks.xrd_file_parser import xrd_file_parser
+from notebooks.utilities import find_peaks_above_threshold, from_theta_to_d
+
+baseline_file_name = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+sizes = [int(float(_size)) for _size in os.environ.get("XRD_BENCHMARK_SIZES", "1000,100000,1000000").split(",")]
+tolerance = float(os.environ.get("XRD_BENCHMARK_TOLERANCE", "1"))
+save_baseline = os.environ.get("XRD_BENCHMARK_SAVE", "0") == "1"
+
+file_types = ['ras', 'asc', 'txt', 'raw']
+
+# timer noise allowed on top of the tolerance (s), for the sub millisecond benchmarks
+time_slack = 1e-3
+
+
+def _calibration():
+    """best time of a fixed numpy workload, the time unit of the benchmarks"""
+    values = np.random.default_rng(0).random(1_000_000)
+    times = []
+    for _ in range(5):
+        _start = time.perf_counter()
+        np.sort(values)
+        times.append(time.perf_counter() - _start)
+    return min(times)
+
+
+def measure(function, repeat=5):
+    """best time (s) over repeat calls (the least disturbed by the rest of the machine) and tracemalloc
+    peak (bytes) of one call"""
+    function()
+    times = []
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - _start)
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), int(peak)
+
+
+@pytest.fixture(scope='module')
+def benchmark_run():
+    """calibration of this machine and measures of the run, checked or saved as the baseline at the end"""
+    if os.path.exists(baseline_file_name):
+        with open(baseline_file_name) as f:
+            baseline = json.load(f)
+    else:
+        baseline = {}
+
+    run = {'unit': _calibration(), 'baseline': baseline, 'measures': {}}
+    yield run
+
+    if save_baseline:
+        baseline.update(run['measures'])
+        with open(baseline_file_name, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+
+
+@pytest.fixture(scope='module')
+def synthetic_files(tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp("synthetic"))
+    return {(_file_type, _size): write_xrd_file(folder, _file_type, _size)
+            for _file_type in file_types
+            for _size in sizes}
+
+
+def check(benchmark_run, name, function, repeat=5):
+    """measure function and compare it with its baseline"""
+    seconds, peak = measure(function, repeat=repeat)
+    measures = {'time': seconds / benchmark_run['unit'], 'memory': peak}
+    benchmark_run['measures'][name] = measures
+    print("\n{:<40} {:>10.2f} ms {:>10.1f} MB".format(name, 1e3 * seconds, peak / 2 ** 20))
+
+    expected = benchmark_run['baseline'].get(name)
+    if save_baseline or (expected is None):
+        return
+    assert measures['time'] <= expected['time'] * (1 + tolerance) + time_slack / benchmark_run['unit'], \
+        "{} is {:.0%} slower than its baseline".format(name, measures['time'] / expected['time'] - 1)
+    assert measures['memory'] <= expected['memory'] * (1 + tolerance) + 2 ** 16, \
+        "{} uses {:.0%} more memory than its baseline".format(name, measures['memory'] / expected['memory'] - 1)
+
+
+def _intensity(metadata):
+    data = metadata['data']
+    if isinstance(data, dict):
+        return np.asarray(data['2theta']), np.asarray(data['intensity'], dtype=np.float64)
+    return np.asarray(metadata['2theta']['axis']), np.asarray(data, dtype=np.float64)
+
+
+@pytest.mark.parametrize('size', sizes)
+@pytest.mark.parametrize('file_type', file_types)
+def test_xrd_file_parser(benchmark_run, synthetic_files, file_type, size):
+    file_name, scan = synthetic_files[(file_type, size)]
+
+    xaxis, yaxis = _intensity(xrd_file_parser(file_name))
+    assert np.allclose(xaxis, scan['2theta'])
+    assert np.allclose(yaxis, scan['intensity'])
+
+    check(benchmark_run, "xrd_file_parser[{}-{}]".format(file_type, size), lambda: xrd_file_parser(file_name))
+
+
+@pytest.mark.parametrize('size', sizes)
+def test_find_peaks_above_threshold(benchmark_run, synthetic_files, size):
+    _, scan = synthetic_files[('raw', size)]
+    distance = max(1, size // 50)
+
+    peaks = find_peaks_above_threshold(xaxis=scan['2theta'], yaxis=scan['intensity'], threshold=1000,
+                                       distance=distance)
+    assert np.array_equal(peaks['xaxis'], scan['peaks'])
+
+    check(benchmark_run, "find_peaks_above_threshold[{}]".format(size),
+          lambda: find_peaks_above_threshold(xaxis=scan['2theta'], yaxis=scan['intensity'], threshold=1000,
+                                             distance=distance))
+
+
+@pytest.mark.parametrize('size', sizes)
+def test_from_theta_to_d(benchmark_run, synthetic_files, size):
+    _, scan = synthetic_files[('raw', size)]
+
+    d = from_theta_to_d(two_theta=scan['2theta'], units='deg', xrd_lambda_angstroms=alpha1)
+    assert np.allclose(d, alpha1 / (2 * np.sin(np.radians(scan['2theta']) / 2)))
+
+    check(benchmark_run, "from_theta_to_d[{}]".format(size),
+          lambda: from_theta_to_d(two_theta=scan['2theta'], units='deg', xrd_lambda_angstroms=alpha1))
@@ -0,0 +1,170 @@
+import os
+import numpy as np
+
+try:
+    from notebooks.xrd_file_parser import rigaku_raw_layout
+except ImportError:
+    from xrd_file_parser import rigaku_raw_layout
+
+# Cu wavelengths written in the headers
+alpha1 = 1.540593
+alpha2 = 1.544414
+beta = 1.392250
+
+ras_header = """*RAS_DATA_START
+*RAS_HEADER_START
+*FILE_SAMPLE "synthetic"
+*HW_XG_TARGET_NAME "Cu"
+*HW_XG_WAVE_LENGTH_ALPHA1 "{alpha1}"
+*HW_XG_WAVE_LENGTH_ALPHA2 "{alpha2}"
+*HW_XG_WAVE_LENGTH_BETA "{beta}"
+*MEAS_SCAN_START "{start}"
+*MEAS_SCAN_STOP "{stop}"
+*MEAS_SCAN_STEP "{step}"
+*RAS_HEADER_END
+*RAS_INT_START
+"""
+
+ras_footer = """*RAS_INT_END
+*RAS_DATA_END
+"""
+
+asc_header = """*TYPE		=  Raw
+*SAMPLE		=  synthetic
+*XRAY_CHAR	=  K-ALPHA
+*WAVE_LENGTH1	=  {alpha1}
+*WAVE_LENGTH2	=  {alpha2}
+
+*BEGIN
+*GROUP		=  0
+*START		=  {start}
+*STOP		=  {stop}
+*STEP		=  {step}
+*FULL_SCALE	=  {full_scale}
+*INDEX		=  0, 0, 0
+*COUNT		=  {count}
+"""
+
+asc_footer = """*END
+
+*EOF
+"""
+
+
+def synthetic_scan(n_points=1000, start=10., stop=120., n_peaks=10, background=100., seed=0):
+    """scan of n_points between start and stop (rounded step) with n_peaks gaussian peaks at known
+    positions on a decreasing background, with poisson noise. Returns '2theta', 'intensity', 'step' (and
+    its 'decimals'), 'peaks' (2theta of the peaks, on the grid) and 'heights'"""
+    rng = np.random.default_rng(seed)
+    decimals = max(2, int(np.ceil(-np.log10((stop - start) / (n_points - 1)))) + 1)
+    step = round((stop - start) / (n_points - 1), decimals)
+    two_theta = np.round(start + step * np.arange(n_points), decimals)
+
+    # peaks on the grid, at least 5% of the range apart
+    span = two_theta[-1] - two_theta[0]
+    positions = np.linspace(two_theta[0] + 0.05 * span, two_theta[-1] - 0.05 * span, n_peaks)
+    index = np.searchsorted(two_theta, positions)
+    peaks = two_theta[index]
+    heights = rng.uniform(2000., 20000., n_peaks)
+    width = max(0.05, 5 * step)
+
+    intensity = background * (1. + 2. * np.exp(-(two_theta - two_theta[0]) / (0.2 * span)))
+    windows = [np.searchsorted(two_theta, [_peak - 10 * width, _peak + 10 * width]) for _peak in peaks]
+    for (_first, _last), _peak, _height in zip(windows, peaks, heights):
+        intensity[_first:_last] += _height * np.exp(-0.5 * ((two_theta[_first:_last] - _peak) / width) ** 2)
+    intensity = rng.poisson(intensity).astype(np.float64)
+
+    # the known peaks stay the maxima of their neighbourhood, whatever the noise
+    for (_first, _last), _index in zip(windows, index):
+        intensity[_index] = intensity[_first:_last].max() + 1
+
+    return {'2theta': two_theta,
+            'intensity': intensity,
+            'step': step,
+            'decimals': decimals,
+            'peaks': peaks,
+            'heights': intensity[index],
+            }
+
+
+def _axis_values(scan):
+    return {'alpha1': alpha1,
+            'alpha2': alpha2,
+            'beta': beta,
+            'start': scan['2theta'][0],
+            'stop': scan['2theta'][-1],
+            'step': scan['step'],
+            'count': len(scan['2theta']),
+            'full_scale': int(scan['intensity'].max()),
+            }
+
+
+def write_ras_file(file_name=None, scan=None):
+    """RAS file of the scan (2theta, intensity and attenuator columns)"""
+    rows = np.column_stack((scan['2theta'], scan['intensity'], np.ones(len(scan['2theta']))))
+    with open(file_name, 'w', newline='\r\n') as f:
+        f.write(ras_header.format(**_axis_values(scan)))
+        np.savetxt(f, rows, fmt=['%.{}f'.format(scan['decimals']), '%.4f', '%.4f'], delimiter=' ')
+        f.write(ras_footer)
+    return file_name
+
+
+def write_asc_file(file_name=None, scan=None):
+    """ASC file of the scan (counts 4 per line)"""
+    counts = scan['intensity'].astype(np.int64)
+    n_full = len(counts) // 4 * 4
+    with open(file_name, 'w', newline='\r\n') as f:
+        f.write(asc_header.format(**_axis_values(scan)))
+        np.savetxt(f, counts[:n_full].reshape(-1, 4), fmt='%d', delimiter=', ')
+        if n_full < len(counts):
+            f.write(", ".join(str(_count) for _count in counts[n_full:]) + "\n")
+        f.write(asc_footer)
+    return file_name
+
+
+def write_txt_file(file_name=None, scan=None):
+    """two columns, tab separated, TXT file of the scan"""
+    rows = np.column_stack((scan['2theta'], scan['intensity']))
+    with open(file_name, 'w') as f:
+        f.write('"2 theta, degree"\tIntensity\n')
+        np.savetxt(f, rows, fmt=['%.{}f'.format(scan['decimals']), '%.4f'], delimiter='\t')
+    return file_name
+
+
+def write_raw_file(file_name=None, scan=None):
+    """binary Rigaku RAW ("FI") file of the scan"""
+    data_offset = rigaku_raw_layout['count'] + 4
+    header = bytearray(data_offset)
+    header[:2] = rigaku_raw_layout['magic']
+    _offset, _length = rigaku_raw_layout['sample']
+    header[_offset:_offset + len(b"synthetic")] = b"synthetic"
+    _offset, _length = rigaku_raw_layout['target']
+    header[_offset:_offset + 2] = b"Cu"
+
+    values = _axis_values(scan)
+    for _key, _dtype, _values in (('wavelengths', '<f8', [alpha1, alpha2, beta]),
+                                  ('2theta', '<f4', [values['start'], values['stop'], values['step']]),
+                                  ('full_scale', '<f4', [values['full_scale']]),
+                                  ('count', '<u4', [values['count']])):
+        _bytes = np.array(_values, dtype=_dtype).tobytes()
+        header[rigaku_raw_layout[_key]:rigaku_raw_layout[_key] + len(_bytes)] = _bytes
+
+    with open(file_name, 'wb') as f:
+        f.write(header)
+        f.write(scan['intensity'].astype('<f4').tobytes())
+    return file_name
+
+
+xrd_file_writers = {'ras': write_ras_file,
+                    'asc': write_asc_file,
+                    'txt': write_txt_file,
+                    'raw': write_raw_file,
+                    }
+
+
+def write_xrd_file(folder=None, file_type='ras', n_points=1000, seed=0):
+    """write a synthetic scan of n_points in folder, returns the file name and the scan"""
+    scan = synthetic_scan(n_points=n_points, seed=seed)
+    file_name = os.path.join(folder, "synthetic_{}.{}".format(n_points, file_type))
+    xrd_file_writers[file_type](file_name, scan)
+    return file_name, scan
@@ -0,0 +1,98 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from .xrd_file_parser import xrd_file_parser, list_xrd_files
+except ImportError:
+    from xrd_file_parser import xrd_file_parser, list_xrd_files
+
+
+def read_file_bytes(xrd_file_name=None):
+    """whole content of a file, read in one call (run in the reader threads)"""
+    with open(xrd_file_name, 'rb') as f:
+        return f.read()
+
+
+def parse_xrd_buffer(buffer=None, xrd_file_type=None):
+    """parse the bytes of a file already read (run in the worker pool)"""
+    return xrd_file_parser(xrd_file_content=buffer, xrd_file_type=xrd_file_type)
+
+
+async def async_xrd_file_parser(xrd_file_name=None, executor=None, reader=None):
+    """async counterpart of xrd_file_parser: the file is read in a thread (reader, the default executor of the
+    loop when None) and its bytes are parsed in executor (ex: a ProcessPoolExecutor, the default executor of
+    the loop when None), so the event loop is never blocked"""
+    if xrd_file_name is None:
+        raise AttributeError("Provide xrd_file_name")
+
+    loop = asyncio.get_running_loop()
+    try:
+        buffer = await loop.run_in_executor(reader, read_file_bytes, xrd_file_name)
+    except FileNotFoundError:
+        raise ValueError("file does not exist!")
+
+    metadata = await loop.run_in_executor(executor, parse_xrd_buffer, buffer, os.path.splitext(xrd_file_name)[1])
+    if metadata is None:
+        raise ValueError("XRD file type is not supported!")
+    return metadata
+
+
+async def _ingest_worker(xrd_file_name, executor, reader):
+    try:
+        return xrd_file_name, await async_xrd_file_parser(xrd_file_name, executor=executor, reader=reader), None
+    except Exception as error:
+        return xrd_file_name, None, "{}: {}".format(type(error).__name__, error)
+
+
+async def iter_parsed_files(path=None, max_concurrency=8, executor=None, max_workers=None):
+    """async iterator over the XRD files of a directory (or glob pattern, or list of file names) yielding
+    (file_name, metadata, error) in completion order.
+
+    At most max_concurrency files are in flight (read by as many reader threads, or waiting for / being
+    parsed), which bounds both the load on the share and the memory held by file contents. The contents
+    are parsed in executor, or in a process pool of max_workers created for the iteration when None
+    (max_workers=1 parses in a thread). Files that fail to read or parse are yielded with metadata None
+    and the error message instead of aborting the iteration"""
+    if path is None:
+        raise AttributeError("Provide a path or a list of file names")
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1!")
+
+    loop = asyncio.get_running_loop()
+    reader = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="xrd_reader")
+    own_executor = executor is None
+    if own_executor:
+        if max_workers == 1:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="xrd_parser")
+        else:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    pending = set()
+    try:
+        if isinstance(path, (str, os.PathLike)):
+            # listing a network share blocks too
+            file_names = await loop.run_in_executor(reader, list_xrd_files, os.fspath(path))
+        else:
+            file_names = list(path)
+
+        queue = iter(file_names)
+        while True:
+            for _file_name in queue:
+                pending.add(asyncio.ensure_future(_ingest_worker(_file_name, executor, reader)))
+                if len(pending) >= max_concurrency:
+                    break
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for _task in done:
+                yield _task.result()
+
+    finally:
+        for _task in pending:
+            _task.cancel()
+        reader.shutdown(wait=False)
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
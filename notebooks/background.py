@@ -0,0 +1,174 @@
+import itertools
+import numpy as np
+
+background_methods = ['snip', 'rolling_ball']
+
+
+def _float_array(yaxis=None, out=None):
+    """yaxis as a float array, written in out when provided (out can be yaxis itself)"""
+    if out is None:
+        return np.array(yaxis, dtype=np.float64)
+    if out is not yaxis:
+        np.copyto(out, yaxis)
+    return out
+
+
+def _snip_rows(rows=None, half_width=20, lls=True, buffer=None):
+    """SNIP clipping of the rows (2D float array), in place"""
+    if lls:
+        np.clip(rows, 0, None, out=rows)
+        rows += 1
+        np.sqrt(rows, out=rows)
+        np.log1p(rows, out=rows)
+        np.log1p(rows, out=rows)
+
+    n_points = rows.shape[-1]
+    for _p in range(1, min(half_width, (n_points - 1) // 2) + 1):
+        # the mean is computed before the clipping, as in the textbook copy per iteration
+        mean = buffer[:len(rows), :n_points - 2 * _p]
+        np.add(rows[:, :-2 * _p], rows[:, 2 * _p:], out=mean)
+        mean *= 0.5
+        center = rows[:, _p:-_p]
+        np.minimum(center, mean, out=center)
+
+    if lls:
+        np.expm1(rows, out=rows)
+        np.expm1(rows, out=rows)
+        np.square(rows, out=rows)
+        rows -= 1
+
+
+def snip_background(yaxis=None, half_width=20, lls=True, out=None, block_size=2 ** 15):
+    """SNIP background of a scan or of a 2D stack (scans x points), along the last axis.
+
+    Each of the half_width iterations clips every point to the mean of its neighbours p points away
+    (p = 1 .. half_width) with one array operation, so the cost is half_width passes over the data
+    whatever the number of scans. half_width (in points) should be about the width of the widest peak.
+    With lls, the clipping is done on log(log(sqrt(y + 1) + 1) + 1) to follow low intensities better.
+    The scans are processed by blocks of about block_size points that stay in the cpu cache over the
+    iterations. The background is written into out when provided"""
+    if yaxis is None:
+        raise AttributeError("yaxis can not be none!")
+
+    background = _float_array(yaxis, out)
+    n_points = background.shape[-1]
+    rows = background.reshape(-1, n_points)
+    rows_per_block = max(1, block_size // max(n_points, 1))
+    buffer = np.empty((min(rows_per_block, len(rows)), n_points))
+    for _start in range(0, len(rows), rows_per_block):
+        _snip_rows(rows[_start:_start + rows_per_block], half_width=half_width, lls=lls, buffer=buffer)
+
+    # reshape copies a non contiguous out
+    if not np.shares_memory(rows, background):
+        background[...] = rows.reshape(background.shape)
+    return background
+
+
+def rolling_ball_background(yaxis=None, half_width=20, out=None):
+    """rolling ball background of a scan or of a 2D stack (scans x points), along the last axis.
+
+    The lower envelope is a morphological opening (rolling minimum then rolling maximum over
+    2 * half_width + 1 points, linear time whatever the width), smoothed by a moving average of the same
+    width and kept below the data. The background is written into out when provided"""
+    if yaxis is None:
+        raise AttributeError("yaxis can not be none!")
+
+    import scipy.ndimage
+
+    size = 2 * half_width + 1
+    data = np.asarray(yaxis, dtype=np.float64)
+    if (out is not None) and np.shares_memory(out, data):
+        data = data.copy()
+    opening = scipy.ndimage.minimum_filter1d(data, size, axis=-1, mode='nearest')
+    scipy.ndimage.maximum_filter1d(opening, size, axis=-1, mode='nearest', output=opening)
+
+    background = opening if out is None else out
+    scipy.ndimage.uniform_filter1d(opening, size, axis=-1, mode='nearest', output=background)
+    np.minimum(background, data, out=background)
+    return background
+
+
+def estimate_background(yaxis=None, method='snip', half_width=20, out=None, **kwargs):
+    """background of a scan or of a 2D stack with one of the background_methods"""
+    if method == 'snip':
+        return snip_background(yaxis, half_width=half_width, out=out, **kwargs)
+    if method == 'rolling_ball':
+        return rolling_ball_background(yaxis, half_width=half_width, out=out)
+    raise ValueError(f"background method {method} is not supported!")
+
+
+def subtract_background(yaxis=None, method='snip', half_width=20, in_place=False, **kwargs):
+    """yaxis minus its background. With in_place, yaxis (a float array) is overwritten and returned"""
+    if yaxis is None:
+        raise AttributeError("yaxis can not be none!")
+
+    background = estimate_background(yaxis, method=method, half_width=half_width, **kwargs)
+    if in_place:
+        yaxis -= background
+        return yaxis
+    return np.subtract(yaxis, background)
+
+
+def background_margin(method='snip', half_width=20):
+    """number of points on each side of a point that its background depends on"""
+    if method == 'snip':
+        # iteration p reads the points p away from the result of the previous iterations
+        return half_width * (half_width + 1) // 2 + 1
+    if method == 'rolling_ball':
+        # rolling minimum, rolling maximum and moving average
+        return 3 * half_width + 1
+    raise ValueError(f"background method {method} is not supported!")
+
+
+def iter_background_blocks(blocks=None, method='snip', half_width=20, **kwargs):
+    """background of a scan received block by block (ex: xrd_file_parser.iter_scan_blocks), holding only
+    the last blocks in memory.
+
+    The blocks are dictionaries of arrays ('2theta', 'intensity', ...). The same dictionaries are yielded
+    with a 'background' array, delayed by background_margin points: the background of a point is
+    computed once the points it depends on on both sides are received, so it is the same as the
+    background of the full scan (up to the rounding of the moving average of rolling_ball)"""
+    if blocks is None:
+        raise AttributeError("blocks can not be none!")
+
+    margin = background_margin(method, half_width)
+    window = {}
+    window_start = 0
+    emitted = 0
+    n_points = 0
+    for block in itertools.chain(blocks, [None]):
+        if block is not None:
+            for _key, _value in block.items():
+                _value = np.asarray(_value)
+                window[_key] = np.concatenate((window[_key], _value)) if _key in window else _value
+            n_points += len(block['intensity'])
+            last = n_points - margin
+            # the first window is long enough for all the iterations of the method
+            if (last <= emitted) or (n_points - window_start < 2 * margin + 1):
+                continue
+        else:
+            last = n_points
+            if last <= emitted:
+                return
+
+        background = estimate_background(window['intensity'], method=method, half_width=half_width, **kwargs)
+        first_row, last_row = emitted - window_start, last - window_start
+        new_block = {_key: _value[first_row:last_row] for _key, _value in window.items()}
+        new_block['background'] = background[first_row:last_row]
+        yield new_block
+
+        # the points left of the next block that its background depends on are kept
+        emitted = last
+        keep_from = max(emitted - margin - window_start, 0)
+        window = {_key: _value[keep_from:] for _key, _value in window.items()}
+        window_start += keep_from
+
+
+def net_signal(yaxis=None, background=None, half_width=20):
+    """yaxis minus background: None (yaxis unchanged), one of the background_methods or the background
+    itself (array)"""
+    if background is None:
+        return yaxis
+    if isinstance(background, str):
+        return subtract_background(yaxis, method=background, half_width=half_width)
+    return np.subtract(yaxis, background)
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import datetime
+import numpy as np
+
+try:
+    from .xrd_file_parser import xrd_file_parser, list_xrd_files
+    from .parse_cache import file_hash
+    from .xrd_scan import XrdScan, sample_of
+    from .utilities import retrieve_anode_material
+except ImportError:
+    from xrd_file_parser import xrd_file_parser, list_xrd_files
+    from parse_cache import file_hash
+    from xrd_scan import XrdScan, sample_of
+    from utilities import retrieve_anode_material
+
+# one row per scan (per segment of multi-scan RAS files)
+catalogue_columns = ['path', 'segment', 'file_type', 'size', 'mtime', 'hash', 'alpha1', 'alpha2', 'beta',
+                     'anode', 'two_theta_min', 'two_theta_max', 'n_points', 'sample', 'data_offset']
+
+catalogue_schema = """
+CREATE TABLE IF NOT EXISTS scans (
+    path TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    file_type TEXT,
+    size INTEGER,
+    mtime INTEGER,
+    hash TEXT,
+    alpha1 REAL,
+    alpha2 REAL,
+    beta REAL,
+    anode TEXT,
+    two_theta_min REAL,
+    two_theta_max REAL,
+    n_points INTEGER,
+    sample TEXT,
+    data_offset INTEGER,
+    PRIMARY KEY (path, segment)
+);
+CREATE INDEX IF NOT EXISTS scans_anode ON scans (anode);
+CREATE INDEX IF NOT EXISTS scans_sample ON scans (sample);
+CREATE INDEX IF NOT EXISTS scans_mtime ON scans (mtime);
+"""
+
+# RAS header keys describing the 2theta axis, used instead of decoding the data
+ras_axis_header_keys = ['MEAS_SCAN_START', 'MEAS_SCAN_STOP', 'MEAS_SCAN_STEP']
+
+
+def _float_or_none(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def _two_theta_range(metadata=None):
+    """first and last 2theta and number of points of a scan parsed with lazy, from the header when it
+    describes the axis (the data is decoded otherwise)"""
+    axis = (metadata.get('2theta') or {}).get('axis')
+    if axis is not None:
+        if not len(axis):
+            return None, None, 0
+        return float(axis[0]), float(axis.stop), len(axis)
+
+    header = metadata.get('header') or {}
+    if all(_key in header for _key in ras_axis_header_keys):
+        start, stop, step = [float(header[_key]) for _key in ras_axis_header_keys]
+        return start, stop, int(round((stop - start) / step)) + 1
+
+    two_theta = np.asarray(metadata['data']['2theta'])
+    if not len(two_theta):
+        return None, None, 0
+    return float(two_theta.min()), float(two_theta.max()), len(two_theta)
+
+
+def catalogue_rows(xrd_file_name=None, content_hash=None):
+    """catalogue rows of the scans of a file, read with the header parsers. Finding every segment of a RAS
+    file scans (without decoding) the data blocks before its last segment"""
+    stat = os.stat(xrd_file_name)
+    metadata = xrd_file_parser(xrd_file_name, lazy=True)
+    if metadata is None:
+        raise ValueError("XRD file type is not supported!")
+
+    rows = []
+    for _segment, _metadata in enumerate(metadata.get('segments') or [metadata]):
+        two_theta_min, two_theta_max, n_points = _two_theta_range(_metadata)
+        data_offset = _metadata.get('data_offset')
+        if data_offset is None:
+            data_offset = _metadata['data'].data_offset
+        rows.append({'path': xrd_file_name,
+                     'segment': _segment,
+                     'file_type': os.path.splitext(xrd_file_name)[1],
+                     'size': stat.st_size,
+                     'mtime': stat.st_mtime_ns,
+                     'hash': content_hash,
+                     'alpha1': _float_or_none(_metadata.get('alpha1')),
+                     'alpha2': _float_or_none(_metadata.get('alpha2')),
+                     'beta': _float_or_none(_metadata.get('beta')),
+                     'anode': retrieve_anode_material(alpha1=_metadata.get('alpha1'),
+                                                      alpha2=_metadata.get('alpha2'),
+                                                      beta=_metadata.get('beta')),
+                     'two_theta_min': two_theta_min,
+                     'two_theta_max': two_theta_max,
+                     'n_points': n_points,
+                     'sample': sample_of(_metadata),
+                     'data_offset': data_offset,
+                     })
+    return rows
+
+
+def _nanoseconds(value=None):
+    """POSIX time (s) or datetime as nanoseconds, the unit of the mtime column"""
+    if isinstance(value, datetime.datetime):
+        value = value.timestamp()
+    return int(value * 1e9)
+
+
+class ScanCatalogue:
+    """SQLite index of the scans of a directory tree: one row per scan with its file path, size, mtime,
+    content hash, wavelengths, anode, 2theta range, number of points, sample and data offset.
+
+    sync only parses the headers of the files that are new or changed since the previous sync (size or
+    mtime changed and different content hash) and removes the files that are gone. The content hash
+    reads the changed files, and so does looking for the segments of RAS files. The query helpers
+    return the matching rows, paths or loaded scans without opening the files"""
+
+    def __init__(self, database_file_name=None):
+        if database_file_name is None:
+            raise AttributeError("Provide a database_file_name")
+
+        self.database_file_name = database_file_name
+        self.connection = sqlite3.connect(database_file_name)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(catalogue_schema)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+
+    def _file_entries(self, folder=None):
+        """size, mtime and hash of the files of the catalogue in folder"""
+        prefix = os.path.join(folder, "")
+        entries = {}
+        for _row in self.connection.execute("SELECT path, size, mtime, hash FROM scans WHERE segment = 0"):
+            if _row['path'].startswith(prefix):
+                entries[_row['path']] = (_row['size'], _row['mtime'], _row['hash'])
+        return entries
+
+    def sync(self, folder=None):
+        """bring the catalogue up to date with the XRD files of folder and its sub folders. Returns the
+        'added', 'updated' and 'removed' file names, the number of 'unchanged' files and the 'errors'
+        ({file_name: message}) of the files that could not be parsed"""
+        if (folder is None) or not os.path.isdir(folder):
+            raise ValueError("folder does not exist!")
+
+        folder = os.path.abspath(folder)
+        entries = self._file_entries(folder)
+        report = {'added': [], 'updated': [], 'removed': [], 'unchanged': 0, 'errors': {}}
+
+        with self.connection:
+            for _file_name in list_xrd_files(folder, recursive=True):
+                stat = os.stat(_file_name)
+                entry = entries.pop(_file_name, None)
+                if entry and (entry[0] == stat.st_size) and (entry[1] == stat.st_mtime_ns):
+                    report['unchanged'] += 1
+                    continue
+
+                content_hash = file_hash(_file_name)
+                if entry and (entry[2] == content_hash):
+                    # touched but not modified
+                    self.connection.execute("UPDATE scans SET size = ?, mtime = ? WHERE path = ?",
+                                            (stat.st_size, stat.st_mtime_ns, _file_name))
+                    report['unchanged'] += 1
+                    continue
+
+                try:
+                    rows = catalogue_rows(_file_name, content_hash=content_hash)
+                except Exception as error:
+                    report['errors'][_file_name] = "{}: {}".format(type(error).__name__, error)
+                    rows = []
+
+                self.connection.execute("DELETE FROM scans WHERE path = ?", (_file_name,))
+                self.connection.executemany("INSERT INTO scans ({}) VALUES ({})".format(
+                                                ", ".join(catalogue_columns),
+                                                ", ".join(":" + _column for _column in catalogue_columns)),
+                                            rows)
+                if _file_name not in report['errors']:
+                    report['updated' if entry else 'added'].append(_file_name)
+
+            for _file_name in entries:
+                self.connection.execute("DELETE FROM scans WHERE path = ?", (_file_name,))
+                report['removed'].append(_file_name)
+
+        return report
+
+    def query(self, anode=None, sample=None, two_theta_range=None, modified_after=None, modified_before=None,
+              path=None):
+        """rows (dictionaries, sorted by path and segment) of the scans matching all the filters:
+            anode              material or list of materials (ex: 'co')
+            sample             SQL LIKE pattern, case insensitive (ex: '%graphite%')
+            two_theta_range    (min, max) in degrees, scans covering part of the range
+            modified_after/before  datetime or POSIX time of the last modification of the file
+            path               SQL LIKE pattern on the absolute path"""
+        conditions = []
+        parameters = []
+        if anode is not None:
+            anode = [anode] if isinstance(anode, str) else list(anode)
+            conditions.append("anode IN ({})".format(", ".join("?" * len(anode))))
+            parameters.extend(anode)
+        if sample is not None:
+            conditions.append("sample LIKE ?")
+            parameters.append(sample)
+        if two_theta_range is not None:
+            conditions.append("two_theta_max >= ? AND two_theta_min <= ?")
+            parameters.extend([float(two_theta_range[0]), float(two_theta_range[1])])
+        if modified_after is not None:
+            conditions.append("mtime >= ?")
+            parameters.append(_nanoseconds(modified_after))
+        if modified_before is not None:
+            conditions.append("mtime < ?")
+            parameters.append(_nanoseconds(modified_before))
+        if path is not None:
+            conditions.append("path LIKE ?")
+            parameters.append(path)
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        cursor = self.connection.execute("SELECT * FROM scans{} ORDER BY path, segment".format(where), parameters)
+        return [dict(_row) for _row in cursor]
+
+    def paths(self, **filters):
+        """paths of the files holding scans matching the filters of query"""
+        return sorted({_row['path'] for _row in self.query(**filters)})
+
+    def scans(self, dtype=np.float64, cache=None, **filters):
+        """XrdScan of every scan matching the filters of query, parsed (or read from the optional
+        parse_cache.ParseCache) file by file"""
+        scans = []
+        metadata = None
+        for _row in self.query(**filters):
+            if (metadata is None) or (metadata[0] != _row['path']):
+                metadata = (_row['path'], xrd_file_parser(_row['path'], cache=cache))
+            segments = metadata[1].get('segments') or [metadata[1]]
+            scans.append(XrdScan.from_metadata(segments[_row['segment']],
+                                               file_name=_row['path'],
+                                               file_type=_row['file_type'],
+                                               dtype=dtype))
+        return scans
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+def _combine_bins(index_min=None, value_min=None, index_max=None, value_max=None):
+    """merge the bins two by two: index and value of the min and of the max of the merged bins"""
+    merged = []
+    for _index, _value, _select in ((index_min, value_min, np.less_equal),
+                                    (index_max, value_max, np.greater_equal)):
+        if _index.shape[-1] % 2:
+            # odd number of bins: the last one is merged with itself
+            _index = np.concatenate((_index, _index[:, -1:]), axis=-1)
+            _value = np.concatenate((_value, _value[:, -1:]), axis=-1)
+        keep_left = _select(_value[:, 0::2], _value[:, 1::2])
+        merged.append(np.where(keep_left, _index[:, 0::2], _index[:, 1::2]))
+        merged.append(np.where(keep_left, _value[:, 0::2], _value[:, 1::2]))
+    return merged
+
+
+class DecimationPyramid:
+    """min/max decimation levels of a scan (or of a 2D stack of series sharing the xaxis) built once, to
+    plot only the points that can be seen.
+
+    Level k keeps, for every bin of 2^k points, the point with the minimum and the point with the maximum
+    intensity, in the order of the scan, so that no peak (or dip) is dropped whatever the zoom. select
+    returns the coarsest level that still has at least one bin per pixel of the plot for a 2theta range."""
+
+    def __init__(self, xaxis=None, yaxis=None, min_bins=256):
+        if (xaxis is None) or (yaxis is None):
+            raise AttributeError("xaxis and yaxis can not be none!")
+
+        self.xaxis = np.asarray(xaxis)
+        self.yaxis = np.asarray(yaxis)
+        if self.yaxis.shape[-1] != len(self.xaxis):
+            raise ValueError("xaxis and yaxis do not have the same number of points!")
+
+        # levels[k - 1] holds the (series x bins) index of the min and of the max of the bins of 2^k points
+        yaxis_2d = self.yaxis.reshape(-1, len(self.xaxis))
+        index_type = np.int32 if len(self.xaxis) < 2 ** 31 else np.int64
+        index = np.broadcast_to(np.arange(len(self.xaxis), dtype=index_type), yaxis_2d.shape)
+        index_min, value_min, index_max, value_max = index, yaxis_2d, index, yaxis_2d
+        self.levels = []
+        while index_min.shape[-1] > min_bins:
+            index_min, value_min, index_max, value_max = _combine_bins(index_min, value_min, index_max, value_max)
+            self.levels.append((index_min, index_max))
+
+    def __len__(self):
+        return len(self.levels) + 1
+
+    def level_for(self, n_points=0, width=1000):
+        """coarsest level with at least width bins for n_points points"""
+        if n_points <= 2 * width:
+            return 0
+        return int(min(np.floor(np.log2(n_points / width)), len(self.levels)))
+
+    def select(self, x_min=None, x_max=None, width=1000):
+        """points to plot between x_min and x_max (all the scan by default) for a plot width pixels wide.
+        Returns 'xaxis' and 'yaxis' (series x points for a stack) and the 'level' used"""
+        first = 0 if x_min is None else int(np.searchsorted(self.xaxis, x_min, side='left'))
+        last = len(self.xaxis) if x_max is None else int(np.searchsorted(self.xaxis, x_max, side='right'))
+        level = self.level_for(last - first, width)
+
+        if level == 0:
+            return {'xaxis': self.xaxis[first:last],
+                    'yaxis': self.yaxis[..., first:last],
+                    'level': 0,
+                    }
+
+        index_min, index_max = self.levels[level - 1]
+        first_bin, last_bin = first >> level, ((last - 1) >> level) + 1
+        index_min, index_max = index_min[:, first_bin:last_bin], index_max[:, first_bin:last_bin]
+
+        # min and max of each bin in the scan order
+        index = np.stack((np.minimum(index_min, index_max), np.maximum(index_min, index_max)), axis=-1)
+        index = index.reshape(len(index), -1)
+        yaxis = np.take_along_axis(self.yaxis.reshape(-1, len(self.xaxis)), index, axis=-1)
+
+        if self.yaxis.ndim == 1:
+            index, yaxis = index[0], yaxis[0]
+        return {'xaxis': self.xaxis[index],
+                'yaxis': yaxis,
+                'level': level,
+                }
@@ -0,0 +1,300 @@
+import os
+import uuid
+import numpy as np
+
+try:
+    from .xrd_file_parser import _scan_arrays
+    from .xrd_scan import sample_of
+    from .utilities import retrieve_anode_material, from_theta_to_d
+except ImportError:
+    from xrd_file_parser import _scan_arrays
+    from xrd_scan import sample_of
+    from utilities import retrieve_anode_material, from_theta_to_d
+
+export_formats = ['parquet', 'hdf5']
+export_tables = ['scans', 'peaks']
+
+# the scan level columns are repeated on every row of the tables
+scan_columns = ['scan_id', 'anode', 'sample']
+point_columns = ['two_theta', 'intensity', 'd']
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError as error:
+        raise ImportError("the parquet export needs pyarrow (pip install pyarrow)") from error
+    return pyarrow, pyarrow.dataset
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError as error:
+        raise ImportError("the hdf5 export needs h5py (pip install h5py)") from error
+    return h5py
+
+
+def export_format_of(path=None, export_format=None):
+    """export_format, or the format of the path: hdf5 for .h5/.hdf5 files, parquet (dataset folder) otherwise"""
+    if export_format is None:
+        export_format = 'hdf5' if os.path.splitext(path)[1] in ['.h5', '.hdf5'] else 'parquet'
+    if export_format not in export_formats:
+        raise ValueError(f"export format {export_format} is not supported!")
+    return export_format
+
+
+def export_records(metadata=None, scan_id=None, peaks=None):
+    """rows of a parsed scan (xrd_file_parser output, or one of its RAS segments) for the 'scans' table
+    and, when peaks ({'xaxis', 'yaxis'} as returned by find_peaks_above_threshold) are given, for the
+    'peaks' table. d is computed with alpha1 (nan without wavelength)"""
+    if (metadata is None) or (scan_id is None):
+        raise AttributeError("metadata and scan_id can not be none!")
+
+    alpha1 = metadata.get('alpha1')
+    scan = {'scan_id': str(scan_id),
+            'anode': retrieve_anode_material(alpha1=alpha1, alpha2=metadata.get('alpha2'),
+                                             beta=metadata.get('beta')),
+            'sample': sample_of(metadata),
+            }
+
+    def _points(two_theta, intensity):
+        two_theta = np.asarray(two_theta, dtype=np.float64)
+        if alpha1 is None:
+            d = np.full(len(two_theta), np.nan)
+        else:
+            d = from_theta_to_d(two_theta=two_theta, units='deg', xrd_lambda_angstroms=float(alpha1))
+        return dict(scan, two_theta=two_theta, intensity=np.asarray(intensity, dtype=np.float64), d=d)
+
+    records = {'scans': _points(*_scan_arrays(metadata))}
+    if peaks is not None:
+        records['peaks'] = _points(peaks['xaxis'], peaks['yaxis'])
+    return records
+
+
+def _concatenate(records=None):
+    """columns of the records, sorted by sample so that the row groups hold few samples"""
+    records = sorted(records, key=lambda _record: _record['sample'])
+    n_rows = [len(_record['two_theta']) for _record in records]
+    columns = {_key: np.repeat(np.array([_record[_key] for _record in records], dtype=object), n_rows)
+               for _key in scan_columns}
+    for _key in point_columns:
+        columns[_key] = np.concatenate([_record[_key] for _record in records])
+    return columns
+
+
+def _append_parquet(path=None, table=None, records=None, chunk_size=2 ** 16):
+    pyarrow, dataset = _import_pyarrow()
+    columns = _concatenate(records)
+    arrow_table = pyarrow.table({_key: pyarrow.array(_values, type=pyarrow.string())
+                                 if _key in scan_columns else _values
+                                 for _key, _values in columns.items()})
+    dataset.write_dataset(arrow_table,
+                          base_dir=os.path.join(path, table),
+                          format='parquet',
+                          partitioning=['anode'],
+                          partitioning_flavor='hive',
+                          basename_template="part-" + uuid.uuid4().hex + "-{i}.parquet",
+                          existing_data_behavior='overwrite_or_ignore',
+                          file_options=dataset.ParquetFileFormat().make_write_options(compression='zstd'),
+                          min_rows_per_group=min(chunk_size, len(arrow_table)),
+                          max_rows_per_group=chunk_size)
+
+
+def _append_dataset(group=None, name=None, values=None, dtype=np.float64, chunk_size=2 ** 16):
+    """append values to the resizable dataset name of group (created chunked and compressed)"""
+    if name not in group:
+        group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(chunk_size,),
+                             compression='gzip', shuffle=True)
+    data = group[name]
+    first = data.shape[0]
+    data.resize((first + len(values),))
+    data[first:] = values
+
+
+def _append_hdf5(path=None, table=None, records=None, chunk_size=2 ** 16):
+    h5py = _import_h5py()
+    string_type = h5py.string_dtype()
+    with h5py.File(path, 'a') as f:
+        group = f.require_group(table)
+        first = group['two_theta'].shape[0] if 'two_theta' in group else 0
+        n_rows = np.array([len(_record['two_theta']) for _record in records], dtype=np.int64)
+        last = first + np.cumsum(n_rows)
+
+        # one catalogue row per scan: scan level values and rows of its points
+        catalogue = group.require_group('catalogue')
+        for _key in scan_columns:
+            _append_dataset(catalogue, _key, [_record[_key] or '' for _record in records], dtype=string_type,
+                            chunk_size=1024)
+        _append_dataset(catalogue, 'first', last - n_rows, dtype=np.int64, chunk_size=1024)
+        _append_dataset(catalogue, 'last', last, dtype=np.int64, chunk_size=1024)
+        _append_dataset(catalogue, 'two_theta_min', [np.min(_record['two_theta'], initial=np.inf)
+                                                     for _record in records], chunk_size=1024)
+        _append_dataset(catalogue, 'two_theta_max', [np.max(_record['two_theta'], initial=-np.inf)
+                                                     for _record in records], chunk_size=1024)
+
+        for _key in point_columns:
+            _append_dataset(group, _key, np.concatenate([_record[_key] for _record in records]),
+                            chunk_size=chunk_size)
+
+
+_appenders = {'parquet': _append_parquet,
+              'hdf5': _append_hdf5,
+              }
+
+
+class ScanExportWriter:
+    """append parsed scans, and their peak tables, to a chunked and compressed columnar export keyed by
+    scan id (see read_export):
+        parquet: dataset folder, one 'scans' and one 'peaks' sub folder partitioned by anode, zstd
+                 compressed files with row groups of chunk_size rows
+        hdf5:    .h5 file, one group per table with gzip compressed datasets of chunk_size rows and a
+                 catalogue of the anode, sample, rows and 2theta range of every scan
+
+    Rows are buffered and written once buffer_rows are pending (and on flush or close), so that a batch
+    of small scans does not write one file per scan"""
+
+    def __init__(self, path=None, export_format=None, chunk_size=2 ** 16, buffer_rows=2 ** 20):
+        if path is None:
+            raise AttributeError("path can not be none!")
+
+        self.path = path
+        self.export_format = export_format_of(path, export_format)
+        self.chunk_size = chunk_size
+        self.buffer_rows = buffer_rows
+        self._pending = {_table: [] for _table in export_tables}
+        self._pending_rows = 0
+
+        # fail now rather than after parsing the scans
+        if self.export_format == 'parquet':
+            _import_pyarrow()
+        else:
+            _import_h5py()
+
+    def add_scan(self, metadata=None, scan_id=None, peaks=None):
+        """add the scan (and its peaks) to the export"""
+        for _table, _record in export_records(metadata, scan_id=scan_id, peaks=peaks).items():
+            self._pending[_table].append(_record)
+            self._pending_rows += len(_record['two_theta'])
+
+        if self._pending_rows >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """write the pending rows"""
+        for _table in export_tables:
+            if self._pending[_table]:
+                _appenders[self.export_format](self.path, _table, self._pending[_table], self.chunk_size)
+                self._pending[_table] = []
+        self._pending_rows = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _as_list(value=None):
+    if (value is None) or isinstance(value, (list, tuple, np.ndarray)):
+        return value
+    return [value]
+
+
+def _read_parquet(path=None, table='scans', anode=None, sample=None, scan_id=None, two_theta_range=None,
+                  columns=None):
+    pyarrow, dataset = _import_pyarrow()
+    data = dataset.dataset(os.path.join(path, table), format='parquet', partitioning='hive')
+
+    # filters pushed down to the partitions (anode) and to the row group statistics
+    expressions = []
+    for _key, _values in (('anode', anode), ('sample', sample), ('scan_id', scan_id)):
+        if _values is not None:
+            _expression = dataset.field(_key).isin(pyarrow.array([_value for _value in _values if _value is not None],
+                                                                 type=pyarrow.string()))
+            if None in _values:
+                _expression = _expression | dataset.field(_key).is_null()
+            expressions.append(_expression)
+    if two_theta_range is not None:
+        expressions.append((dataset.field('two_theta') >= two_theta_range[0]) &
+                           (dataset.field('two_theta') <= two_theta_range[1]))
+
+    expression = None
+    for _expression in expressions:
+        expression = _expression if expression is None else expression & _expression
+
+    result = data.to_table(columns=columns, filter=expression)
+    return {_key: result[_key].to_numpy(zero_copy_only=False) for _key in columns}
+
+
+def _read_hdf5(path=None, table='scans', anode=None, sample=None, scan_id=None, two_theta_range=None,
+               columns=None):
+    h5py = _import_h5py()
+    result = {_key: [] for _key in columns}
+    with h5py.File(path, 'r') as f:
+        group = f[table]
+        catalogue = {_key: group['catalogue'][_key].asstr()[:] if _key in scan_columns
+                     else group['catalogue'][_key][:]
+                     for _key in group['catalogue'].keys()}
+        catalogue['anode'] = np.array([_value or None for _value in catalogue['anode']], dtype=object)
+
+        selected = np.ones(len(catalogue['first']), dtype=bool)
+        for _key, _values in (('anode', anode), ('sample', sample), ('scan_id', scan_id)):
+            if _values is not None:
+                selected &= np.isin(catalogue[_key], np.array(_values, dtype=object))
+        if two_theta_range is not None:
+            selected &= (catalogue['two_theta_max'] >= two_theta_range[0]) & \
+                        (catalogue['two_theta_min'] <= two_theta_range[1])
+
+        # only the rows of the selected scans (within the 2theta range) are read
+        for _scan in np.nonzero(selected)[0]:
+            first, last = int(catalogue['first'][_scan]), int(catalogue['last'][_scan])
+            inside = np.ones(last - first, dtype=bool)
+            if two_theta_range is not None:
+                two_theta = group['two_theta'][first:last]
+                inside = (two_theta >= two_theta_range[0]) & (two_theta <= two_theta_range[1])
+                rows = np.nonzero(inside)[0]
+                if not len(rows):
+                    continue
+                inside = inside[rows[0]:rows[-1] + 1]
+                first, last = first + int(rows[0]), first + int(rows[-1]) + 1
+
+            for _key in columns:
+                if _key in scan_columns:
+                    result[_key].append(np.repeat(np.array([catalogue[_key][_scan]], dtype=object),
+                                                  np.count_nonzero(inside)))
+                else:
+                    result[_key].append(group[_key][first:last][inside])
+
+    return {_key: np.concatenate(_values) if _values else
+            np.zeros(0, dtype=object if _key in scan_columns else np.float64)
+            for _key, _values in result.items()}
+
+
+_readers = {'parquet': _read_parquet,
+            'hdf5': _read_hdf5,
+            }
+
+
+def read_export(path=None, table='scans', anode=None, sample=None, scan_id=None, two_theta_range=None,
+                columns=None, export_format=None):
+    """rows of the 'scans' or 'peaks' table of an export (see ScanExportWriter) matching all the filters:
+    anode, sample and scan_id (one value or a list, anode [None] for unmatched wavelengths) and
+    two_theta_range ((min, max) in degrees, included). Only the partitions, row groups or scans that can
+    match are read. Returns {column: array} (columns: all the scan_columns and point_columns by
+    default), ready for pandas.DataFrame or polars.DataFrame"""
+    if path is None:
+        raise AttributeError("path can not be none!")
+    if not os.path.exists(path):
+        raise ValueError("export does not exist!")
+    if table not in export_tables:
+        raise ValueError(f"table {table} is not supported!")
+
+    columns = columns or scan_columns + point_columns
+    return _readers[export_format_of(path, export_format)](path, table, anode=_as_list(anode),
+                                                          sample=_as_list(sample), scan_id=_as_list(scan_id),
+                                                          two_theta_range=two_theta_range, columns=columns)
@@ -0,0 +1,208 @@
+import json
+import time
+import threading
+import functools
+import tracemalloc
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+# PipelineStats currently recording (see instrument), nothing is measured when empty
+_recorders = []
+
+# stages opened by the current thread, innermost last
+_open_stages = threading.local()
+
+
+class _Stage:
+    """stage being measured: counters added while it is open"""
+
+    __slots__ = ('name', 'path', 'info', 'bytes_read', 'rows', 'start', 'memory_start', 'memory_peak')
+
+    def __init__(self, name=None, path=None, info=None):
+        self.name = name
+        self.path = path
+        self.info = info
+        self.bytes_read = 0
+        self.rows = 0
+        self.start = 0.
+        self.memory_start = 0
+        self.memory_peak = 0
+
+    def add(self, bytes_read=0, rows=0):
+        self.bytes_read += bytes_read
+        self.rows += rows
+
+
+class _NullStage:
+    """stage returned when nothing is recording"""
+
+    def add(self, bytes_read=0, rows=0):
+        pass
+
+
+_null_stage = _NullStage()
+
+
+def _stage_stack():
+    if not hasattr(_open_stages, 'stack'):
+        _open_stages.stack = []
+    return _open_stages.stack
+
+
+class PipelineStats(Mapping):
+    """per stage totals of an instrument() block: stats[path] is a dictionary of 'calls', 'wall_time' (s),
+    'bytes_read', 'rows' and 'allocated' (peak bytes allocated by the stage, when allocations are tracked).
+    The path of a stage is the names of the stages it is nested in, ex: 'xrd_file_parser/ras_file_parser/data'.
+
+    Every measured stage is also kept in events and, with log_file (file name or open file), written
+    as one JSON line when it ends"""
+
+    def __init__(self, log_file=None, track_allocations=False):
+        self.track_allocations = track_allocations
+        self.stages = {}
+        self.events = []
+
+        self._log = None
+        self._close_log = False
+        if log_file is not None:
+            if hasattr(log_file, 'write'):
+                self._log = log_file
+            else:
+                self._log = open(log_file, 'a')
+                self._close_log = True
+
+    def record(self, event=None):
+        self.events.append(event)
+        totals = self.stages.setdefault(event['path'], {'calls': 0,
+                                                        'wall_time': 0.,
+                                                        'bytes_read': 0,
+                                                        'rows': 0,
+                                                        'allocated': None,
+                                                        })
+        totals['calls'] += 1
+        totals['wall_time'] += event['wall_time']
+        totals['bytes_read'] += event['bytes_read']
+        totals['rows'] += event['rows']
+        if event['allocated'] is not None:
+            totals['allocated'] = max(totals['allocated'] or 0, event['allocated'])
+
+        if self._log is not None:
+            self._log.write(json.dumps(event) + "\n")
+            self._log.flush()
+
+    def close(self):
+        if self._close_log:
+            self._log.close()
+        self._log = None
+
+    def __getitem__(self, path):
+        return self.stages[path]
+
+    def __iter__(self):
+        return iter(self.stages)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def summary(self):
+        """one line per stage: calls, wall time, bytes read, rows and allocated bytes"""
+        lines = ["{:<50} {:>6} {:>12} {:>12} {:>10} {:>12}".format('stage', 'calls', 'time (ms)', 'bytes read',
+                                                                   'rows', 'allocated')]
+        for _path, _totals in self.stages.items():
+            lines.append("{:<50} {:>6} {:>12.3f} {:>12} {:>10} {:>12}".format(_path,
+                                                                            _totals['calls'],
+                                                                            1e3 * _totals['wall_time'],
+                                                                            _totals['bytes_read'],
+                                                                            _totals['rows'],
+                                                                            str(_totals['allocated'])))
+        return "\n".join(lines)
+
+
+@contextmanager
+def instrument(log_file=None, track_allocations=False):
+    """record the stages run inside the block (in this process) and yield their PipelineStats.
+    track_allocations measures the peak memory allocated by each stage with tracemalloc (slower)"""
+    stats = PipelineStats(log_file=log_file, track_allocations=track_allocations)
+    start_tracing = track_allocations and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+
+    _recorders.append(stats)
+    try:
+        yield stats
+    finally:
+        _recorders.remove(stats)
+        if start_tracing:
+            tracemalloc.stop()
+        stats.close()
+
+
+@contextmanager
+def stage(name=None, **info):
+    """measure the block as the stage name (nested in the stages already open). The yielded stage
+    counts the bytes read and rows parsed (stage.add). info (ex: file_name) is added to its event"""
+    if not _recorders:
+        yield _null_stage
+        return
+
+    stack = _stage_stack()
+    path = "/".join([_stage.name for _stage in stack] + [name])
+    current = _Stage(name=name, path=path, info=info)
+    track_allocations = tracemalloc.is_tracing() and any(_stats.track_allocations for _stats in _recorders)
+    if track_allocations:
+        current.memory_start = current.memory_peak = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    stack.append(current)
+    current.start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        wall_time = time.perf_counter() - current.start
+        stack.pop()
+
+        allocated = None
+        if track_allocations and tracemalloc.is_tracing():
+            # the peak counter was reset by the nested stages, their peaks are kept in memory_peak
+            peak = max(tracemalloc.get_traced_memory()[1], current.memory_peak)
+            allocated = max(peak - current.memory_start, 0)
+            if stack:
+                stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+
+        event = {'stage': name,
+                 'path': path,
+                 'time': time.time(),
+                 'wall_time': wall_time,
+                 'bytes_read': current.bytes_read,
+                 'rows': current.rows,
+                 'allocated': allocated,
+                 }
+        event.update(info)
+        for _stats in list(_recorders):
+            _stats.record(event)
+
+
+def add_counters(bytes_read=0, rows=0):
+    """add bytes read and rows parsed to the innermost open stage (nothing when not recording)"""
+    if _recorders:
+        stack = _stage_stack()
+        if stack:
+            stack[-1].add(bytes_read=bytes_read, rows=rows)
+
+
+def instrumented(name=None):
+    """decorator measuring every call of the function as a stage (function name by default). The
+    function is called directly when nothing is recording"""
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _recorders:
+                return function(*args, **kwargs)
+            with stage(stage_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,109 @@
+import numpy as np
+
+try:
+    from .scan_axis import UniformAxis
+    from .xrd_file_parser import _scan_arrays
+except ImportError:
+    from scan_axis import UniformAxis
+    from xrd_file_parser import _scan_arrays
+
+# intensity of the Kalpha2 line relative to Kalpha1
+kalpha2_ratio = 0.5
+
+
+def kalpha2_offset(two_theta=None, alpha1=None, alpha2=None, units='deg'):
+    """shift between the Kalpha2 and Kalpha1 reflections measured at two_theta (Kalpha2 2theta minus the
+    2theta of the Kalpha1 reflection from the same planes), for every point at once"""
+    if (two_theta is None) or (alpha1 is None) or (alpha2 is None):
+        raise AttributeError("two_theta, alpha1 and alpha2 can not be none!")
+
+    if units == 'deg':
+        scale = np.pi / 360.
+    else:
+        scale = 0.5
+
+    two_theta = np.asarray(two_theta, dtype=np.float64)
+    sin_theta1 = np.sin(two_theta * scale) * (float(alpha1) / float(alpha2))
+    return two_theta - np.arcsin(sin_theta1) / scale
+
+
+def _source_points(xaxis=None, offset=None):
+    """left index and weight of the linear interpolation of the scan at xaxis - offset. -1 where the
+    source point is before the first point of the scan"""
+    source = np.asarray(xaxis, dtype=np.float64) - offset
+    if isinstance(xaxis, UniformAxis):
+        position = (source - xaxis.start) / xaxis.step
+    else:
+        values = np.asarray(xaxis, dtype=np.float64)
+        right = np.clip(np.searchsorted(values, source, side='right'), 1, len(values) - 1)
+        position = right - 1 + (source - values[right - 1]) / (values[right] - values[right - 1])
+
+    valid = np.isfinite(position) & (position >= 0)
+    position = np.where(valid, position, 0.)
+    left = np.minimum(np.floor(position).astype(np.int64), len(xaxis) - 2)
+    weight = position - left
+    left[~valid] = -1
+    return left, weight
+
+
+def kalpha2_shift_matrix(xaxis=None, alpha1=None, alpha2=None, ratio=kalpha2_ratio):
+    """sparse (points x points) matrix of the Kalpha2 contribution: -ratio times the linear interpolation
+    of the scan at 2theta - offset(2theta), two entries per point (none before the first Kalpha1 point)"""
+    import scipy.sparse
+
+    left, weight = _source_points(xaxis, kalpha2_offset(xaxis, alpha1, alpha2))
+    has_source = left >= 0
+    rows = np.nonzero(has_source)[0]
+    left, weight = left[has_source], weight[has_source]
+
+    values = np.concatenate(((1. - weight) * -ratio, weight * -ratio))
+    return scipy.sparse.csr_matrix((values, (np.concatenate((rows, rows)), np.concatenate((left, left + 1)))),
+                                   shape=(len(xaxis), len(xaxis)))
+
+
+def strip_kalpha2(xaxis=None, yaxis=None, alpha1=None, alpha2=None, ratio=kalpha2_ratio, tolerance=1e-6,
+                  out=None):
+    """remove the Kalpha2 contribution of a scan or of a 2D stack (scans x points) sharing xaxis (2theta in
+    degrees, increasing, uniform or not), with the Rachinger correction
+        I1(2theta) = I(2theta) - ratio * I1(2theta - offset(2theta))
+
+    The offsets and their interpolation weights are computed once for the whole axis (kalpha2_shift_matrix,
+    M). The recursion is solved by the series I1 = sum_k M^k I, each term being one sparse product over all
+    the points and scans, until ratio^k < tolerance. The result is written into out when provided"""
+    if (xaxis is None) or (yaxis is None):
+        raise AttributeError("xaxis and yaxis can not be none!")
+
+    yaxis = np.asarray(yaxis, dtype=np.float64)
+    stripped = np.array(yaxis) if out is None else out
+    if out is not None:
+        np.copyto(out, yaxis)
+    if len(xaxis) < 2:
+        return stripped
+
+    shift = kalpha2_shift_matrix(xaxis, alpha1, alpha2, ratio=ratio)
+    n_terms = max(int(np.ceil(np.log(tolerance) / np.log(ratio))), 1) if 0 < ratio < 1 else 1
+
+    # points along the first axis for the sparse products
+    term = yaxis.reshape(-1, yaxis.shape[-1]).T
+    stripped_columns = stripped.reshape(-1, yaxis.shape[-1]).T
+    for _ in range(n_terms):
+        term = shift @ term
+        stripped_columns += term
+
+    # reshape copies a non contiguous out
+    if not np.shares_memory(stripped_columns, stripped):
+        stripped[...] = stripped_columns.T.reshape(stripped.shape)
+    return stripped
+
+
+def strip_kalpha2_scan(metadata=None, ratio=kalpha2_ratio, tolerance=1e-6):
+    """Kalpha1 intensity of a scan returned by xrd_file_parser (or an XrdScan), using the alpha1 and
+    alpha2 wavelengths of its header"""
+    if metadata is None:
+        raise AttributeError("metadata can not be none!")
+    if (metadata.get('alpha1') is None) or (metadata.get('alpha2') is None):
+        raise AttributeError("alpha1 and alpha2 can not be none!")
+
+    two_theta, intensity = _scan_arrays(metadata)
+    return strip_kalpha2(xaxis=two_theta, yaxis=intensity, alpha1=metadata['alpha1'],
+                         alpha2=metadata['alpha2'], ratio=ratio, tolerance=tolerance)
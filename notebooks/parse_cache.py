@@ -0,0 +1,234 @@
+import os
+import json
+import atexit
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+try:
+    from .xrd_file_parser import xrd_file_parser, parser_version
+    from .scan_axis import UniformAxis
+except ImportError:
+    from xrd_file_parser import xrd_file_parser, parser_version
+    from scan_axis import UniformAxis
+
+INDEX_FILE_NAME = "index.json"
+ENTRY_EXTENSION = ".npz"
+
+
+def file_hash(file_name, chunk_size=1 << 20):
+    """blake2b digest of the content of the file"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _flatten(value, arrays, path="data"):
+    """replace every numpy array of the metadata by a reference to its entry in arrays (arrays shared by
+    several keys, ex: the data of the first RAS segment, are stored once)"""
+    if isinstance(value, np.ndarray):
+        for _path, _array in arrays.items():
+            if _array is value:
+                return {'__array__': _path}
+        arrays[path] = value
+        return {'__array__': path}
+
+    if isinstance(value, UniformAxis):
+        return {'__axis__': [value.start, value.step, value.n, value.decimals]}
+
+    if isinstance(value, dict):
+        return {_key: _flatten(_value, arrays, "{}/{}".format(path, _key)) for _key, _value in value.items()}
+
+    if isinstance(value, list):
+        return [_flatten(_value, arrays, "{}/{}".format(path, _index)) for _index, _value in enumerate(value)]
+
+    return value
+
+
+def _unflatten(value, arrays):
+    if isinstance(value, dict):
+        if '__array__' in value:
+            return arrays[value['__array__']]
+        if '__axis__' in value:
+            return UniformAxis(*value['__axis__'])
+        return {_key: _unflatten(_value, arrays) for _key, _value in value.items()}
+
+    if isinstance(value, list):
+        return [_unflatten(_value, arrays) for _value in value]
+
+    return value
+
+
+class ParseCache:
+    """on-disk cache of the parsed XRD files.
+
+    Entries are .npz files named after the content hash of the file and the parser version. The
+    index remembers the size, mtime and hash of every file seen, so unchanged files are looked up
+    without being hashed again. It is written by flush (close, the end of a with block or the exit of
+    the interpreter), not at every new hash. When max_size (in bytes) is set, the least recently used
+    entries are evicted once the cache grows above it: the entries are listed from the folder once,
+    then followed in memory."""
+
+    def __init__(self, cache_folder=None, max_size=None):
+        if cache_folder is None:
+            raise AttributeError("Provide a cache_folder")
+
+        self.cache_folder = cache_folder
+        self.max_size = max_size
+        os.makedirs(cache_folder, exist_ok=True)
+
+        self.index_file_name = os.path.join(cache_folder, INDEX_FILE_NAME)
+        self.index = self._load_index()
+        self._index_changed = False
+
+        # entry file name: size, least recently used first, and their total
+        self._lru = None
+        self._lru_size = 0
+
+        atexit.register(self._flush_at_exit)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file_name):
+            return {}
+
+        try:
+            with open(self.index_file_name, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save_index(self):
+        tmp_file_name = "{}.{}.tmp".format(self.index_file_name, os.getpid())
+        with open(tmp_file_name, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file_name, self.index_file_name)
+        self._index_changed = False
+
+    def flush(self):
+        """write the index when new hashes were added to it"""
+        if self._index_changed:
+            self._save_index()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except OSError:
+            # the cache folder is gone
+            pass
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self._flush_at_exit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _content_hash(self, xrd_file_name):
+        """hash of the file, recomputed only when its size or mtime changed"""
+        xrd_file_name = os.path.abspath(xrd_file_name)
+        stat = os.stat(xrd_file_name)
+        entry = self.index.get(xrd_file_name)
+        if entry and (entry['size'] == stat.st_size) and (entry['mtime'] == stat.st_mtime_ns):
+            return entry['hash']
+
+        content_hash = file_hash(xrd_file_name)
+        self.index[xrd_file_name] = {'size': stat.st_size,
+                                     'mtime': stat.st_mtime_ns,
+                                     'hash': content_hash}
+        self._index_changed = True
+        return content_hash
+
+    def entry_file_name(self, xrd_file_name):
+        content_hash = self._content_hash(xrd_file_name)
+        return os.path.join(self.cache_folder,
+                            "{}-v{}{}".format(content_hash, parser_version, ENTRY_EXTENSION))
+
+    def load(self, entry_file_name):
+        with np.load(entry_file_name, allow_pickle=False) as entry:
+            arrays = {_key: entry[_key] for _key in entry.files if _key != '__metadata__'}
+            metadata = json.loads(str(entry['__metadata__']))
+
+        return _unflatten(metadata, arrays)
+
+    def store(self, entry_file_name, metadata):
+        arrays = {}
+        flat_metadata = _flatten(metadata, arrays)
+        tmp_file_name = "{}.{}.tmp{}".format(entry_file_name, os.getpid(), ENTRY_EXTENSION)
+        np.savez(tmp_file_name, __metadata__=np.array(json.dumps(flat_metadata)), **arrays)
+        os.replace(tmp_file_name, entry_file_name)
+
+        if (self._lru is None) and (self.max_size is not None):
+            self._load_lru()
+        if self._lru is not None:
+            self._lru_size -= self._lru.pop(entry_file_name, 0)
+            self._lru[entry_file_name] = os.path.getsize(entry_file_name)
+            self._lru_size += self._lru[entry_file_name]
+            self._evict_lru()
+
+    def parse(self, xrd_file_name):
+        """return the parsed file from the cache, parsing and storing it on a miss"""
+        entry_file_name = self.entry_file_name(xrd_file_name)
+        if os.path.exists(entry_file_name):
+            try:
+                metadata = self.load(entry_file_name)
+                os.utime(entry_file_name)
+                if (self._lru is not None) and (entry_file_name in self._lru):
+                    self._lru.move_to_end(entry_file_name)
+                return metadata
+            except (OSError, ValueError, KeyError):
+                pass
+
+        metadata = xrd_file_parser(xrd_file_name)
+        self.store(entry_file_name, metadata)
+        return metadata
+
+    def entries(self):
+        """list of (last used, size, file name) of the cache entries, least recently used first"""
+        entries = []
+        for _entry in os.scandir(self.cache_folder):
+            if _entry.name.endswith(ENTRY_EXTENSION) and ".tmp" not in _entry.name:
+                stat = _entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, _entry.path))
+
+        return sorted(entries)
+
+    def size(self):
+        return sum(_size for _, _size, _ in self.entries())
+
+    def _load_lru(self):
+        self._lru = OrderedDict((_entry_file_name, _size) for _, _size, _entry_file_name in self.entries())
+        self._lru_size = sum(self._lru.values())
+
+    def _evict_lru(self):
+        if self.max_size is None:
+            return
+
+        while (self._lru_size > self.max_size) and self._lru:
+            entry_file_name, size = self._lru.popitem(last=False)
+            try:
+                os.remove(entry_file_name)
+            except FileNotFoundError:
+                pass
+            self._lru_size -= size
+
+    def evict(self):
+        """remove the least recently used entries until the cache fits in max_size (the entries are listed
+        from the folder again, ex: when it is shared with other processes)"""
+        if self.max_size is None:
+            return
+
+        self._load_lru()
+        self._evict_lru()
+
+    def clear(self):
+        for _, _, _entry_file_name in self.entries():
+            os.remove(_entry_file_name)
+        self._lru = None
+        self.index = {}
+        self._save_index()
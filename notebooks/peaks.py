@@ -0,0 +1,344 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.signal
+
+try:
+    from .background import net_signal
+except ImportError:
+    from background import net_signal
+
+
+def _find_peaks_rows(stack=None, threshold=200, distance=200):
+    """CSR peaks (offsets, index, heights) of the rows of the stack"""
+    index = [scipy.signal.find_peaks(_row, distance=distance)[0] for _row in stack]
+
+    counts = np.array([len(_index) for _index in index], dtype=np.int64)
+    row = np.repeat(np.arange(len(stack)), counts)
+    index = np.concatenate(index) if index else np.zeros(0, dtype=np.int64)
+    heights = stack[row, index]
+
+    above_threshold = heights > threshold
+    row, index, heights = row[above_threshold], index[above_threshold], heights[above_threshold]
+
+    offsets = np.zeros(len(stack) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row, minlength=len(stack)), out=offsets[1:])
+    return offsets, index, heights
+
+
+def find_peaks_in_stack(xaxis=None, stack=None, threshold=200, distance=200, max_workers=1, rows_per_task=1024,
+                        background=None, background_half_width=20):
+    """find the peaks above threshold of every scan of a 2D stack (scans x points) sharing the same xaxis,
+    same rule as utilities.find_peaks_above_threshold (background included).
+
+    The peaks are returned in CSR layout: the peaks of scan i are at offsets[i]:offsets[i + 1] of 'index'
+    (position in the scan), 'xaxis' and 'yaxis'. With max_workers > 1 (None for all the cpus), the rows
+    are split in tasks of rows_per_task scans spread over a process pool"""
+    if (xaxis is None) or (stack is None):
+        raise AttributeError("xaxis and stack can not be none!")
+
+    stack = np.atleast_2d(np.asarray(stack))
+    if stack.shape[1] != len(xaxis):
+        raise ValueError("xaxis and stack do not have the same number of points!")
+    measured_stack = stack
+    stack = np.atleast_2d(net_signal(stack, background, half_width=background_half_width))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if (max_workers > 1) and (len(stack) > rows_per_task):
+        chunks = [stack[_start:_start + rows_per_task] for _start in range(0, len(stack), rows_per_task)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_find_peaks_rows,
+                                        chunks,
+                                        [threshold] * len(chunks),
+                                        [distance] * len(chunks)))
+
+        offsets = [np.zeros(1, dtype=np.int64)]
+        for _offsets, _, _ in results:
+            offsets.append(_offsets[1:] + offsets[-1][-1])
+        offsets = np.concatenate(offsets)
+        index = np.concatenate([_index for _, _index, _ in results])
+        heights = np.concatenate([_heights for _, _, _heights in results])
+
+    else:
+        offsets, index, heights = _find_peaks_rows(stack, threshold=threshold, distance=distance)
+
+    if background is not None:
+        heights = measured_stack[np.repeat(np.arange(len(stack)), np.diff(offsets)), index]
+
+    return {'offsets': offsets,
+            'index': index,
+            'xaxis': np.asarray(xaxis)[index],
+            'yaxis': heights,
+            }
+
+
+def peaks_of_scan(peaks=None, scan_index=0):
+    """peaks of one scan from the CSR result of find_peaks_in_stack"""
+    first, last = peaks['offsets'][scan_index], peaks['offsets'][scan_index + 1]
+    return {'index': peaks['index'][first:last],
+            'xaxis': peaks['xaxis'][first:last],
+            'yaxis': peaks['yaxis'][first:last],
+            }
+
+
+class StreamingPeakFinder:
+    """running peak list of a scan received block by block (ex: RasFileFollower.follow), same rule as
+    find_peaks_above_threshold on the full scan (equal heights closer than distance: the leftmost wins).
+
+    New local maxima become pending candidates and only the points after the last one are kept. A
+    candidate is confirmed once distance points have been received past it, or past the midpoint of a
+    plateau still open at the end of the block, and no higher pending candidate is closer than distance
+    (such a candidate will never be suppressed). Confirming a peak
+    drops the pending candidates closer than distance to it. Confirmed peaks above threshold are
+    returned by update."""
+
+    def __init__(self, threshold=200, distance=200):
+        self.threshold = threshold
+        self.distance = int(np.ceil(distance))
+
+        self.n_points = 0
+        self.window_start = 0
+        self.xaxis_window = np.zeros(0)
+        self.yaxis_window = np.zeros(0)
+        self.last_candidate = -1
+
+        self.pending_index = np.zeros(0, dtype=np.int64)
+        self.pending_xaxis = np.zeros(0)
+        self.pending_yaxis = np.zeros(0)
+
+        self.index = []
+        self.xaxis = []
+        self.yaxis = []
+
+    def _detect_candidates(self):
+        """move the new local maxima of the window to the pending candidates"""
+        window_peaks = scipy.signal.find_peaks(self.yaxis_window)[0]
+        window_peaks = window_peaks[window_peaks + self.window_start > self.last_candidate]
+        if len(window_peaks):
+            self.pending_index = np.concatenate((self.pending_index, window_peaks + self.window_start))
+            self.pending_xaxis = np.concatenate((self.pending_xaxis, self.xaxis_window[window_peaks]))
+            self.pending_yaxis = np.concatenate((self.pending_yaxis, self.yaxis_window[window_peaks]))
+            self.last_candidate = self.pending_index[-1]
+
+            keep_from = self.last_candidate - self.window_start
+            self.xaxis_window = self.xaxis_window[keep_from:]
+            self.yaxis_window = self.yaxis_window[keep_from:]
+            self.window_start = self.last_candidate
+
+    def _confirm(self, last_complete):
+        """confirm the pending candidates whose neighbourhood, up to last_complete, is fully known"""
+        new_peaks = {'index': [], 'xaxis': [], 'yaxis': []}
+        while len(self.pending_index):
+            index = self.pending_index
+            heights = self.pending_yaxis
+
+            close = np.abs(index[:, None] - index[None, :]) < self.distance
+            higher = (heights[None, :] > heights[:, None]) | ((heights[None, :] == heights[:, None]) &
+                                                              (index[None, :] < index[:, None]))
+            is_confirmed = ~np.any(close & higher, axis=1) & (index <= last_complete)
+            if not is_confirmed.any():
+                break
+
+            for _index, _xaxis, _yaxis in zip(index[is_confirmed],
+                                              self.pending_xaxis[is_confirmed],
+                                              heights[is_confirmed]):
+                if _yaxis > self.threshold:
+                    new_peaks['index'].append(_index)
+                    new_peaks['xaxis'].append(_xaxis)
+                    new_peaks['yaxis'].append(_yaxis)
+
+            dropped = np.any(close[:, is_confirmed], axis=1)
+            self.pending_index = index[~dropped]
+            self.pending_xaxis = self.pending_xaxis[~dropped]
+            self.pending_yaxis = heights[~dropped]
+
+        order = np.argsort(new_peaks['index'], kind='stable')
+        new_peaks = {_key: np.array(_value)[order] for _key, _value in new_peaks.items()}
+        self.index.extend(new_peaks['index'])
+        self.xaxis.extend(new_peaks['xaxis'])
+        self.yaxis.extend(new_peaks['yaxis'])
+        return new_peaks
+
+    def update(self, xaxis=None, yaxis=None):
+        """add a block of points and return the peaks confirmed by it"""
+        self.xaxis_window = np.concatenate((self.xaxis_window, np.asarray(xaxis, dtype=np.float64)))
+        self.yaxis_window = np.concatenate((self.yaxis_window, np.asarray(yaxis, dtype=np.float64)))
+        self.n_points += len(yaxis)
+
+        self._detect_candidates()
+        return self._confirm(self._first_undetected_peak() - self.distance)
+
+    def _first_undetected_peak(self):
+        """lowest index a peak not yet detected can have: the midpoint of the run of equal values ending the
+        window when that run rises (a plateau still open), the last point otherwise"""
+        last = self.n_points - 1
+        changes = np.nonzero(self.yaxis_window[1:] != self.yaxis_window[:-1])[0]
+        if not len(changes):
+            return last
+
+        run_start = changes[-1] + 1
+        if self.yaxis_window[run_start - 1] > self.yaxis_window[run_start]:
+            return last
+        return (self.window_start + run_start + last) // 2
+
+    def flush(self):
+        """the scan is complete: confirm all the remaining candidates"""
+        return self._confirm(self.n_points)
+
+    def peaks(self):
+        """all the peaks confirmed so far, sorted by position"""
+        order = np.argsort(self.index, kind='stable')
+        return {'index': np.array(self.index, dtype=np.int64)[order],
+                'xaxis': np.array(self.xaxis)[order],
+                'yaxis': np.array(self.yaxis)[order],
+                }
+
+
+def _profile_jacobian(xaxis=None, parameters=None, profile='pseudo_voigt'):
+    """model and jacobian (peaks x points x parameters) of the profiles at xaxis (peaks x points).
+    parameters are amplitude, center, fwhm, background and, for the pseudo-Voigt, eta"""
+    amplitude, center, fwhm, background = [parameters[:, _i, None] for _i in range(4)]
+    eta = parameters[:, 4, None] if profile == 'pseudo_voigt' else 0.
+
+    delta = xaxis - center
+    q = 4. * (delta / fwhm) ** 2
+    gauss = np.exp(-np.log(2.) * q)
+    lorentz = 1. / (1. + q)
+    shape = eta * lorentz + (1. - eta) * gauss
+
+    # derivatives of the shape with respect to q, then q with respect to center and fwhm
+    shape_q = -eta * lorentz ** 2 - (1. - eta) * np.log(2.) * gauss
+    jacobian = [shape,
+                amplitude * shape_q * (-8. * delta / fwhm ** 2),
+                amplitude * shape_q * (-2. * q / fwhm),
+                np.ones_like(shape)]
+    if profile == 'pseudo_voigt':
+        jacobian.append(amplitude * (lorentz - gauss))
+
+    return amplitude * shape + background, np.stack(jacobian, axis=-1)
+
+
+def refine_peaks(xaxis=None, yaxis=None, peaks=None, half_width=None, width_factor=3., profile='pseudo_voigt',
+                 max_iterations=50, tolerance=1e-10):
+    """fit a pseudo-Voigt (or 'gaussian') profile plus a flat background around every peak.
+
+    yaxis is a scan or a 2D stack (scans x points) and peaks the result of find_peaks_above_threshold,
+    peaks_of_scan or find_peaks_in_stack (CSR 'offsets' for a stack). Each peak is fitted over the points
+    closer to its maximum than width_factor times its own FWHM (measured at half prominence), or over the
+    2 * half_width + 1 points around it when half_width is given. All the fits are solved together with a
+    batched Levenberg-Marquardt (one small normal-equation system per peak, the jacobian being block
+    diagonal).
+
+    Returns 'center', 'fwhm', 'amplitude', 'background' (and 'eta' for the pseudo-Voigt), each with its
+    '_error' standard deviation, and 'converged'. center and center_error can be passed to
+    utilities.from_theta_to_d (two_theta_error)"""
+    if (xaxis is None) or (yaxis is None) or (peaks is None):
+        raise AttributeError("xaxis, yaxis and peaks can not be none!")
+    if profile not in ('pseudo_voigt', 'gaussian'):
+        raise ValueError(f"profile {profile} is not supported!")
+
+    xaxis = np.asarray(xaxis, dtype=np.float64)
+    stack = np.atleast_2d(np.asarray(yaxis, dtype=np.float64))
+    if 'index' in peaks:
+        index = np.asarray(peaks['index'], dtype=np.int64)
+    else:
+        index = np.searchsorted(xaxis, peaks['xaxis'])
+    if 'offsets' in peaks:
+        row = np.repeat(np.arange(len(stack)), np.diff(peaks['offsets']))
+    else:
+        row = np.zeros(len(index), dtype=np.int64)
+
+    # FWHM of every peak in points
+    widths = np.zeros(len(index))
+    for _row in np.unique(row):
+        in_row = row == _row
+        widths[in_row] = scipy.signal.peak_widths(stack[_row], index[in_row], rel_height=0.5)[0]
+    widths = np.maximum(widths, 2.)
+
+    # fitting windows sized after every peak, the points outside of the window or of the scan have a null weight
+    if half_width is None:
+        half_widths = np.ceil(width_factor * widths).astype(np.int64)
+    else:
+        half_widths = np.full(len(index), int(half_width))
+    max_half_width = int(half_widths.max()) if len(index) else 0
+    offsets = np.arange(-max_half_width, max_half_width + 1)
+    window = index[:, None] + offsets
+    weight = ((window >= 0) & (window < len(xaxis)) &
+              (np.abs(offsets) <= half_widths[:, None])).astype(np.float64)
+    window = np.clip(window, 0, len(xaxis) - 1)
+    x_window = xaxis[window]
+    y_window = stack[row[:, None], window]
+
+    step = np.abs(np.diff(xaxis)).min() if len(xaxis) > 1 else 1.
+    background = np.where(weight > 0, y_window, np.inf).min(axis=1)
+    amplitude = stack[row, index] - background
+    fwhm = widths * step
+    parameters = [amplitude, xaxis[index], fwhm, background]
+    if profile == 'pseudo_voigt':
+        parameters.append(np.full(len(index), 0.5))
+    parameters = np.stack(parameters, axis=1)
+    n_parameters = parameters.shape[1]
+
+    def _cost(_parameters):
+        _model, _jacobian = _profile_jacobian(x_window, _parameters, profile)
+        _residuals = (_model - y_window) * weight
+        return _residuals, _jacobian * weight[..., None], np.einsum('pw,pw->p', _residuals, _residuals)
+
+    residuals, jacobian, cost = _cost(parameters)
+    damping = np.full(len(index), 1e-3)
+    converged = np.zeros(len(index), dtype=bool)
+    diagonal = np.arange(n_parameters)
+    for _ in range(max_iterations):
+        if converged.all():
+            break
+
+        normal = np.einsum('pwk,pwl->pkl', jacobian, jacobian)
+        gradient = np.einsum('pwk,pw->pk', jacobian, residuals)
+        damped = normal.copy()
+        damped[:, diagonal, diagonal] *= 1. + damping[:, None]
+        damped[:, diagonal, diagonal] += 1e-12
+        if profile == 'pseudo_voigt':
+            # eta stays on its bound (0 or 1) while the cost decreases outwards
+            eta = parameters[:, 4]
+            frozen = ((eta <= 0.) & (gradient[:, 4] > 0.)) | ((eta >= 1.) & (gradient[:, 4] < 0.))
+            damped[frozen, 4, :] = 0.
+            damped[frozen, :, 4] = 0.
+            damped[frozen, 4, 4] = 1.
+            gradient[frozen, 4] = 0.
+        step_parameters = -np.linalg.solve(damped, gradient[..., None])[..., 0]
+        step_parameters[converged] = 0.
+
+        new_parameters = parameters + step_parameters
+        new_parameters[:, 2] = np.maximum(np.abs(new_parameters[:, 2]), step * 1e-3)
+        if profile == 'pseudo_voigt':
+            new_parameters[:, 4] = np.clip(new_parameters[:, 4], 0., 1.)
+        new_residuals, new_jacobian, new_cost = _cost(new_parameters)
+
+        # converged once the cost or the parameters stop changing, or no step decreases the cost anymore
+        better = new_cost < cost
+        small_step = np.all(np.abs(new_parameters - parameters) <= tolerance * (np.abs(parameters) + tolerance),
+                            axis=1)
+        converged |= better & ((cost - new_cost <= tolerance * cost) | small_step)
+        converged |= ~better & (damping >= 1e10)
+        parameters[better] = new_parameters[better]
+        residuals[better] = new_residuals[better]
+        jacobian[better] = new_jacobian[better]
+        cost[better] = new_cost[better]
+        damping = np.where(better, damping / 10., np.minimum(damping * 10., 1e10))
+
+    # covariance from the normal matrix scaled by the reduced chi square
+    normal = np.einsum('pwk,pwl->pkl', jacobian, jacobian)
+    normal[:, diagonal, diagonal] += 1e-12
+    degrees_of_freedom = np.maximum(weight.sum(axis=1) - n_parameters, 1)
+    covariance = np.linalg.inv(normal) * (cost / degrees_of_freedom)[:, None, None]
+    errors = np.sqrt(np.abs(covariance[:, diagonal, diagonal]))
+
+    names = ['amplitude', 'center', 'fwhm', 'background', 'eta'][:n_parameters]
+    refined = {}
+    for _i, _name in enumerate(names):
+        refined[_name] = parameters[:, _i]
+        refined[f"{_name}_error"] = errors[:, _i]
+    refined['converged'] = converged
+    if 'offsets' in peaks:
+        refined['offsets'] = peaks['offsets']
+    return refined
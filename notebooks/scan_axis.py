@@ -0,0 +1,148 @@
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+
+def _decimals(value):
+    """number of decimals written in the string value ('0.01' -> 2)"""
+    value = str(value).strip()
+    if "." not in value:
+        return 0
+    return len(value.split(".")[1])
+
+
+class UniformAxis(NDArrayOperatorsMixin):
+    """uniform 2theta axis stored as (start, step, n) that behaves like the float64 array
+    start + arange(n) * step.
+
+    When decimals is set, values are rounded to that many decimals, so they match exactly the
+    values parsed from the text files. Indexing with an integer returns a float, a slice returns a new
+    UniformAxis and any other index an array. searchsorted and index_range are O(1)."""
+
+    dtype = np.dtype(np.float64)
+    ndim = 1
+
+    def __init__(self, start=0., step=1., n=0, decimals=None):
+        if n < 0:
+            raise ValueError("n can not be negative!")
+
+        self.start = float(start)
+        self.step = float(step)
+        self.n = int(n)
+        self.decimals = decimals
+
+    @classmethod
+    def from_header(cls, start=None, step=None, n=0):
+        """build the axis from the start and step strings of a header"""
+        return cls(start=float(start),
+                   step=float(step),
+                   n=n,
+                   decimals=max(_decimals(start), _decimals(step)))
+
+    @classmethod
+    def from_array(cls, values=None, max_decimals=10):
+        """return the UniformAxis reproducing exactly values, or None if they are not uniformly spaced"""
+        values = np.asarray(values, dtype=np.float64)
+        if (values.ndim != 1) or (len(values) < 2):
+            return None
+
+        start = values[0]
+        step = (values[-1] - values[0]) / (len(values) - 1)
+        if not step > 0:
+            return None
+
+        for decimals in range(max_decimals + 1):
+            if (np.round(start, decimals) == start) and np.isclose(np.round(step, decimals), step, rtol=1e-9, atol=0):
+                step = np.round(step, decimals)
+                break
+        else:
+            decimals = None
+
+        axis = cls(start=start, step=step, n=len(values), decimals=decimals)
+        if np.array_equal(axis.values(np.arange(len(values))), values):
+            return axis
+        return None
+
+    def values(self, index=None):
+        """2theta values at the index (int or array of int)"""
+        values = self.start + np.asarray(index) * self.step
+        if self.decimals is not None:
+            values = np.round(values, self.decimals)
+        return values
+
+    @property
+    def stop(self):
+        """last value of the axis"""
+        return float(self.values(self.n - 1))
+
+    @property
+    def shape(self):
+        return (self.n,)
+
+    @property
+    def size(self):
+        return self.n
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values(np.arange(self.n)).astype(dtype or np.float64, copy=False)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(_input) if isinstance(_input, UniformAxis) else _input for _input in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            _range = range(self.n)[index]
+            if _range.step < 0:
+                return np.asarray(self)[index]
+            return UniformAxis(start=self.values(_range.start) if len(_range) else self.start,
+                               step=self.step * _range.step,
+                               n=len(_range),
+                               decimals=self.decimals)
+
+        if isinstance(index, (int, np.integer)):
+            if not -self.n <= index < self.n:
+                raise IndexError("index {} is out of bounds for axis of size {}".format(index, self.n))
+            return float(self.values(index % self.n))
+
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        if np.any((index < -self.n) | (index >= self.n)):
+            raise IndexError("index is out of bounds for axis of size {}".format(self.n))
+        return self.values(index % self.n if self.n else index)
+
+    def searchsorted(self, value=None, side='left'):
+        """index where value would be inserted to keep the axis sorted (same as np.searchsorted)"""
+        value = np.asarray(value, dtype=np.float64)
+        index = np.ceil((value - self.start) / self.step).astype(np.int64)
+        index = np.clip(index, 0, self.n)
+
+        # the division can be off by one around the grid values, fix it by comparing with the neighbours
+        previous = np.clip(index - 1, 0, max(self.n - 1, 0))
+        current = np.clip(index, 0, max(self.n - 1, 0))
+        if side == 'left':
+            index = np.where((index > 0) & (self.values(previous) >= value), index - 1, index)
+            index = np.where((index < self.n) & (self.values(current) < value), index + 1, index)
+        else:
+            index = np.where((index > 0) & (self.values(previous) > value), index - 1, index)
+            index = np.where((index < self.n) & (self.values(current) <= value), index + 1, index)
+        index = np.clip(index, 0, self.n)
+
+        if index.ndim == 0:
+            return int(index)
+        return index
+
+    def index_range(self, low=None, high=None):
+        """slice of the indices whose values are within [low, high]"""
+        first = 0 if low is None else self.searchsorted(low, side='left')
+        last = self.n if high is None else self.searchsorted(high, side='right')
+        return slice(first, max(first, last))
+
+    def __repr__(self):
+        return "UniformAxis(start={}, step={}, n={})".format(self.start, self.step, self.n)
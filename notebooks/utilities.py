@@ -1,5 +1,11 @@
 import numpy as np
-import scipy
+
+try:
+    from .background import net_signal
+    from .instrumentation import instrumented, add_counters
+except ImportError:
+    from background import net_signal
+    from instrumentation import instrumented, add_counters
 
 xrd_lambda_angstroms_dict = {'cu': {'average': 1.54184,
                                     'alpha1': 1.54056,
@@ -35,64 +41,215 @@ xrd_lambda_angstroms_dict = {'cu': {'average': 1.54184,
                             }
 
 
-def retrieve_anode_material(alpha1:float =None, alpha2:float =None, beta:float =None, tolerance_error=0.001) -> str:
-    """return the anode material from lookup table"""
-    
-    for material in xrd_lambda_angstroms_dict.keys():
+anode_wavelength_keys = ['alpha1', 'alpha2', 'beta']
+
+
+def _wavelength_array(value=None):
+    """wavelengths as a float array, missing values (None) become nan"""
+    if value is None:
+        return np.array([np.nan])
+
+    value = np.asarray(value, dtype=object)
+    return np.array([np.nan if _value is None else float(_value) for _value in value.ravel()], dtype=np.float64)
+
+
+class AnodeIndex:
+    """sorted index of the anode wavelengths used to classify whole batches of (alpha1, alpha2, beta)
+
+    For each wavelength the materials are sorted once, a searchsorted over [value - tolerance,
+    value + tolerance] then gives the candidate materials of every row. The table can be extended with
+    register."""
+
+    def __init__(self, table=None):
+        self.table = xrd_lambda_angstroms_dict if table is None else table
+        self.build()
+
+    def build(self):
+        self.materials = np.array(list(self.table.keys()), dtype=object)
+        self.sorted_wavelengths = {}
+        self.sorted_materials = {}
+        for _key in anode_wavelength_keys:
+            wavelengths = np.array([np.nan if self.table[_material].get(_key) is None else self.table[_material][_key]
+                                    for _material in self.materials], dtype=np.float64)
+            order = np.argsort(wavelengths, kind='stable')
+            self.sorted_wavelengths[_key] = wavelengths[order]
+            self.sorted_materials[_key] = order
+
+    def register(self, material=None, average=None, alpha1=None, alpha2=None, beta=None):
+        """add (or replace) an anode material and rebuild the index"""
+        self.table[material] = {'average': average,
+                                'alpha1': alpha1,
+                                'alpha2': alpha2,
+                                'beta': beta,
+                                }
+        self.build()
+
+    def classify(self, alpha1=None, alpha2=None, beta=None, tolerance_error=0.001):
+        """return, for each row, the anode material (None when unmatched), the number of matching
+        materials and the unmatched and ambiguous (more than one material) flags"""
+        wavelengths = {'alpha1': _wavelength_array(alpha1),
+                       'alpha2': _wavelength_array(alpha2),
+                       'beta': _wavelength_array(beta)}
+        n = max(len(_value) for _value in wavelengths.values())
+        for _key in anode_wavelength_keys:
+            wavelengths[_key] = np.broadcast_to(wavelengths[_key], (n,))
+
+        matches = np.ones((n, len(self.materials)), dtype=bool)
+        provided = np.zeros(n, dtype=bool)
+        rank = np.arange(len(self.materials))
+        for _key in anode_wavelength_keys:
+            value = wavelengths[_key]
+            is_provided = ~np.isnan(value)
+            provided |= is_provided
 
-        if (alpha1 is None) and (alpha2 is None):
+            first = np.searchsorted(self.sorted_wavelengths[_key], value - tolerance_error, side='left')
+            last = np.searchsorted(self.sorted_wavelengths[_key], value + tolerance_error, side='right')
+            in_window = (rank >= first[:, None]) & (rank < last[:, None])
 
-            if beta:
-                if np.abs(beta - xrd_lambda_angstroms_dict[material]['beta']) > tolerance_error:
-                    continue
-                else:
-                    return material
-            else:
-                continue
+            key_matches = np.empty_like(matches)
+            key_matches[:, self.sorted_materials[_key]] = in_window
+            matches &= key_matches | ~is_provided[:, None]
 
-        if alpha1:
-            if np.abs(alpha1 - xrd_lambda_angstroms_dict[material]['alpha1']) > tolerance_error:
-                continue
+        matches &= provided[:, None]
+        count = matches.sum(axis=1)
+        material = np.where(count > 0, self.materials[np.argmax(matches, axis=1)], None)
 
-        if alpha2:
-            if np.abs(alpha2 - xrd_lambda_angstroms_dict[material]['alpha2']) > tolerance_error:
-                continue
+        return {'material': material,
+                'count': count,
+                'unmatched': count == 0,
+                'ambiguous': count > 1,
+                }
 
-        if beta:
-            if np.abs(beta - xrd_lambda_angstroms_dict[material]['beta']) > tolerance_error:
-                continue
 
-        return material
+anode_index = AnodeIndex()
 
-    return None
 
+def register_anode_material(material=None, average=None, alpha1=None, alpha2=None, beta=None):
+    """add a custom anode material to the lookup table used by retrieve_anode_material"""
+    anode_index.register(material=material, average=average, alpha1=alpha1, alpha2=alpha2, beta=beta)
 
-def from_theta_to_d(two_theta=None, units='rad', xrd_lambda_angstroms=None):
-    """returns the d value of the twoTheta value of a given wavelength (xrd_lambda_angstroms)"""
+
+@instrumented()
+def retrieve_anode_materials(alpha1=None, alpha2=None, beta=None, tolerance_error=0.001):
+    """classify a batch of wavelengths (arrays, missing values as None or nan), see AnodeIndex.classify"""
+    return anode_index.classify(alpha1=alpha1, alpha2=alpha2, beta=beta, tolerance_error=tolerance_error)
+
+
+def retrieve_anode_material(alpha1:float =None, alpha2:float =None, beta:float =None, tolerance_error=0.001) -> str:
+    """return the anode material from lookup table"""
+    return anode_index.classify(alpha1=alpha1,
+                                alpha2=alpha2,
+                                beta=beta,
+                                tolerance_error=tolerance_error)['material'][0]
+
+
+@instrumented()
+def from_theta_to_d(two_theta=None, units='rad', xrd_lambda_angstroms=None, out=None, two_theta_error=None):
+    """returns the d value of the twoTheta value of a given wavelength (xrd_lambda_angstroms)
+
+    two_theta can be a 1D scan or a 2D stack (scans x points). When xrd_lambda_angstroms is an array
+    (ex: alpha1, alpha2 and average), its dimensions are prepended to the result by broadcasting.
+    The result is written into out when provided. With two_theta_error (same units as two_theta),
+    the propagated d uncertainty is returned as well: d, d_error"""
     if units == 'deg':
-        two_theta = np.array([np.deg2rad(_theta) for _theta in two_theta])
+        scale = np.pi / 360.
     else:
-        two_theta = np.array(two_theta)
+        scale = 0.5
+
+    two_theta = np.asarray(two_theta, dtype=np.float64)
+    xrd_lambda_angstroms = np.asarray(xrd_lambda_angstroms, dtype=np.float64)
+    add_counters(rows=two_theta.size)
+    if xrd_lambda_angstroms.ndim:
+        xrd_lambda_angstroms = xrd_lambda_angstroms.reshape(xrd_lambda_angstroms.shape + (1,) * two_theta.ndim)
+
+    sin_theta = np.multiply(two_theta, scale)
+    np.sin(sin_theta, out=sin_theta)
+    sin_theta *= 2
+    d = np.divide(xrd_lambda_angstroms, sin_theta, out=out)
+
+    if two_theta_error is None:
+        return d
 
-    d = xrd_lambda_angstroms / (2 * np.sin(two_theta / 2))
+    # sigma_d = d * sigma_theta / tan(theta), with sigma_theta = sigma_2theta / 2
+    theta_error = np.multiply(two_theta_error, scale)
+    d_error = np.abs(d * theta_error / np.tan(np.multiply(two_theta, scale)))
 
-    return d
+    return d, d_error
 
 
-def find_peaks_above_threshold(xaxis=None, yaxis=None, threshold=200, distance=200):
+@instrumented()
+def find_peaks_above_threshold(xaxis=None, yaxis=None, threshold=200, distance=200, background=None,
+                               background_half_width=20):
+    """peaks of yaxis higher than threshold. With background ('snip', 'rolling_ball' or a background
+    array), the peaks are found on the background subtracted scan and threshold applies to the net
+    heights, yaxis of the peaks staying the measured intensity"""
     if (xaxis is None) or (yaxis is None):
         raise AttributeError("xaxis and yaxis can not be none!")
 
-    peaks = scipy.signal.find_peaks(yaxis, distance=distance)
+    import scipy.signal
+
+    add_counters(rows=len(yaxis))
+    net_yaxis = net_signal(yaxis, background, half_width=background_half_width)
+    peaks = scipy.signal.find_peaks(net_yaxis, distance=distance)
 
     index_peaks = peaks[0]
     xaxis_peaks = xaxis[index_peaks]
     yaxis_peaks = yaxis[index_peaks]
 
-    yaxis_peaks_index_above_threshold = yaxis_peaks > threshold
+    yaxis_peaks_index_above_threshold = net_yaxis[index_peaks] > threshold
 
     xaxis_peaks_above_threshold = xaxis_peaks[yaxis_peaks_index_above_threshold]
     yaxis_peaks_above_threshold = yaxis_peaks[yaxis_peaks_index_above_threshold]
 
     return {'xaxis': xaxis_peaks_above_threshold,
             'yaxis': yaxis_peaks_above_threshold}
+
+
+class PeakTable:
+    """peaks of a scan detected once and sorted by height and by prominence, so that the peaks above
+    any threshold are found with a binary search and a slice (ex: interactive threshold slider)"""
+
+    def __init__(self, xaxis=None, yaxis=None, distance=200):
+        if (xaxis is None) or (yaxis is None):
+            raise AttributeError("xaxis and yaxis can not be none!")
+
+        import scipy.signal
+
+        yaxis = np.asarray(yaxis)
+        index_peaks = scipy.signal.find_peaks(yaxis, distance=distance)[0]
+        prominence = scipy.signal.peak_prominences(yaxis, index_peaks)[0]
+
+        # decreasing height, ties kept in 2theta order
+        order = np.argsort(-yaxis[index_peaks], kind='stable')
+        self.index = index_peaks[order]
+        self.xaxis = np.asarray(xaxis[self.index])
+        self.yaxis = yaxis[self.index]
+        self.prominence = prominence[order]
+
+        self._prominence_order = np.argsort(-self.prominence, kind='stable')
+
+        # increasing copies for the binary searches
+        self._increasing_height = self.yaxis[::-1].copy()
+        self._increasing_prominence = self.prominence[self._prominence_order][::-1].copy()
+
+    def __len__(self):
+        return len(self.index)
+
+    def above(self, threshold=200):
+        """peaks higher than threshold, sorted by decreasing height"""
+        last = len(self.yaxis) - np.searchsorted(self._increasing_height, threshold, side='right')
+        return {'xaxis': self.xaxis[:last],
+                'yaxis': self.yaxis[:last],
+                'index': self.index[:last],
+                'prominence': self.prominence[:last],
+                }
+
+    def above_prominence(self, prominence=0):
+        """peaks more prominent than prominence, sorted by decreasing prominence"""
+        last = len(self.prominence) - np.searchsorted(self._increasing_prominence, prominence, side='right')
+        selection = self._prominence_order[:last]
+        return {'xaxis': self.xaxis[selection],
+                'yaxis': self.yaxis[selection],
+                'index': self.index[selection],
+                'prominence': self.prominence[selection],
+                }
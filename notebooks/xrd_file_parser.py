@@ -1,8 +1,26 @@
 import os
 import re
-import pandas as pd
+import time
+import glob
+import mmap
+from io import BytesIO
+from functools import partial
+from itertools import islice
+from contextlib import contextmanager
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import warnings
 import numpy as np
-from io import StringIO
+
+try:
+    from .scan_axis import UniformAxis
+    from .instrumentation import instrumented, stage
+except ImportError:
+    from scan_axis import UniformAxis
+    from instrumentation import instrumented, stage
+
+# bump whenever the parsers change what they return, so cached parses are not reused
+parser_version = "4"
 
 xrd_patterns = {'ras': {'alpha1': r"\*HW_XG_WAVE_LENGTH_ALPHA1\s{1}\"(\d\.\d*)\"",
                         'alpha2': r"\*HW_XG_WAVE_LENGTH_ALPHA2\s{1}\"(\d\.\d*)\"",
@@ -10,8 +28,8 @@ xrd_patterns = {'ras': {'alpha1': r"\*HW_XG_WAVE_LENGTH_ALPHA1\s{1}\"(\d\.\d*)\"
                         },
                 'asc': {'alpha1': r"\*WAVE_LENGTH1\s*\=\s*(\d\.\d*)",
                         'alpha2': r"\*WAVE_LENGTH2\s*\=\s*(\d\.\d*)",
-                        '2theta': {'start': r"\*START\s*\=\s*(\d*)",
-                                   'stop': r"\*STOP\s*\=\s*(\d*)",
+                        '2theta': {'start': r"\*START\s*\=\s*(-?\d*\.?\d*)",
+                                   'stop': r"\*STOP\s*\=\s*(-?\d*\.?\d*)",
                                    'step': r"\*STEP\s*\=\s*(\d*\.\d*)"},
                         },
                 }
@@ -31,10 +49,47 @@ xrd_starts_with = {'ras': {'alpha1': "*HW_XG_WAVE_LENGTH_ALPHA1",
                    }
 
 
+# fixed layout of the binary "FI" files written by the Rigaku MiniFlex 300/600 (byte offsets)
+rigaku_raw_layout = {'magic': b"FI",
+                     'user': (0x54, 20),
+                     'sample': (0x68, 20),
+                     'instrument': (0xe4, 32),
+                     'target': (0x4d6, 8),
+                     'wavelengths': 0x4bc,  # alpha1, alpha2, beta (little endian float64)
+                     '2theta': 0xb92,  # start, stop, step (little endian float32)
+                     'full_scale': 0xba2,  # little endian float32
+                     'count': 0xc52,  # number of points (little endian uint32), intensities follow
+                     }
+
+# keyword that opens every header line ("*KEY value" in RAS, "*KEY = value" in ASC)
+header_line_pattern = re.compile(r"(\*[^\s=]+)\s*=?\s*(.*?)\s*$")
+
+
+def _build_dispatch_table(file_type):
+    """map each header keyword to the metadata key path and its precompiled pattern"""
+    dispatch_table = {}
+    for _key, _starts_with in xrd_starts_with[file_type].items():
+        if _key == 'data_start':
+            continue
+
+        if isinstance(_starts_with, dict):
+            for _sub_key, _sub_starts_with in _starts_with.items():
+                dispatch_table[_sub_starts_with] = ((_key, _sub_key),
+                                                    re.compile(xrd_patterns[file_type][_key][_sub_key]))
+        else:
+            dispatch_table[_starts_with] = ((_key,), re.compile(xrd_patterns[file_type][_key]))
+
+    return dispatch_table
+
+
+xrd_dispatch_tables = {_file_type: _build_dispatch_table(_file_type) for _file_type in xrd_patterns.keys()}
+
+
 class XrdFileType:
     ras = '.ras'
     asc = '.asc'
     txt = '.txt'
+    raw = '.raw'
 
 
 def file_content(file_name):
@@ -44,12 +99,21 @@ def file_content(file_name):
     return content
 
 
-def xrd_file_parser(xrd_file_name=None, xrd_file_content=None, xrd_file_type=XrdFileType.ras):
+@instrumented()
+def xrd_file_parser(xrd_file_name=None, xrd_file_content=None, xrd_file_type=XrdFileType.ras, cache=None,
+                    lazy=False):
+    """parse the file with the parser of its extension. Files (not content) are looked up first in the
+    optional cache (see parse_cache.ParseCache). Content can be the lines of the file or its raw bytes.
+    With lazy, only the header of the file is read and metadata['data'] is a LazyData handle decoding the
+    data block on first access"""
     if (xrd_file_name is None) and (xrd_file_content is None):
         return None
 
     if xrd_file_name:
         if os.path.exists(xrd_file_name):
+            if (cache is not None) and not lazy:
+                return cache.parse(xrd_file_name)
+
             name, extension = os.path.splitext(xrd_file_name)
         else:
             raise ValueError("XRD file does not exist!")
@@ -58,15 +122,120 @@ def xrd_file_parser(xrd_file_name=None, xrd_file_content=None, xrd_file_type=Xrd
         extension = xrd_file_type
 
     if extension == XrdFileType.ras:
-        return ras_file_parser(xrd_file_name, xrd_file_content)
+        return ras_file_parser(xrd_file_name, xrd_file_content, lazy=lazy)
     elif extension == XrdFileType.asc:
-        return asc_file_parser(xrd_file_name, xrd_file_content)
+        return asc_file_parser(xrd_file_name, xrd_file_content, lazy=lazy)
     elif extension == XrdFileType.txt:
-        return txt_file_parser(xrd_file_name, xrd_file_content)
+        return txt_file_parser(xrd_file_name, xrd_file_content, lazy=lazy)
+    elif extension == XrdFileType.raw:
+        return raw_file_parser(xrd_file_name, xrd_file_content, lazy=lazy)
 
     return None
 
 
+def _writable_file_buffer(file_name):
+    """read the file straight into a bytearray so that arrays viewing it stay writable without a copy"""
+    buffer = bytearray(os.path.getsize(file_name))
+    with open(file_name, 'rb') as f:
+        f.readinto(buffer)
+
+    return buffer
+
+
+def list_xrd_files(path=None, recursive=False):
+    """list the supported XRD files of a directory, or the files matching a glob pattern, sorted by name.
+    With recursive, the sub directories are listed too (and "**" matches any sub directory of a pattern)"""
+    if os.path.isdir(path):
+        if recursive:
+            file_names = [os.path.join(_folder, _name) for _folder, _, _names in os.walk(path) for _name in _names]
+        else:
+            file_names = [os.path.join(path, _name) for _name in os.listdir(path)]
+    else:
+        file_names = glob.glob(path, recursive=recursive)
+
+    extensions = [XrdFileType.ras, XrdFileType.asc, XrdFileType.txt, XrdFileType.raw]
+    return sorted(_name for _name in file_names
+                  if os.path.isfile(_name) and os.path.splitext(_name)[1] in extensions)
+
+
+def _scan_arrays(metadata):
+    """return the 2theta and intensity arrays of any parser output"""
+    if isinstance(metadata['data'], dict):
+        return metadata['data']['2theta'], metadata['data']['intensity']
+
+    return metadata['2theta']['axis'], metadata['data']
+
+
+def _batch_worker(xrd_file_name):
+    try:
+        return xrd_file_name, xrd_file_parser(xrd_file_name), None
+    except Exception as error:
+        return xrd_file_name, None, "{}: {}".format(type(error).__name__, error)
+
+
+def batch_file_parser(path=None, max_workers=None, max_pending=None):
+    """parse every XRD file of a directory (or glob pattern) over a process pool.
+
+    At most max_pending files (default 2 per worker) are queued at once. The scans are returned as
+    columns sharing the same index, sorted by file name. Files that fail to parse are reported in
+    'errors' ({file_name: message}) instead of aborting the batch. max_workers=1 parses in process."""
+    file_names = list_xrd_files(path)
+
+    scans = {'file_name': [],
+             'alpha1': [],
+             'alpha2': [],
+             'beta': [],
+             '2theta': [],
+             'intensity': [],
+             'header': [],
+             'errors': {},
+             }
+
+    results = {}
+    if max_workers == 1:
+        for _file_name in file_names:
+            _, results[_file_name], error = _batch_worker(_file_name)
+            if error:
+                scans['errors'][_file_name] = error
+
+    else:
+        max_workers = max_workers or os.cpu_count() or 1
+        max_pending = max_pending or 2 * max_workers
+        pending = set()
+        queue = iter(file_names)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                for _file_name in queue:
+                    pending.add(executor.submit(_batch_worker, _file_name))
+                    if len(pending) >= max_pending:
+                        break
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for _future in done:
+                    _file_name, results[_file_name], error = _future.result()
+                    if error:
+                        scans['errors'][_file_name] = error
+
+    for _file_name in file_names:
+        metadata = results.get(_file_name)
+        if metadata is None:
+            continue
+
+        two_theta, intensity = _scan_arrays(metadata)
+        scans['file_name'].append(_file_name)
+        scans['alpha1'].append(metadata.get('alpha1'))
+        scans['alpha2'].append(metadata.get('alpha2'))
+        scans['beta'].append(metadata.get('beta'))
+        scans['2theta'].append(two_theta)
+        scans['intensity'].append(intensity)
+        scans['header'].append(metadata.get('header'))
+
+    return scans
+
+
 def _pattern_match(pattern=None, line_starts_with=None, line=None):
     if line.startswith(line_starts_with):
         m = re.match(pattern, line)
@@ -75,8 +244,182 @@ def _pattern_match(pattern=None, line_starts_with=None, line=None):
     return None
 
 
-def asc_file_parser(xrd_file_name=None, xrd_file_content=None):
-    """retrieve the following metadata from the ASC file"""
+def _content_lines(xrd_file_name=None, xrd_file_content=None):
+    if xrd_file_name is None:
+        if xrd_file_content is None:
+            raise AttributeError("Provide either xrd_file_name or xrd_file_content")
+
+        if isinstance(xrd_file_content, str):
+            return xrd_file_content.splitlines(keepends=True)
+        if isinstance(xrd_file_content, (bytes, bytearray, memoryview)):
+            return bytes(xrd_file_content).decode('latin1').splitlines(keepends=True)
+        if isinstance(xrd_file_content, list):
+            return xrd_file_content
+        return list(xrd_file_content)
+
+    return file_content(xrd_file_name)
+
+
+def scan_header(content=None, file_type='ras', metadata=None):
+    """single pass over the header lines of a RAS or ASC file.
+
+    Every "*KEY value" pair is stored in metadata['header'] (repeated keys are collected in a list)
+    and the keys of xrd_patterns are filled in metadata using the dispatch table of precompiled
+    patterns. The scan stops after the data start keyword (and any "*" lines directly following it)
+    and the index of the first data row is returned."""
+    if metadata is None:
+        metadata = {}
+
+    dispatch_table = xrd_dispatch_tables[file_type]
+    data_start = xrd_starts_with[file_type]['data_start']
+    header = {}
+    metadata['header'] = header
+
+    data_started = False
+    _index = -1
+    for _index, line in enumerate(content):
+
+        if not line.startswith("*"):
+            if data_started:
+                return _index
+            continue
+
+        m = header_line_pattern.match(line)
+        if m is None:
+            continue
+
+        keyword, value = m.groups()
+        value = value.strip('"')
+        _key = keyword[1:]
+        if _key in header:
+            if not isinstance(header[_key], list):
+                header[_key] = [header[_key]]
+            header[_key].append(value)
+        else:
+            header[_key] = value
+
+        rule = dispatch_table.get(keyword)
+        if rule:
+            key_path, pattern = rule
+            match = pattern.match(line)
+            if match:
+                _metadata = metadata
+                for _sub_key in key_path[:-1]:
+                    _metadata = _metadata[_sub_key]
+                _metadata[key_path[-1]] = match.group(1)
+
+        if keyword == data_start:
+            data_started = True
+
+    return _index + 1
+
+
+class LazyData:
+    """handle on the data block of a file, read from data_offset (up to data_end, the end of the file by
+    default) and decoded the first time it is accessed. It can be indexed, iterated and converted like
+    the decoded data"""
+
+    def __init__(self, file_name=None, data_offset=0, decoder=None, data_end=None):
+        self.file_name = file_name
+        self.data_offset = data_offset
+        self.data_end = data_end
+        self.decoder = decoder
+        self._data = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def load(self):
+        if self._data is None:
+            with stage('data', file_name=self.file_name) as data_stage:
+                with open(self.file_name, 'rb') as f:
+                    f.seek(self.data_offset)
+                    data_end = os.fstat(f.fileno()).st_size
+                    if self.data_end is not None:
+                        data_end = min(data_end, self.data_end)
+                    buffer = bytearray(max(data_end - self.data_offset, 0))
+                    f.readinto(buffer)
+                self._data = self.decoder(buffer)
+                data_stage.add(bytes_read=len(buffer), rows=_n_rows(self._data))
+
+        return self._data
+
+    def keys(self):
+        return self.load().keys()
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __len__(self):
+        return len(self.load())
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.load(), dtype=dtype)
+
+    def __repr__(self):
+        return "LazyData(file_name={!r}, data_offset={}, data_end={}, loaded={})".format(self.file_name,
+                                                                                         self.data_offset,
+                                                                                         self.data_end,
+                                                                                         self.loaded)
+
+
+def _stream_lines(f, line_offsets):
+    """decode the lines of an open binary file one at a time, recording the byte offset where each
+    line starts"""
+    position = f.tell()
+    for line in f:
+        line_offsets.append(position)
+        position += len(line)
+        yield line.decode('latin1')
+
+
+def _read_header(f, file_type, metadata):
+    """scan the header of the open binary file and return the byte offset of its first data row"""
+    line_offsets = []
+    first_data_row = scan_header(content=_stream_lines(f, line_offsets), file_type=file_type, metadata=metadata)
+    metadata['data_first_line'] = first_data_row
+
+    if first_data_row < len(line_offsets):
+        return line_offsets[first_data_row]
+    return f.seek(0, os.SEEK_END)
+
+
+def _n_rows(data=None):
+    """number of points of decoded data"""
+    if isinstance(data, dict):
+        return len(data['intensity'])
+    return len(data)
+
+
+def _read_file_data(xrd_file_name=None, file_type='ras', metadata=None, decoder=None, lazy=False):
+    """read the header of the file then, unless lazy, decode its data block in the same pass"""
+    with open(xrd_file_name, 'rb') as f:
+        with stage('header', file_name=xrd_file_name) as header_stage:
+            data_offset = _read_header(f, file_type, metadata)
+            header_stage.add(bytes_read=data_offset, rows=metadata['data_first_line'])
+        metadata['data_offset'] = data_offset
+
+        if lazy:
+            metadata['data'] = LazyData(file_name=xrd_file_name, data_offset=data_offset, decoder=decoder)
+
+        else:
+            with stage('data', file_name=xrd_file_name) as data_stage:
+                f.seek(data_offset)
+                buffer = f.read()
+                metadata['data'] = decoder(buffer)
+                data_stage.add(bytes_read=len(buffer), rows=_n_rows(metadata['data']))
+
+    return metadata
+
+
+@instrumented()
+def asc_file_parser(xrd_file_name=None, xrd_file_content=None, lazy=False):
+    """retrieve the following metadata from the ASC file. With lazy, only the header is read and
+    metadata['data'] is a LazyData handle"""
     metadata = {'alpha1': None,
                 'alpha2': None,
                 '2theta': {'start': None,
@@ -85,127 +428,616 @@ def asc_file_parser(xrd_file_name=None, xrd_file_content=None):
                            },
                 'data': None,
                 'data_first_line': 0,
+                'data_offset': None,
                 }
     if xrd_file_name is None:
-        if xrd_file_content is None:
-            raise AttributeError("Provide either xrd_file_name or xrd_file_content")
+        content = _content_lines(xrd_file_name, xrd_file_content)
+        with stage('header') as header_stage:
+            first_data_row = scan_header(content=content, file_type='asc', metadata=metadata)
+            metadata['data_first_line'] = first_data_row
+            header_stage.add(rows=first_data_row)
 
-        else:
-            content = xrd_file_content
+        with stage('data') as data_stage:
+            last_data_row = first_data_row
+            while (last_data_row < len(content)) and not content[last_data_row].startswith("*"):
+                last_data_row += 1
+            metadata['data'] = decode_asc_counts("".join(content[first_data_row:last_data_row]).encode('latin1'))
+            data_stage.add(rows=len(metadata['data']))
 
     else:
-        content = file_content(xrd_file_name)
+        _read_file_data(xrd_file_name, 'asc', metadata, decode_asc_data, lazy)
 
-    first_data_row = 0
-    for line in content:
+    if lazy and xrd_file_name:
+        n = int(metadata['header'].get('COUNT', 0))
+    else:
+        n = len(metadata['data'])
+    metadata['2theta']['axis'] = two_theta_axis(metadata['2theta'], n)
 
-        for _key in ['alpha1', 'alpha2']:
-            match = _pattern_match(line=line,
-                                   pattern=xrd_patterns['asc'][_key],
-                                   line_starts_with=xrd_starts_with['asc'][_key])
+    return metadata
 
-            if match:
-                metadata[_key] = match
-                break
 
-        for _key in xrd_patterns['asc']['2theta'].keys():
+def two_theta_axis(two_theta=None, n=0):
+    """UniformAxis of the n points described by the start/stop/step strings of the header, warns when
+    the stop value does not match the number of points"""
+    if (two_theta['start'] is None) or (two_theta['step'] is None):
+        return None
 
-            match = _pattern_match(line=line,
-                                   pattern=xrd_patterns['asc']['2theta'][_key],
-                                   line_starts_with=xrd_starts_with['asc']['2theta'][_key])
-            if match:
-                metadata['2theta'][_key] = match
-                break
+    axis = UniformAxis.from_header(start=two_theta['start'], step=two_theta['step'], n=n)
+    if two_theta.get('stop') and (n > 0):
+        if np.abs(axis.stop - float(two_theta['stop'])) > np.abs(axis.step) / 2:
+            warnings.warn("2theta axis stops at {} but the header stop is {} ({} points)".format(axis.stop,
+                                                                                                 two_theta['stop'],
+                                                                                                 n))
+    return axis
 
-        first_data_row += 1
 
-        if line.startswith(xrd_starts_with['asc']['data_start']):
-            first_data_row += 1
-            metadata['data_first_line'] = first_data_row
-            break
+def _compact_two_theta(two_theta=None):
+    """uniformly spaced 2theta values are replaced by their UniformAxis"""
+    axis = UniformAxis.from_array(two_theta)
+    if axis is None:
+        return np.ascontiguousarray(two_theta)
+    return axis
+
+
+def decode_asc_counts(buffer=None, dtype=np.int64):
+    """decode the comma separated count block of an ASC file into a typed array"""
+    return np.fromstring(bytes(buffer).rstrip().replace(b"\n", b","), dtype=dtype, sep=",")
+
+
+def decode_asc_data(buffer=None):
+    """decode the data section of an ASC file up to its *END marker"""
+    data_end = buffer.find(b"*")
+    return decode_asc_counts(buffer[:data_end] if data_end != -1 else buffer)
+
+
+def decode_ras_rows(rows=None):
+    """decode the "2theta intensity error" rows of a RAS file, the *RAS_INT_END/*RAS_DATA_END footer
+    is skipped. No rows (ex: an aborted scan of a program) give empty arrays"""
+    data = np.loadtxt(rows, comments='*', ndmin=2) if len(rows) else np.zeros((0, 3))
+    if not data.size:
+        # only footer lines
+        data = np.zeros((0, 3))
+    return {'2theta': _compact_two_theta(data[:, 0]),
+            'intensity': np.ascontiguousarray(data[:, 1]),
+            'error': np.ascontiguousarray(data[:, 2])}
+
+
+def decode_ras_data(buffer=None):
+    """decode the data section of a RAS file, up to its *RAS_INT_END line (the next segments are ignored)"""
+    buffer = bytes(buffer)
+    data_end = _find_line(buffer, b"*")
+    if data_end != -1:
+        buffer = buffer[:data_end]
+    return decode_ras_rows(buffer.decode('latin1').splitlines() if buffer.strip() else [])
+
+
+class RasFileFollower:
+    """incremental reader of a RAS file that is still being written by the instrument.
 
-    # retrieve data
-    full_data = []
+    Each poll reads only the bytes appended since the previous poll and returns the new complete rows
+    ({'2theta', 'intensity', 'error'} arrays). The header is parsed (metadata) once the *RAS_INT_START
+    line is written and finished becomes True when the *RAS_INT_END line is reached."""
 
-    content = content[first_data_row:-3]
-    for _row in content:
-        _row_array = _row.split(",")
-        for _element in _row_array:
-            full_data.append(int(_element.strip()))
+    def __init__(self, xrd_file_name=None):
+        self.xrd_file_name = xrd_file_name
+        self.metadata = None
+        self.offset = 0
+        self.rows_read = 0
+        self.finished = False
 
-    metadata['data'] = np.transpose(full_data)
+    def _read_header(self, f):
+        metadata = {'alpha1': None,
+                    'alpha2': None,
+                    'beta': None,
+                    'data_first_line': 0,
+                    'data_offset': None,
+                    }
+        data_offset = _read_header(f, 'ras', metadata)
+        if xrd_starts_with['ras']['data_start'][1:] in metadata['header']:
+            metadata['data_offset'] = data_offset
+            self.metadata = metadata
+            self.offset = data_offset
 
+    def poll(self):
+        """return the rows appended since the last poll"""
+        rows = []
+        if not self.finished and os.path.exists(self.xrd_file_name):
+            with open(self.xrd_file_name, 'rb') as f:
+                if self.metadata is None:
+                    self._read_header(f)
+
+                if self.metadata is not None:
+                    f.seek(self.offset)
+                    buffer = f.read()
+
+                    # the last line may still be being written
+                    complete = buffer.rfind(b"\n") + 1
+                    for _line in buffer[:complete].decode('latin1').splitlines():
+                        if _line.startswith("*"):
+                            self.finished = True
+                            break
+                        if _line.strip():
+                            rows.append(_line)
+                    self.offset += complete
+
+        data = np.loadtxt(rows, ndmin=2) if rows else np.zeros((0, 3))
+        self.rows_read += len(data)
+        return {'2theta': data[:, 0],
+                'intensity': data[:, 1],
+                'error': data[:, 2]}
+
+    def follow(self, poll_interval=2., timeout=None):
+        """generator of the new rows of every poll until the end of the data (or timeout seconds without
+        new rows)"""
+        last_update = time.monotonic()
+        while not self.finished:
+            rows = self.poll()
+            if len(rows['2theta']):
+                last_update = time.monotonic()
+                yield rows
+            elif (timeout is not None) and (time.monotonic() - last_update > timeout):
+                return
+            elif not self.finished:
+                time.sleep(poll_interval)
+
+
+def _find_line(buffer=None, marker=None, start=0, end=None):
+    """offset of the first line of buffer[start:end] starting with marker, -1 when there is none"""
+    end = len(buffer) if end is None else end
+    position = buffer.find(marker, start, end)
+    while (position > 0) and (buffer[position - 1:position] != b"\n"):
+        position = buffer.find(marker, position + 1, end)
+    return position
+
+
+def _line_end(buffer=None, position=0):
+    """offset of the line following position"""
+    return (buffer.find(b"\n", position) + 1) or len(buffer)
+
+
+def _count_lines(buffer=None, start=0, end=0, chunk_size=1 << 24):
+    n_lines = 0
+    for _start in range(start, end, chunk_size):
+        n_lines += bytes(buffer[_start:min(_start + chunk_size, end)]).count(b"\n")
+    return n_lines
+
+
+def _ras_segment_header(buffer=None, position=0, n_lines=0, encoding='latin1', first=True):
+    """metadata (header values, data_first_line and data_offset) of the first segment found from position in
+    buffer, n_lines being the number of lines before position. The data and data_end are left to the caller.
+    Returns the segment (None when there is no other segment, a header only file is one segment) and its
+    number of header lines"""
+    int_start = _find_line(buffer, b"*RAS_INT_START", position)
+    if int_start == -1:
+        if not first:
+            return None, 0
+        data_offset = len(buffer)
+    else:
+        data_offset = _line_end(buffer, int_start)
+
+    header_offset = position
+    if not first:
+        header_start = _find_line(buffer, b"*RAS_HEADER_START", position, int_start)
+        if header_start != -1:
+            header_offset = header_start
+
+    segment = {'alpha1': None,
+               'alpha2': None,
+               'beta': None,
+               'data': None,
+               'data_first_line': 0,
+               'data_offset': data_offset,
+               'data_end': None,
+               }
+    content = bytes(buffer[header_offset:data_offset]).decode(encoding).splitlines(keepends=True)
+    n_lines += _count_lines(buffer, position, header_offset)
+    segment['data_first_line'] = n_lines + scan_header(content=content, file_type='ras', metadata=segment)
+    return segment, len(content)
+
+
+def _ras_next_segment(buffer=None, segment=None, encoding='latin1'):
+    """find the end of the data of segment (the end of buffer while it is still being written) then the
+    header of the segment following it. Returns the next segment (None when there is none) and its number
+    of header lines"""
+    data_end = _find_line(buffer, b"*RAS_INT_END", segment['data_offset'])
+    if data_end == -1:
+        segment['data_end'] = len(buffer)
+        return None, 0
+
+    segment['data_end'] = data_end
+    position = _line_end(buffer, data_end)
+    n_lines = segment['data_first_line'] + _count_lines(buffer, segment['data_offset'], position)
+    return _ras_segment_header(buffer, position, n_lines, encoding=encoding, first=False)
+
+
+def _ras_segments(buffer=None, encoding='latin1'):
+    """metadata (header values, data_first_line, data_offset and data_end) of every segment of the RAS
+    file in buffer, found in one pass, the data is left to the caller. Returns the segments and their
+    number of header lines"""
+    segment, header_lines = _ras_segment_header(buffer, encoding=encoding)
+    segments = [segment]
+    while True:
+        segment, n_header_lines = _ras_next_segment(buffer, segments[-1], encoding=encoding)
+        if segment is None:
+            return segments, header_lines
+        segments.append(segment)
+        header_lines += n_header_lines
+
+
+@contextmanager
+def _mapped_file(file_name=None):
+    """read only memory map of the file (empty bytes for an empty file)"""
+    with open(file_name, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield b""
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+class RasSegments(Sequence):
+    """segments of a RAS file parsed with lazy, found on demand. The parser only reads the header of the
+    first segment: looking up a later segment (indexing, iteration, len) scans, without decoding them,
+    the data rows of the segments before it. data_end stays None until the following segment is looked
+    up, the data of such a segment is then read up to the end of the file and cut at *RAS_INT_END"""
+
+    def __init__(self, file_name=None, first_segment=None):
+        self.file_name = file_name
+        self._segments = [first_segment]
+        self._complete = False
+
+    def _find_next(self):
+        """look up the segment following the last one found, False when there is none"""
+        if self._complete:
+            return False
+
+        last = self._segments[-1]
+        with stage('segments', file_name=self.file_name) as segments_stage:
+            with _mapped_file(self.file_name) as buffer:
+                segment, header_lines = _ras_next_segment(buffer, last)
+            last['data'].data_end = last['data_end']
+
+            scanned_end = last['data_end'] if segment is None else segment['data_offset']
+            segments_stage.add(bytes_read=scanned_end - last['data_offset'], rows=header_lines)
+
+        if segment is None:
+            self._complete = True
+            return False
+
+        segment['data'] = LazyData(file_name=self.file_name, data_offset=segment['data_offset'],
+                                   decoder=decode_ras_data)
+        self._segments.append(segment)
+        return True
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or (index < 0):
+            len(self)
+        else:
+            while (len(self._segments) <= index) and self._find_next():
+                pass
+        return self._segments[index]
+
+    def __len__(self):
+        while self._find_next():
+            pass
+        return len(self._segments)
+
+    def __iter__(self):
+        index = 0
+        while (index < len(self._segments)) or self._find_next():
+            yield self._segments[index]
+            index += 1
+
+    def __bool__(self):
+        # there is always a first segment, no need to look for the others
+        return True
+
+    def __repr__(self):
+        return "RasSegments(file_name={!r}, found={}, complete={})".format(self.file_name, len(self._segments),
+                                                                           self._complete)
+
+
+def _ras_metadata(segments=None):
+    """metadata of the first segment with the list of all the segments"""
+    metadata = dict(segments[0])
+    metadata['segments'] = segments
     return metadata
 
 
-def ras_file_parser(xrd_file_name=None, xrd_file_content=None):
-    """retrieve the following metadata from the RAS file"""
+def _header_bytes(segments=None, file_size=0):
+    """bytes outside of the data blocks of the segments"""
+    return file_size - sum(_segment['data_end'] - _segment['data_offset'] for _segment in segments)
+
+
+@instrumented()
+def ras_file_parser(xrd_file_name=None, xrd_file_content=None, lazy=False):
+    """retrieve the following metadata from the RAS file.
+
+    Files holding several scans (segments: repeated *RAS_HEADER_START ... *RAS_INT_END blocks, ex:
+    temperature programs) are walked in one pass. metadata['segments'] lists the metadata of every
+    segment: its own header values, data and the byte offsets of its data (data_offset, data_end), so
+    that one segment can be read again directly. The other keys of metadata are the ones of the first
+    segment. With lazy, only the header of the first segment is read: metadata['segments'] is a
+    RasSegments finding the next segments on demand (which reads the data blocks before them) and the
+    data of every segment is a LazyData handle"""
+    if xrd_file_name is None:
+        if isinstance(xrd_file_content, (bytes, bytearray, memoryview)):
+            # raw bytes of the file
+            encoding = 'latin1'
+            buffer = xrd_file_content
+        else:
+            content = _content_lines(xrd_file_name, xrd_file_content)
+            encoding = 'utf-8'
+            buffer = "".join(_line if _line.endswith("\n") else _line + "\n" for _line in content).encode(encoding)
+        with stage('header') as header_stage:
+            segments, header_lines = _ras_segments(buffer, encoding=encoding)
+            header_stage.add(rows=header_lines)
+
+    elif lazy:
+        with stage('header', file_name=xrd_file_name) as header_stage:
+            with _mapped_file(xrd_file_name) as buffer:
+                segment, header_lines = _ras_segment_header(buffer)
+            header_stage.add(bytes_read=segment['data_offset'], rows=header_lines)
+
+        segment['data'] = LazyData(file_name=xrd_file_name, data_offset=segment['data_offset'],
+                                   decoder=decode_ras_data)
+        return _ras_metadata(RasSegments(xrd_file_name, segment))
+
+    else:
+        with stage('header', file_name=xrd_file_name) as header_stage:
+            buffer = _writable_file_buffer(xrd_file_name)
+            segments, header_lines = _ras_segments(buffer)
+            header_stage.add(bytes_read=_header_bytes(segments, len(buffer)), rows=header_lines)
+
+    with stage('data', file_name=xrd_file_name) as data_stage:
+        for _segment in segments:
+            _segment['data'] = decode_ras_data(memoryview(buffer)[_segment['data_offset']:_segment['data_end']])
+            data_stage.add(bytes_read=_segment['data_end'] - _segment['data_offset'],
+                           rows=_n_rows(_segment['data']))
+
+    return _ras_metadata(segments)
+
+
+def decode_txt_rows(source=None):
+    """decode the "2theta<TAB>intensity" rows of a TXT file (file name, open file or lines), the column
+    titles line is skipped"""
+    data = np.loadtxt(source, skiprows=1, delimiter='\t', usecols=(0, 1), ndmin=2, encoding='latin1')
+    return {'2theta': _compact_two_theta(data[:, 0]),
+            'intensity': np.ascontiguousarray(data[:, 1]),
+            }
+
+
+def decode_txt_data(buffer=None):
+    return decode_txt_rows(BytesIO(buffer))
+
+
+@instrumented()
+def txt_file_parser(xrd_file_name=None, xrd_file_content=None, lazy=False):
+    if xrd_file_name is None:
+        if xrd_file_content is None:
+            raise AttributeError("Provide either xrd_file_name or xrd_file_content")
+
+        with stage('data') as data_stage:
+            if isinstance(xrd_file_content, (bytes, bytearray, memoryview)):
+                data = decode_txt_data(xrd_file_content)
+            else:
+                data = decode_txt_rows(xrd_file_content)
+            data_stage.add(rows=_n_rows(data))
+
+    elif lazy:
+        return {'data': LazyData(file_name=xrd_file_name, data_offset=0, decoder=decode_txt_data)}
+
+    else:
+        with stage('data', file_name=xrd_file_name) as data_stage:
+            data = decode_txt_rows(xrd_file_name)
+            data_stage.add(bytes_read=os.path.getsize(xrd_file_name), rows=_n_rows(data))
+
+    return {'data': data}
+
+
+def _raw_string(buffer, offset, length):
+    return bytes(buffer[offset:offset + length]).split(b"\0")[0].decode('latin1')
+
+
+def _raw_value(value):
+    return np.format_float_positional(value, trim='-')
+
+
+def decode_raw_intensities(buffer=None, count=0):
+    return np.frombuffer(buffer, dtype='<f4', count=count)
+
+
+@instrumented()
+def raw_file_parser(xrd_file_name=None, xrd_file_content=None, lazy=False):
+    """retrieve the following metadata from the binary Rigaku RAW file. With lazy, only the fixed
+    header is read and metadata['data'] is a LazyData handle"""
     metadata = {'alpha1': None,
                 'alpha2': None,
                 'beta': None,
+                '2theta': {'start': None,
+                           'stop': None,
+                           'step': None,
+                           },
                 'data': None,
-                'data_first_line': 0,
+                'data_offset': 0,
                 }
+    data_offset = rigaku_raw_layout['count'] + 4
 
     if xrd_file_name is None:
         if xrd_file_content is None:
             raise AttributeError("Provide either xrd_file_name or xrd_file_content")
 
-        else:
-            content = xrd_file_content
+        buffer = xrd_file_content
+        file_size = len(buffer)
+
+    elif lazy:
+        with stage('read', file_name=xrd_file_name) as read_stage:
+            with open(xrd_file_name, 'rb') as f:
+                buffer = f.read(data_offset)
+            read_stage.add(bytes_read=len(buffer))
+        file_size = os.path.getsize(xrd_file_name)
 
     else:
-        content = file_content(xrd_file_name)
+        with stage('read', file_name=xrd_file_name) as read_stage:
+            buffer = _writable_file_buffer(xrd_file_name)
+            read_stage.add(bytes_read=len(buffer))
+        file_size = len(buffer)
 
-    for line in content:
+    if (len(buffer) < data_offset) or (bytes(buffer[:2]) != rigaku_raw_layout['magic']):
+        raise ValueError("Not a Rigaku RAW file (missing FI header)!")
 
-        for key in xrd_patterns['ras'].keys():
+    alpha1, alpha2, beta = np.frombuffer(buffer, dtype='<f8', count=3, offset=rigaku_raw_layout['wavelengths'])
+    metadata['alpha1'] = _raw_value(alpha1)
+    metadata['alpha2'] = _raw_value(alpha2)
+    metadata['beta'] = _raw_value(beta)
 
-            match = _pattern_match(line=line,
-                                   pattern=xrd_patterns['ras'][key],
-                                   line_starts_with=xrd_starts_with['ras'][key])
-            if match:
-                metadata[key] = match
-                break
+    start, stop, step = np.frombuffer(buffer, dtype='<f4', count=3, offset=rigaku_raw_layout['2theta'])
+    metadata['2theta'] = {'start': _raw_value(start),
+                          'stop': _raw_value(stop),
+                          'step': _raw_value(step),
+                          }
 
-        metadata['data_first_line'] += 1
+    full_scale = np.frombuffer(buffer, dtype='<f4', count=1, offset=rigaku_raw_layout['full_scale'])[0]
+    metadata['header'] = {'USER': _raw_string(buffer, *rigaku_raw_layout['user']),
+                          'SAMPLE': _raw_string(buffer, *rigaku_raw_layout['sample']),
+                          'INSTRUMENT': _raw_string(buffer, *rigaku_raw_layout['instrument']),
+                          'TARGET': _raw_string(buffer, *rigaku_raw_layout['target']),
+                          'FULL_SCALE': _raw_value(full_scale),
+                          }
 
-        if line.startswith(xrd_starts_with['ras']['data_start']):
-            break
+    count = int(np.frombuffer(buffer, dtype='<u4', count=1, offset=rigaku_raw_layout['count'])[0])
+    if file_size < data_offset + 4 * count:
+        raise ValueError("RAW file is truncated, expected {} points!".format(count))
 
-    # loading data now
-    if xrd_file_content:
-        data = pd.read_csv(StringIO("".join(content)),
-                           names=['2theta', 'intensity', 'error'],
-                           skiprows=metadata['data_first_line'],
-                           sep=" ",
-                           encoding='latin1')
+    metadata['data_offset'] = data_offset
+    if lazy and xrd_file_name:
+        metadata['data'] = LazyData(file_name=xrd_file_name,
+                                    data_offset=data_offset,
+                                    decoder=partial(decode_raw_intensities, count=count))
     else:
-        data = pd.read_csv(xrd_file_name,
-                           names=['2theta', 'intensity', 'error'],
-                           skiprows=metadata['data_first_line'],
-                           sep=" ",
-                           encoding='latin1')
-
-    data = data[:-2]
-    metadata['data'] = {'2theta': np.array(data['2theta']),
-                        'intensity': np.array(data['intensity']),
-                        'error': np.array(data['error'])}
+        with stage('data') as data_stage:
+            metadata['data'] = decode_raw_intensities(memoryview(buffer)[data_offset:], count=count)
+            data_stage.add(rows=count)
+    metadata['2theta']['axis'] = two_theta_axis(metadata['2theta'], count)
 
     return metadata
 
 
-def txt_file_parser(xrd_file_name=None, xrd_file_content=None):
-    if xrd_file_name is None:
-        if xrd_file_content is None:
-            raise AttributeError("Provide either xrd_file_name or xrd_file_content")
+def _line_blocks(f=None, lines_per_block=1):
+    """lists of at most lines_per_block lines (bytes) of the open binary file"""
+    while True:
+        lines = list(islice(f, lines_per_block))
+        if not lines:
+            return
+        yield lines
 
-        data = pd.read_csv(xrd_file_content, names=['2theta', 'intensity'], skiprows=1, sep='\t')
 
-    else:
-        data = pd.read_csv(xrd_file_name, names=['2theta', 'intensity'], skiprows=1, sep='\t')
+def _data_lines(lines=None):
+    """lines before the first "*" (end of data) line and whether that line was reached"""
+    for _index, _line in enumerate(lines):
+        if _line.startswith(b"*"):
+            return lines[:_index], True
+    return lines, False
 
-    return {'data': {'2theta': np.array(data['2theta']),
-                     'intensity': np.array(data['intensity']),
-                     },
-            }
+
+class ScanBlockReader:
+    """reader of the data of a RAS, ASC, TXT or RAW file in blocks of block_size points, holding at most
+    one block in memory whatever the length of the file.
+
+    The header is read when the reader is created (metadata, as returned by xrd_file_parser with lazy).
+    For RAS files holding several scans, segment is the index of the scan to read. Iterating yields
+    {'2theta', 'intensity'} arrays (and 'error' for RAS files) of block_size points, the last block may be
+    shorter. The blocks can be passed on to the block by block stages:
+    background.iter_background_blocks, peaks.StreamingPeakFinder.update or utilities.from_theta_to_d"""
+
+    def __init__(self, xrd_file_name=None, block_size=2 ** 16, segment=0):
+        if xrd_file_name is None:
+            raise AttributeError("xrd_file_name can not be none!")
+        if not os.path.exists(xrd_file_name):
+            raise ValueError("XRD file does not exist!")
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1!")
+
+        self.xrd_file_name = xrd_file_name
+        self.block_size = int(block_size)
+        self.extension = os.path.splitext(xrd_file_name)[1]
+        if self.extension not in (XrdFileType.ras, XrdFileType.asc, XrdFileType.txt, XrdFileType.raw):
+            raise ValueError("XRD file type {} is not supported!".format(self.extension))
+
+        self.metadata = xrd_file_parser(xrd_file_name, lazy=True)
+        if 'segments' in self.metadata:
+            self.data_offset = self.metadata['segments'][segment]['data_offset']
+        else:
+            self.data_offset = self.metadata['data'].data_offset
+
+    def __iter__(self):
+        with open(self.xrd_file_name, 'rb') as f:
+            f.seek(self.data_offset)
+            if self.extension == XrdFileType.ras:
+                yield from self._text_blocks(f, partial(np.loadtxt, ndmin=2, encoding='latin1'))
+            elif self.extension == XrdFileType.txt:
+                f.readline()
+                yield from self._text_blocks(f, partial(np.loadtxt, delimiter='\t', usecols=(0, 1), ndmin=2,
+                                                        encoding='latin1'))
+            elif self.extension == XrdFileType.asc:
+                yield from self._asc_blocks(f)
+            else:
+                yield from self._raw_blocks(f)
+
+    def _text_blocks(self, f, decoder):
+        """one row per line formats: block_size lines are decoded at once"""
+        for _lines in _line_blocks(f, self.block_size):
+            rows, data_end = _data_lines(_lines)
+            rows = [_row for _row in rows if _row.strip()]
+            if rows:
+                data = decoder(rows)
+                block = {'2theta': data[:, 0], 'intensity': data[:, 1]}
+                if data.shape[1] > 2:
+                    block['error'] = data[:, 2]
+                yield block
+            if data_end:
+                return
+
+    def _axis_blocks(self, intensities):
+        """2theta of the intensity blocks of the formats described by start and step in their header"""
+        two_theta = self.metadata['2theta']
+        axis = UniformAxis.from_header(start=two_theta['start'], step=two_theta['step'])
+        first = 0
+        for _intensity in intensities:
+            yield {'2theta': axis.values(np.arange(first, first + len(_intensity))),
+                   'intensity': _intensity,
+                   }
+            first += len(_intensity)
+
+    def _asc_blocks(self, f):
+        def _intensities():
+            pending = np.zeros(0, dtype=np.int64)
+            # the number of counts per line is not fixed, full blocks are cut from the counts decoded
+            for _lines in _line_blocks(f, max(1, self.block_size // 4)):
+                rows, data_end = _data_lines(_lines)
+                counts = b"".join(rows).strip()
+                if counts:
+                    pending = np.concatenate((pending, decode_asc_counts(counts)))
+                while len(pending) >= self.block_size:
+                    yield pending[:self.block_size]
+                    pending = pending[self.block_size:]
+                if data_end:
+                    break
+            if len(pending):
+                yield pending
+
+        return self._axis_blocks(_intensities())
+
+    def _raw_blocks(self, f):
+        def _intensities():
+            count = len(self.metadata['2theta']['axis'])
+            for _first in range(0, count, self.block_size):
+                yield np.fromfile(f, dtype='<f4', count=min(self.block_size, count - _first))
+
+        return self._axis_blocks(_intensities())
+
+
+def iter_scan_blocks(xrd_file_name=None, block_size=2 ** 16, segment=0):
+    """generator of the data of the file in blocks of block_size points (see ScanBlockReader)"""
+    yield from ScanBlockReader(xrd_file_name, block_size=block_size, segment=segment)
@@ -0,0 +1,165 @@
+import os
+from collections.abc import Mapping
+import numpy as np
+
+try:
+    from .xrd_file_parser import xrd_file_parser, XrdFileType
+    from .scan_axis import UniformAxis
+except ImportError:
+    from xrd_file_parser import xrd_file_parser, XrdFileType
+    from scan_axis import UniformAxis
+
+# header keys holding the sample name, by file type
+sample_header_keys = ['FILE_SAMPLE', 'SAMPLE']
+
+
+def sample_of(metadata=None):
+    """sample name written in the header of a parsed scan ('' when there is none)"""
+    header = metadata.get('header') or {}
+    for _key in sample_header_keys:
+        if _key in header:
+            return header[_key]
+    return ''
+
+
+def _float_or_none(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+class XrdScan(Mapping):
+    """typed record of a parsed XRD scan: float wavelengths, 2theta axis (UniformAxis or array) and
+    intensity/error arrays stored with dtype (float64 by default, float32 to halve the memory).
+
+    The scan can also be read like the dictionary returned by xrd_file_parser
+    (scan['alpha1'], scan['data']['intensity'], scan['2theta']['start'] ...) so existing code keeps
+    working."""
+
+    __slots__ = ('file_name', 'file_type', 'alpha1', 'alpha2', 'beta', 'sample',
+                 'two_theta', 'intensity', 'error', 'header', 'data_offset', 'data_first_line')
+
+    def __init__(self, two_theta=None, intensity=None, error=None, alpha1=None, alpha2=None, beta=None,
+                 sample=None, header=None, file_name=None, file_type=XrdFileType.ras, data_offset=None,
+                 data_first_line=None, dtype=np.float64):
+        self.file_name = file_name
+        self.file_type = file_type
+        self.alpha1 = _float_or_none(alpha1)
+        self.alpha2 = _float_or_none(alpha2)
+        self.beta = _float_or_none(beta)
+        self.sample = sample
+        self.header = header
+        self.data_offset = data_offset
+        self.data_first_line = data_first_line
+
+        self.intensity = np.asarray(intensity, dtype=dtype)
+        self.error = None if error is None else np.asarray(error, dtype=dtype)
+        if isinstance(two_theta, UniformAxis):
+            self.two_theta = two_theta
+        else:
+            self.two_theta = np.asarray(two_theta, dtype=dtype)
+
+        if len(self.two_theta) != len(self.intensity):
+            raise ValueError("2theta and intensity do not have the same length!")
+
+    @classmethod
+    def from_metadata(cls, metadata=None, file_name=None, file_type=XrdFileType.ras, dtype=np.float64,
+                      keep_header=True):
+        """build the scan from the dictionary returned by xrd_file_parser"""
+        data = metadata['data']
+        if file_type in [XrdFileType.ras, XrdFileType.txt]:
+            two_theta = data['2theta']
+            intensity = data['intensity']
+            error = data['error'] if 'error' in data.keys() else None
+        else:
+            two_theta = metadata['2theta']['axis']
+            intensity = data
+            error = None
+
+        header = metadata.get('header') or {}
+        sample = sample_of(metadata) or None
+
+        return cls(two_theta=two_theta,
+                   intensity=intensity,
+                   error=error,
+                   alpha1=metadata.get('alpha1'),
+                   alpha2=metadata.get('alpha2'),
+                   beta=metadata.get('beta'),
+                   sample=sample,
+                   header=header if keep_header else None,
+                   file_name=file_name,
+                   file_type=file_type,
+                   data_offset=metadata.get('data_offset'),
+                   data_first_line=metadata.get('data_first_line'),
+                   dtype=dtype)
+
+    @property
+    def nbytes(self):
+        """memory used by the intensity, error and 2theta arrays"""
+        nbytes = self.intensity.nbytes
+        if self.error is not None:
+            nbytes += self.error.nbytes
+        if isinstance(self.two_theta, np.ndarray):
+            nbytes += self.two_theta.nbytes
+        return nbytes
+
+    def _legacy_keys(self):
+        keys = ['alpha1', 'alpha2', 'beta', 'data', 'data_first_line', 'data_offset', 'header']
+        if self.file_type in [XrdFileType.asc, XrdFileType.raw]:
+            keys.insert(3, '2theta')
+        return keys
+
+    def _legacy_item(self, key):
+        if key == 'data':
+            if self.file_type in [XrdFileType.asc, XrdFileType.raw]:
+                return self.intensity
+            data = {'2theta': self.two_theta, 'intensity': self.intensity}
+            if self.error is not None:
+                data['error'] = self.error
+            return data
+
+        if key == '2theta':
+            return {'start': self.two_theta[0] if len(self.two_theta) else None,
+                    'stop': self.two_theta[-1] if len(self.two_theta) else None,
+                    'step': self.two_theta.step if isinstance(self.two_theta, UniformAxis) else None,
+                    'axis': self.two_theta}
+
+        return getattr(self, key)
+
+    def __getitem__(self, key):
+        if key not in self._legacy_keys():
+            raise KeyError(key)
+        return self._legacy_item(key)
+
+    def __iter__(self):
+        return iter(self._legacy_keys())
+
+    def __len__(self):
+        return len(self._legacy_keys())
+
+    def __repr__(self):
+        return "XrdScan(file_name={!r}, n={}, alpha1={}, alpha2={}, beta={})".format(self.file_name,
+                                                                                     len(self.intensity),
+                                                                                     self.alpha1,
+                                                                                     self.alpha2,
+                                                                                     self.beta)
+
+
+def load_xrd_scan(xrd_file_name=None, xrd_file_content=None, xrd_file_type=XrdFileType.ras, dtype=np.float64,
+                  keep_header=True, cache=None):
+    """parse the file with xrd_file_parser and return it as an XrdScan"""
+    metadata = xrd_file_parser(xrd_file_name=xrd_file_name,
+                               xrd_file_content=xrd_file_content,
+                               xrd_file_type=xrd_file_type,
+                               cache=cache)
+    if metadata is None:
+        return None
+
+    if xrd_file_name:
+        xrd_file_type = os.path.splitext(xrd_file_name)[1]
+
+    return XrdScan.from_metadata(metadata,
+                                 file_name=xrd_file_name,
+                                 file_type=xrd_file_type,
+                                 dtype=dtype,
+                                 keep_header=keep_header)
@@ -0,0 +1,4 @@
+import pytest
+
+# the ASC fixture holds the first 12 points of a scan whose header stops at 120 degrees
+truncated_asc_fixture = pytest.mark.filterwarnings("ignore:2theta axis stops at:UserWarning")
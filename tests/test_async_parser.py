@@ -0,0 +1,88 @@
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import asyncio
+import tempfile
+import numpy as np
+import pytest
+
+from notebooks.async_parser import async_xrd_file_parser, iter_parsed_files
+from notebooks.xrd_file_parser import xrd_file_parser, list_xrd_files, _scan_arrays
+from tests import truncated_asc_fixture
+
+
+async def _collect(path, **kwargs):
+    return [_result async for _result in iter_parsed_files(path, **kwargs)]
+
+
+class TestAsyncParser(TestCase):
+
+    def setUp(self):
+        self.data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+    def assert_same_scan(self, metadata, xrd_file_name):
+        expected = xrd_file_parser(xrd_file_name)
+        two_theta, intensity = _scan_arrays(metadata)
+        expected_two_theta, expected_intensity = _scan_arrays(expected)
+        assert np.array_equal(np.asarray(two_theta), np.asarray(expected_two_theta))
+        assert np.array_equal(intensity, expected_intensity)
+        assert metadata.get('alpha1') == expected.get('alpha1')
+        assert metadata.get('header') == expected.get('header')
+
+    @truncated_asc_fixture
+    def test_async_xrd_file_parser(self):
+        for _name in ["xrd_file.ras", "xrd_file.asc", "xrd_file_full.txt", "xrd_file.raw"]:
+            xrd_file_name = os.path.join(self.data_folder, _name)
+            metadata = asyncio.run(async_xrd_file_parser(xrd_file_name))
+            self.assert_same_scan(metadata, xrd_file_name)
+
+    @truncated_asc_fixture
+    def test_iter_parsed_files(self):
+        results = asyncio.run(_collect(self.data_folder, max_concurrency=2))
+        assert sorted(_result[0] for _result in results) == list_xrd_files(self.data_folder)
+        for _file_name, _metadata, _error in results:
+            assert _error is None
+            self.assert_same_scan(_metadata, _file_name)
+
+    @truncated_asc_fixture
+    def test_shared_executor(self):
+        file_names = list_xrd_files(self.data_folder)[:3]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = asyncio.run(_collect(file_names, max_concurrency=1, executor=executor))
+            # the executor is left open for the caller
+            assert executor.submit(len, file_names).result() == 3
+        assert [_result[0] for _result in results] == file_names
+
+    def test_errors_are_reported(self):
+        tmp_folder = tempfile.mkdtemp()
+        try:
+            shutil.copy(os.path.join(self.data_folder, "xrd_file.ras"), tmp_folder)
+            with open(os.path.join(tmp_folder, "broken.raw"), 'wb') as f:
+                f.write(b"not a raw file")
+            missing_file_name = os.path.join(tmp_folder, "missing.asc")
+
+            file_names = list_xrd_files(tmp_folder) + [missing_file_name]
+            results = {_result[0]: _result for _result in asyncio.run(_collect(file_names, max_workers=1))}
+            assert results[os.path.join(tmp_folder, "xrd_file.ras")][2] is None
+            assert results[os.path.join(tmp_folder, "broken.raw")][1] is None
+            assert results[os.path.join(tmp_folder, "broken.raw")][2].startswith("ValueError")
+            assert results[missing_file_name][2] == "ValueError: file does not exist!"
+        finally:
+            shutil.rmtree(tmp_folder)
+
+    @truncated_asc_fixture
+    def test_early_exit(self):
+        async def first():
+            async for _result in iter_parsed_files(self.data_folder, max_workers=1):
+                return _result
+
+        assert asyncio.run(first())[2] is None
+
+    def test_wrong_input(self):
+        with pytest.raises(AttributeError):
+            asyncio.run(async_xrd_file_parser())
+        with pytest.raises(ValueError):
+            asyncio.run(async_xrd_file_parser(os.path.join(self.data_folder, "do_not_exist.ras")))
+        with pytest.raises(ValueError):
+            asyncio.run(_collect(self.data_folder, max_concurrency=0))
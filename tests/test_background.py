@@ -0,0 +1,112 @@
+from unittest import TestCase
+import numpy as np
+import pytest
+
+from notebooks.background import snip_background, rolling_ball_background, subtract_background
+from notebooks.background import estimate_background, background_methods, iter_background_blocks
+from notebooks.peaks import find_peaks_in_stack
+from notebooks.utilities import find_peaks_above_threshold
+
+
+class TestBackground(TestCase):
+
+    def setUp(self):
+        # low angle amorphous hump (ex: graphite anode) below 3 narrow peaks
+        self.xaxis = np.round(10. + np.arange(4000) * 0.01, 2)
+        self.hump = 2000. * np.exp(-0.5 * ((self.xaxis - 14.) / 3.) ** 2) + 100.
+        self.centers = [20., 30., 40.]
+        self.peaks = sum(500. * np.exp(-0.5 * ((self.xaxis - _center) / 0.05) ** 2) for _center in self.centers)
+        self.yaxis = self.hump + self.peaks
+
+    def test_background_below_the_data(self):
+        for _method in background_methods:
+            background = estimate_background(self.yaxis, method=_method, half_width=20)
+            assert np.all(background <= self.yaxis + 1e-6)
+            # the hump is followed, the peaks are not
+            assert np.allclose(background, self.hump, atol=40)
+            net_heights = (self.yaxis - background)[np.searchsorted(self.xaxis, self.centers)]
+            assert np.allclose(net_heights, 500., atol=40)
+
+    def test_snip_matches_textbook_loop(self):
+        yaxis = np.random.default_rng(0).random(300) * 100
+        expected = np.log(np.log(np.sqrt(yaxis + 1) + 1) + 1)
+        for _p in range(1, 21):
+            _previous = expected.copy()
+            for _i in range(_p, len(yaxis) - _p):
+                expected[_i] = min(_previous[_i], (_previous[_i - _p] + _previous[_i + _p]) / 2)
+        expected = (np.exp(np.exp(expected) - 1) - 1) ** 2 - 1
+
+        assert np.allclose(snip_background(yaxis, half_width=20), expected)
+
+    def test_stack_and_in_place(self):
+        stack = np.outer([1., 0.5, 2.], self.yaxis)
+        for _method in background_methods:
+            background = estimate_background(stack, method=_method, half_width=20)
+            assert background.shape == stack.shape
+            for _row, _scale in enumerate([1., 0.5, 2.]):
+                assert np.allclose(background[_row],
+                                   estimate_background(_scale * self.yaxis, method=_method, half_width=20))
+
+            in_place = stack.copy()
+            assert subtract_background(in_place, method=_method, half_width=20, in_place=True) is in_place
+            assert np.allclose(in_place, stack - background)
+
+            out = np.zeros(stack.shape[::-1]).T
+            assert estimate_background(stack, method=_method, half_width=20, out=out) is out
+            assert np.allclose(out, background)
+
+        assert np.allclose(snip_background(stack, half_width=20, block_size=1),
+                           snip_background(stack, half_width=20))
+
+    def test_no_false_peaks_on_the_hump(self):
+        peaks = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=self.yaxis, threshold=300)
+        assert 14. in peaks['xaxis']
+
+        for _method in background_methods:
+            peaks = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=self.yaxis, threshold=300,
+                                               background=_method, background_half_width=20)
+            assert np.array_equal(peaks['xaxis'], self.centers)
+            assert np.allclose(peaks['yaxis'], self.yaxis[np.searchsorted(self.xaxis, self.centers)])
+
+        stack = np.outer([1., 2.], self.yaxis)
+        peaks = find_peaks_in_stack(xaxis=self.xaxis, stack=stack, threshold=300, background='snip',
+                                    background_half_width=20)
+        assert np.array_equal(peaks['offsets'], [0, 3, 6])
+        assert np.allclose(peaks['yaxis'][3:], stack[1, np.searchsorted(self.xaxis, self.centers)])
+
+    def test_wrong_input(self):
+        with pytest.raises(AttributeError):
+            snip_background()
+        with pytest.raises(AttributeError):
+            rolling_ball_background()
+        with pytest.raises(ValueError):
+            estimate_background(self.yaxis, method='polynomial')
+
+
+class TestIterBackgroundBlocks(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.xaxis = np.round(10. + np.arange(3000) * 0.01, 2)
+        self.yaxis = rng.poisson(100. + 50. * np.sin(self.xaxis) + 500. * (np.arange(3000) % 400 == 0))
+
+    def blocks(self, block_size):
+        for _start in range(0, len(self.xaxis), block_size):
+            yield {'2theta': self.xaxis[_start:_start + block_size],
+                   'intensity': self.yaxis[_start:_start + block_size]}
+
+    def test_same_background_as_full_scan(self):
+        for _method in background_methods:
+            expected = estimate_background(self.yaxis, method=_method, half_width=10)
+            for block_size in [1, 7, 500, 3000, 5000]:
+                blocks = list(iter_background_blocks(self.blocks(block_size), method=_method, half_width=10))
+                assert np.array_equal(np.concatenate([_block['2theta'] for _block in blocks]), self.xaxis)
+                assert np.array_equal(np.concatenate([_block['intensity'] for _block in blocks]), self.yaxis)
+                assert np.allclose(np.concatenate([_block['background'] for _block in blocks]), expected)
+
+    def test_empty_and_wrong_input(self):
+        assert list(iter_background_blocks([])) == []
+        with pytest.raises(AttributeError):
+            list(iter_background_blocks())
+        with pytest.raises(ValueError):
+            list(iter_background_blocks(self.blocks(100), method='unknown'))
@@ -0,0 +1,133 @@
+from unittest import TestCase
+import os
+import time
+import shutil
+import datetime
+import tempfile
+import numpy as np
+import pytest
+
+from notebooks.catalogue import ScanCatalogue, catalogue_rows
+from notebooks.xrd_file_parser import xrd_file_parser
+
+
+class TestScanCatalogue(TestCase):
+
+    def setUp(self):
+        self.data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        self.tmp_folder = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp_folder, "share")
+        os.makedirs(os.path.join(self.folder, "december"))
+        for _name, _sub_folder in [("xrd_file.ras", ""), ("xrd_file.asc", ""), ("xrd_file_full.txt", ""),
+                                   ("xrd_file.raw", "december")]:
+            shutil.copy(os.path.join(self.data_folder, _name), os.path.join(self.folder, _sub_folder, _name))
+
+        # two scans of a temperature program
+        with open(os.path.join(self.data_folder, "xrd_file.ras"), 'rb') as f:
+            content = f.read()
+        with open(os.path.join(self.folder, "december", "program.ras"), 'wb') as f:
+            f.write(content + b"*RAS_INT_END\r\n*RAS_HEADER_START\r\n*FILE_SAMPLE \"graphite\"\r\n"
+                    + b"*MEAS_SCAN_START \"30.00\"\r\n*MEAS_SCAN_STOP \"40.00\"\r\n*MEAS_SCAN_STEP \"0.01\"\r\n"
+                    + b"*RAS_INT_START\r\n30.0000 5.0000 1.0000\r\n*RAS_INT_END\r\n")
+
+        self.catalogue = ScanCatalogue(os.path.join(self.tmp_folder, "catalogue.db"))
+
+    def tearDown(self):
+        self.catalogue.close()
+        shutil.rmtree(self.tmp_folder)
+
+    def file_name(self, *names):
+        return os.path.join(self.folder, *names)
+
+    def test_sync(self):
+        report = self.catalogue.sync(self.folder)
+        assert len(report['added']) == 5
+        assert report['errors'] == {}
+        assert len(self.catalogue) == 6
+
+        rows = {(os.path.basename(_row['path']), _row['segment']): _row for _row in self.catalogue.query()}
+        assert rows[('xrd_file.ras', 0)]['anode'] == 'cu'
+        assert rows[('xrd_file.ras', 0)]['alpha1'] == 1.540593
+        data_offset = xrd_file_parser(self.file_name("xrd_file.ras"))['data_offset']
+        assert rows[('xrd_file.ras', 0)]['data_offset'] == data_offset
+        assert (rows[('xrd_file.ras', 0)]['two_theta_min'], rows[('xrd_file.ras', 0)]['two_theta_max']) == (20., 20.06)
+        assert rows[('xrd_file.raw', 0)]['sample'] == 'powder'
+        assert rows[('xrd_file_full.txt', 0)]['anode'] is None
+        assert rows[('xrd_file_full.txt', 0)]['n_points'] == 2677
+
+        # the second scan of the program is described by its header
+        assert rows[('program.ras', 1)]['sample'] == 'graphite'
+        assert rows[('program.ras', 1)]['n_points'] == 1001
+        assert rows[('program.ras', 1)]['alpha1'] is None
+
+    def test_incremental_sync(self):
+        self.catalogue.sync(self.folder)
+        report = self.catalogue.sync(self.folder)
+        assert report['unchanged'] == 5
+        assert report['added'] == report['updated'] == report['removed'] == []
+
+        # touched files are not parsed again
+        os.utime(self.file_name("xrd_file.asc"), ns=(0, 10 ** 18))
+        report = self.catalogue.sync(self.folder)
+        assert report['unchanged'] == 5
+        assert self.catalogue.query(path="%.asc")[0]['mtime'] == 10 ** 18
+
+        with open(self.file_name("xrd_file_full.txt"), 'a') as f:
+            f.write("52.6000\t1.0\n")
+        os.remove(self.file_name("december", "xrd_file.raw"))
+        with open(self.file_name("december", "broken.raw"), 'wb') as f:
+            f.write(b"not a raw file")
+
+        report = self.catalogue.sync(self.folder)
+        assert report['updated'] == [self.file_name("xrd_file_full.txt")]
+        assert report['removed'] == [self.file_name("december", "xrd_file.raw")]
+        assert list(report['errors'].keys()) == [self.file_name("december", "broken.raw")]
+        assert self.catalogue.query(path="%.txt")[0]['two_theta_max'] == 52.6
+        assert len(self.catalogue) == 5
+
+    def test_catalogue_is_persistent(self):
+        self.catalogue.sync(self.folder)
+        self.catalogue.close()
+
+        self.catalogue = ScanCatalogue(os.path.join(self.tmp_folder, "catalogue.db"))
+        assert len(self.catalogue) == 6
+        assert self.catalogue.sync(self.folder)['unchanged'] == 5
+
+    def test_query(self):
+        self.catalogue.sync(self.folder)
+
+        assert self.catalogue.paths(sample="%GRAPH%") == [self.file_name("december", "program.ras")]
+        assert self.catalogue.paths(anode='cu', sample="%GRAPH%") == []
+        assert self.catalogue.paths(anode=['co', 'mo']) == []
+        assert self.catalogue.paths(two_theta_range=(50., 60.)) == [self.file_name("xrd_file.asc"),
+                                                                     self.file_name("xrd_file_full.txt")]
+        assert len(self.catalogue.paths(path=os.path.join(self.folder, "december", "%"))) == 2
+
+        now = time.time()
+        assert len(self.catalogue.paths(modified_after=now - 3600)) == 5
+        assert self.catalogue.paths(modified_before=datetime.datetime.fromtimestamp(now - 3600)) == []
+
+    def test_scans(self):
+        self.catalogue.sync(self.folder)
+
+        scans = self.catalogue.scans(path="%program.ras")
+        assert len(scans) == 2
+        assert np.array_equal(scans[0].intensity, [165., 187., 159., 160., 153., 203., 168.])
+        assert np.array_equal(scans[1].intensity, [5.])
+        assert scans[1].sample == 'graphite'
+
+        scans = self.catalogue.scans(sample='powder', dtype=np.float32)
+        assert scans[0].intensity.dtype == np.float32
+        assert scans[0].file_name == self.file_name("december", "xrd_file.raw")
+
+    def test_catalogue_rows(self):
+        rows = catalogue_rows(self.file_name("xrd_file.asc"), content_hash="hash")
+        assert len(rows) == 1
+        assert rows[0]['hash'] == "hash"
+        assert rows[0]['file_type'] == '.asc'
+
+    def test_wrong_input(self):
+        with pytest.raises(AttributeError):
+            ScanCatalogue()
+        with pytest.raises(ValueError):
+            self.catalogue.sync(os.path.join(self.tmp_folder, "do_not_exist"))
@@ -0,0 +1,67 @@
+from unittest import TestCase
+import os
+import numpy as np
+import pytest
+
+from notebooks.decimation import DecimationPyramid
+from notebooks.xrd_file_parser import xrd_file_parser
+
+
+class TestDecimationPyramid(TestCase):
+
+    TXT_FILE_NAME = "data/xrd_file_full.txt"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.txt_file_name = os.path.abspath(os.path.join(_file_path, self.TXT_FILE_NAME))
+        metadata_dict = xrd_file_parser(self.txt_file_name)
+        self.yaxis = np.asarray(metadata_dict['data']['intensity'])
+        self.xaxis = np.asarray(metadata_dict['data']['2theta'])
+
+    def test_no_peak_dropped(self):
+        pyramid = DecimationPyramid(xaxis=self.xaxis, yaxis=self.yaxis, min_bins=16)
+        decimated = pyramid.select(width=100)
+
+        assert decimated['level'] > 0
+        assert len(decimated['xaxis']) < len(self.xaxis) / 2
+        assert np.all(np.diff(decimated['xaxis']) >= 0)
+
+        # the min and max of every bin are kept with their own 2theta
+        bin_size = 2 ** decimated['level']
+        for _first in range(0, len(self.yaxis), bin_size):
+            _bin = self.yaxis[_first:_first + bin_size]
+            assert _bin.max() in decimated['yaxis']
+            assert _bin.min() in decimated['yaxis']
+        index = np.searchsorted(self.xaxis, decimated['xaxis'])
+        assert np.array_equal(self.yaxis[index], decimated['yaxis'])
+
+    def test_level_of_the_range(self):
+        pyramid = DecimationPyramid(xaxis=self.xaxis, yaxis=self.yaxis, min_bins=16)
+
+        full = pyramid.select(width=10000)
+        assert full['level'] == 0
+        assert np.array_equal(full['yaxis'], self.yaxis)
+
+        zoom = pyramid.select(x_min=self.xaxis[100], x_max=self.xaxis[400], width=20)
+        assert 0 < zoom['level'] < pyramid.select(width=20)['level']
+        assert zoom['xaxis'][0] <= self.xaxis[100] and zoom['xaxis'][-1] >= self.xaxis[400]
+        assert self.yaxis[100:401].max() in zoom['yaxis']
+
+    def test_stack(self):
+        stack = np.outer([1., -1., 2.], self.yaxis)
+        pyramid = DecimationPyramid(xaxis=self.xaxis, yaxis=stack, min_bins=16)
+        decimated = pyramid.select(width=50)
+
+        assert decimated['xaxis'].shape == decimated['yaxis'].shape
+        assert decimated['yaxis'].shape[0] == 3
+        assert np.allclose(decimated['yaxis'].max(axis=1), stack.max(axis=1))
+        assert np.allclose(decimated['yaxis'].min(axis=1), stack.min(axis=1))
+
+        single = DecimationPyramid(xaxis=self.xaxis, yaxis=stack[1], min_bins=16).select(width=50)
+        assert np.array_equal(single['yaxis'], decimated['yaxis'][1])
+
+    def test_wrong_input(self):
+        with pytest.raises(AttributeError):
+            DecimationPyramid(xaxis=self.xaxis)
+        with pytest.raises(ValueError):
+            DecimationPyramid(xaxis=self.xaxis, yaxis=self.yaxis[:-1])
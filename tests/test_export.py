@@ -0,0 +1,127 @@
+from unittest import TestCase, mock
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import pytest
+
+from notebooks.export import ScanExportWriter, read_export, export_records, export_format_of
+from notebooks.xrd_file_parser import xrd_file_parser
+from notebooks.utilities import find_peaks_above_threshold
+from tests import truncated_asc_fixture
+
+
+@truncated_asc_fixture
+class ExportTests:
+    """tests run against every export format"""
+
+    EXPORT_NAME = None
+    MODULE = None
+    FILE_NAMES = ["data/xrd_file.ras", "data/xrd_file.asc", "data/xrd_file_full.txt", "data/xrd_file.raw"]
+
+    def setUp(self):
+        pytest.importorskip(self.MODULE)
+        _file_path = os.path.dirname(__file__)
+        self.tmp_folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_folder, self.EXPORT_NAME)
+
+        self.scans = {}
+        for _name in self.FILE_NAMES:
+            self.scans[os.path.basename(_name)] = xrd_file_parser(os.path.join(_file_path, _name))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def export(self, buffer_rows=10):
+        peaks = {}
+        with ScanExportWriter(self.path, buffer_rows=buffer_rows, chunk_size=256) as writer:
+            for _scan_id, _metadata in self.scans.items():
+                records = export_records(_metadata, scan_id=_scan_id)['scans']
+                peaks[_scan_id] = find_peaks_above_threshold(xaxis=records['two_theta'],
+                                                             yaxis=records['intensity'],
+                                                             threshold=200, distance=20)
+                writer.add_scan(_metadata, scan_id=_scan_id, peaks=peaks[_scan_id])
+        return peaks
+
+    def test_round_trip(self):
+        peaks = self.export()
+
+        scans = read_export(self.path)
+        assert len(scans['two_theta']) == sum(len(export_records(_metadata, _scan_id)['scans']['two_theta'])
+                                              for _scan_id, _metadata in self.scans.items())
+
+        for _scan_id, _metadata in self.scans.items():
+            expected = export_records(_metadata, scan_id=_scan_id, peaks=peaks[_scan_id])
+            for _table in ['scans', 'peaks']:
+                returned = read_export(self.path, table=_table, scan_id=_scan_id)
+                assert np.array_equal(returned['two_theta'], expected[_table]['two_theta'])
+                assert np.array_equal(returned['intensity'], expected[_table]['intensity'])
+                assert np.array_equal(returned['d'], expected[_table]['d'], equal_nan=True)
+                assert set(returned['anode']) == {expected[_table]['anode']}
+                assert set(returned['sample']) == {expected[_table]['sample']}
+
+    def test_filters(self):
+        self.export()
+
+        returned = read_export(self.path, anode='cu', two_theta_range=(20.02, 20.05))
+        assert sorted(set(returned['scan_id'])) == ['xrd_file.asc', 'xrd_file.ras', 'xrd_file.raw']
+        assert np.all((returned['two_theta'] >= 20.02) & (returned['two_theta'] <= 20.05))
+        assert len(returned['two_theta']) == 12
+
+        # the TXT file has no wavelength
+        returned = read_export(self.path, anode=[None], columns=['scan_id', 'd'])
+        assert list(returned.keys()) == ['scan_id', 'd']
+        assert set(returned['scan_id']) == {'xrd_file_full.txt'}
+        assert np.all(np.isnan(returned['d']))
+
+        returned = read_export(self.path, sample='powder')
+        assert set(returned['scan_id']) == {'xrd_file.raw'}
+
+        returned = read_export(self.path, table='peaks', anode='cu', two_theta_range=(100., 120.))
+        assert len(returned['two_theta']) == 0
+
+    def test_appends(self):
+        self.export(buffer_rows=10 ** 6)
+        self.export()
+        returned = read_export(self.path, scan_id='xrd_file.ras')
+        assert len(returned['two_theta']) == 14
+
+    def test_wrong_input(self):
+        with pytest.raises(AttributeError):
+            ScanExportWriter()
+        with pytest.raises(AttributeError):
+            ScanExportWriter(self.path).add_scan(self.scans['xrd_file.ras'])
+        with pytest.raises(ValueError):
+            read_export(self.path)
+        self.export()
+        with pytest.raises(ValueError):
+            read_export(self.path, table='unknown')
+
+
+class TestParquetExport(ExportTests, TestCase):
+
+    EXPORT_NAME = "export"
+    MODULE = "pyarrow"
+
+
+class TestHdf5Export(ExportTests, TestCase):
+
+    EXPORT_NAME = "export.h5"
+    MODULE = "h5py"
+
+
+class TestExportFormat(TestCase):
+
+    def test_format_of_path(self):
+        assert export_format_of("scans.h5") == 'hdf5'
+        assert export_format_of("scans.hdf5") == 'hdf5'
+        assert export_format_of("scans") == 'parquet'
+        assert export_format_of("scans.h5", export_format='parquet') == 'parquet'
+        with pytest.raises(ValueError):
+            export_format_of("scans.csv", export_format='csv')
+
+    def test_missing_dependency(self):
+        with mock.patch.dict(sys.modules, {'h5py': None}):
+            with pytest.raises(ImportError, match="pip install h5py"):
+                ScanExportWriter("scans.h5")
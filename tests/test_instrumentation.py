@@ -0,0 +1,102 @@
+from unittest import TestCase
+import os
+import io
+import json
+import shutil
+import tempfile
+import numpy as np
+
+from notebooks.instrumentation import instrument, stage, instrumented
+from notebooks.xrd_file_parser import xrd_file_parser
+from notebooks.utilities import find_peaks_above_threshold, from_theta_to_d
+
+
+class TestInstrumentation(TestCase):
+
+    RAS_FILE_NAME = "data/xrd_file.ras"
+    RAW_FILE_NAME = "data/xrd_file.raw"
+    TXT_FILE_NAME = "data/xrd_file_full.txt"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.ras_file_name = os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME))
+        self.raw_file_name = os.path.abspath(os.path.join(_file_path, self.RAW_FILE_NAME))
+        self.txt_file_name = os.path.abspath(os.path.join(_file_path, self.TXT_FILE_NAME))
+        self.tmp_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def test_parser_stages(self):
+        with instrument() as stats:
+            xrd_file_parser(self.ras_file_name)
+
+        assert list(stats) == ['xrd_file_parser/ras_file_parser/header',
+                               'xrd_file_parser/ras_file_parser/data',
+                               'xrd_file_parser/ras_file_parser',
+                               'xrd_file_parser']
+        header = stats['xrd_file_parser/ras_file_parser/header']
+        data = stats['xrd_file_parser/ras_file_parser/data']
+        assert header['calls'] == 1
+        assert header['rows'] == 19
+        assert header['bytes_read'] + data['bytes_read'] == os.path.getsize(self.ras_file_name)
+        assert data['rows'] == 7
+        assert stats['xrd_file_parser']['wall_time'] >= data['wall_time'] > 0
+        assert data['allocated'] is None
+        assert stats.events[0]['file_name'] == self.ras_file_name
+
+        # nothing is recorded outside of the block
+        xrd_file_parser(self.ras_file_name)
+        assert stats['xrd_file_parser']['calls'] == 1
+
+    def test_lazy_and_raw_stages(self):
+        with instrument() as stats:
+            metadata = xrd_file_parser(self.ras_file_name, lazy=True)
+            assert 'xrd_file_parser/ras_file_parser/data' not in stats
+            len(metadata['data']['intensity'])
+            xrd_file_parser(self.raw_file_name)
+
+        assert stats['data']['rows'] == 7
+        assert stats['xrd_file_parser/raw_file_parser/read']['bytes_read'] == os.path.getsize(self.raw_file_name)
+        assert stats['xrd_file_parser/raw_file_parser/data']['rows'] == 12
+
+    def test_pipeline_log_and_allocations(self):
+        log_file_name = os.path.join(self.tmp_folder, "stats.jsonl")
+        with instrument(log_file=log_file_name, track_allocations=True) as stats:
+            metadata = xrd_file_parser(self.txt_file_name)
+            xaxis = np.asarray(metadata['data']['2theta'])
+            yaxis = metadata['data']['intensity']
+            peaks = find_peaks_above_threshold(xaxis=xaxis, yaxis=yaxis, threshold=30000)
+            from_theta_to_d(two_theta=peaks['xaxis'], units='deg', xrd_lambda_angstroms=1.5418)
+
+        assert stats['find_peaks_above_threshold']['rows'] == len(yaxis)
+        assert stats['from_theta_to_d']['rows'] == len(peaks['xaxis'])
+        assert stats['xrd_file_parser/txt_file_parser/data']['allocated'] > yaxis.nbytes
+        assert stats['xrd_file_parser']['allocated'] >= stats['xrd_file_parser/txt_file_parser/data']['allocated']
+
+        with open(log_file_name) as f:
+            events = [json.loads(_line) for _line in f]
+        assert [_event['path'] for _event in events] == [_event['path'] for _event in stats.events]
+        assert events[-1]['stage'] == 'from_theta_to_d'
+        assert 'find_peaks_above_threshold' in stats.summary()
+
+    def test_custom_stages(self):
+        @instrumented(name='square')
+        def square(value):
+            return value ** 2
+
+        log = io.StringIO()
+        with instrument(log_file=log) as stats:
+            with stage('batch', batch=3) as batch_stage:
+                batch_stage.add(rows=2)
+                assert square(3) == 9
+
+        assert list(stats) == ['batch/square', 'batch']
+        assert stats['batch']['rows'] == 2
+        assert json.loads(log.getvalue().splitlines()[-1])['batch'] == 3
+
+        # measured only while recording
+        with stage('ignored') as ignored_stage:
+            ignored_stage.add(rows=1)
+        assert square(4) == 16
+        assert len(stats.events) == 2
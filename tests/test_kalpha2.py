@@ -0,0 +1,92 @@
+from unittest import TestCase
+import os
+import numpy as np
+import pytest
+
+from notebooks.kalpha2 import kalpha2_offset, strip_kalpha2, strip_kalpha2_scan
+from notebooks.scan_axis import UniformAxis
+from notebooks.xrd_file_parser import xrd_file_parser
+from notebooks.xrd_scan import load_xrd_scan
+from tests import truncated_asc_fixture
+
+
+def gauss(xaxis, center, width=0.05):
+    return np.exp(-0.5 * ((xaxis - center) / width) ** 2)
+
+
+class TestStripKalpha2(TestCase):
+
+    RAS_FILE_NAME = "data/xrd_file.ras"
+    TXT_FILE_NAME = "data/xrd_file.txt"
+    ASC_FILE_NAME = "data/xrd_file.asc"
+    RAW_FILE_NAME = "data/xrd_file.raw"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.ras_file_name = os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME))
+        self.txt_file_name = os.path.abspath(os.path.join(_file_path, self.TXT_FILE_NAME))
+        self.asc_file_name = os.path.abspath(os.path.join(_file_path, self.ASC_FILE_NAME))
+        self.raw_file_name = os.path.abspath(os.path.join(_file_path, self.RAW_FILE_NAME))
+
+        self.alpha1 = 1.540593
+        self.alpha2 = 1.544414
+        self.xaxis = UniformAxis(start=20., step=0.01, n=10001, decimals=2)
+        centers = np.array([30., 60., 100., 140.])
+        centers_alpha2 = 2 * np.degrees(np.arcsin(self.alpha2 / self.alpha1 * np.sin(np.radians(centers / 2))))
+        self.yaxis_alpha1 = sum(1000. * gauss(np.asarray(self.xaxis), _center) for _center in centers)
+        self.yaxis = self.yaxis_alpha1 + sum(500. * gauss(np.asarray(self.xaxis), _center)
+                                             for _center in centers_alpha2)
+
+    def test_offset(self):
+        offset = kalpha2_offset([30., 140.], self.alpha1, self.alpha2)
+        assert np.allclose(offset, [0.0760, 0.7718], atol=1e-4)
+
+    def test_doublet_stripped(self):
+        stripped = strip_kalpha2(self.xaxis, self.yaxis, self.alpha1, self.alpha2)
+        assert np.abs(stripped - self.yaxis_alpha1).max() < 5.
+
+        # same as the point by point Rachinger loop
+        xaxis = np.asarray(self.xaxis)
+        offset = kalpha2_offset(xaxis, self.alpha1, self.alpha2)
+        expected = self.yaxis.copy()
+        for _i in range(len(xaxis)):
+            if xaxis[_i] - offset[_i] >= xaxis[0]:
+                expected[_i] -= 0.5 * np.interp(xaxis[_i] - offset[_i], xaxis[:_i + 1], expected[:_i + 1])
+        assert np.allclose(stripped, expected, atol=1e-3)
+
+        # non uniform grid
+        assert np.allclose(strip_kalpha2(xaxis, self.yaxis, self.alpha1, self.alpha2), stripped)
+
+    def test_stack(self):
+        stack = np.outer([1., 2., 0.5], self.yaxis)
+        stripped = strip_kalpha2(self.xaxis, self.yaxis, self.alpha1, self.alpha2)
+
+        assert np.allclose(strip_kalpha2(self.xaxis, stack, self.alpha1, self.alpha2),
+                           np.outer([1., 2., 0.5], stripped))
+
+        out = np.zeros(stack.shape[::-1]).T
+        assert strip_kalpha2(self.xaxis, stack, self.alpha1, self.alpha2, out=out) is out
+        assert np.allclose(out[1], 2 * stripped)
+
+    def test_wavelengths_of_the_header(self):
+        metadata = xrd_file_parser(self.ras_file_name)
+        stripped = strip_kalpha2_scan(metadata)
+        assert len(stripped) == len(metadata['data']['intensity'])
+        assert np.array_equal(stripped, strip_kalpha2_scan(load_xrd_scan(self.ras_file_name)))
+
+        with pytest.raises(AttributeError):
+            strip_kalpha2_scan(xrd_file_parser(self.txt_file_name))
+        with pytest.raises(AttributeError):
+            strip_kalpha2_scan(None)
+        with pytest.raises(AttributeError):
+            strip_kalpha2(self.xaxis, None, self.alpha1, self.alpha2)
+
+    @truncated_asc_fixture
+    def test_wavelengths_of_the_asc_and_raw_headers(self):
+        for _file_name in [self.asc_file_name, self.raw_file_name]:
+            metadata = xrd_file_parser(_file_name)
+            stripped = strip_kalpha2_scan(metadata)
+            expected = strip_kalpha2(metadata['2theta']['axis'], metadata['data'], metadata['alpha1'],
+                                     metadata['alpha2'])
+            assert np.array_equal(stripped, expected)
+            assert np.array_equal(strip_kalpha2_scan(load_xrd_scan(_file_name)), stripped)
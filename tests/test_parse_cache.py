@@ -0,0 +1,125 @@
+from unittest import TestCase, mock
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from notebooks.parse_cache import ParseCache
+from notebooks.xrd_file_parser import xrd_file_parser
+from tests import truncated_asc_fixture
+
+
+@truncated_asc_fixture
+class TestParseCache(TestCase):
+
+    ASC_FILE_NAME = "data/xrd_file.asc"
+    RAS_FILE_NAME = "data/xrd_file.ras"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.tmp_folder = tempfile.mkdtemp()
+        self.cache_folder = os.path.join(self.tmp_folder, "cache")
+        self.asc_file_name = os.path.join(self.tmp_folder, "xrd_file.asc")
+        self.ras_file_name = os.path.join(self.tmp_folder, "xrd_file.ras")
+        shutil.copy(os.path.abspath(os.path.join(_file_path, self.ASC_FILE_NAME)), self.asc_file_name)
+        shutil.copy(os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME)), self.ras_file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def test_cached_parse_matches_parser(self):
+        cache = ParseCache(self.cache_folder)
+
+        metadata_expected = xrd_file_parser(self.ras_file_name)
+        xrd_file_parser(self.ras_file_name, cache=cache)
+        assert len(cache.entries()) == 1
+
+        metadata_returned = xrd_file_parser(self.ras_file_name, cache=ParseCache(self.cache_folder))
+
+        for key in ['alpha1', 'alpha2', 'beta', 'data_first_line', 'header']:
+            assert metadata_returned[key] == metadata_expected[key]
+
+        for key in metadata_expected['data'].keys():
+            assert np.array_equal(metadata_returned['data'][key], metadata_expected['data'][key])
+
+    def test_ras_segments(self):
+        with open(self.ras_file_name, 'rb') as f:
+            content = f.read()
+        with open(self.ras_file_name, 'wb') as f:
+            f.write(content + b"*RAS_INT_END\r\n*RAS_HEADER_START\r\n*RAS_INT_START\r\n30.0000 5.0000 1.0000\r\n")
+
+        metadata_expected = xrd_file_parser(self.ras_file_name)
+        xrd_file_parser(self.ras_file_name, cache=ParseCache(self.cache_folder))
+        metadata_returned = xrd_file_parser(self.ras_file_name, cache=ParseCache(self.cache_folder))
+
+        assert len(metadata_returned['segments']) == 2
+        assert metadata_returned['segments'][1]['data_offset'] == metadata_expected['segments'][1]['data_offset']
+        assert np.array_equal(metadata_returned['segments'][1]['data']['intensity'], [5.])
+        assert np.array_equal(metadata_returned['segments'][0]['data']['intensity'],
+                              metadata_expected['data']['intensity'])
+
+    def test_changed_file_is_parsed_again(self):
+        cache = ParseCache(self.cache_folder)
+        cache.parse(self.asc_file_name)
+
+        with open(self.asc_file_name, 'a') as f:
+            f.write("1, 2\n")
+
+        metadata_returned = cache.parse(self.asc_file_name)
+        assert len(metadata_returned['data']) == 14
+        assert len(cache.entries()) == 2
+
+    def test_lru_eviction(self):
+        cache = ParseCache(self.cache_folder)
+        cache.parse(self.asc_file_name)
+        cache.parse(self.ras_file_name)
+
+        asc_entry = cache.entry_file_name(self.asc_file_name)
+        os.utime(asc_entry, (0, 0))
+
+        cache.max_size = cache.size() - 1
+        cache.evict()
+
+        entries = cache.entries()
+        assert len(entries) == 1
+        assert entries[0][2] == cache.entry_file_name(self.ras_file_name)
+
+        cache.clear()
+        assert cache.size() == 0
+
+    def test_index_written_on_close(self):
+        index_file_name = os.path.join(self.cache_folder, "index.json")
+        with ParseCache(self.cache_folder) as cache:
+            with mock.patch.object(cache, '_save_index', wraps=cache._save_index) as save_index:
+                cache.parse(self.asc_file_name)
+                cache.parse(self.ras_file_name)
+                assert save_index.call_count == 0
+            assert not os.path.exists(index_file_name)
+
+        assert len(ParseCache(self.cache_folder).index) == 2
+
+    def test_store_keeps_a_running_size(self):
+        cache = ParseCache(self.cache_folder)
+        cache.parse(self.asc_file_name)
+        first_asc_entry = cache.entry_file_name(self.asc_file_name)
+
+        cache.max_size = 10 * cache.size()
+        with mock.patch.object(cache, 'entries', wraps=cache.entries) as entries:
+            cache.parse(self.ras_file_name)
+            with open(self.asc_file_name, 'a') as f:
+                f.write("1, 2\n")
+            cache.parse(self.asc_file_name)
+            assert entries.call_count == 1
+
+        # the first ASC entry is now the least recently used one
+        cache.parse(self.ras_file_name)
+        cache.max_size = cache.size() - 1
+        with open(self.asc_file_name, 'a') as f:
+            f.write("1, 2\n")
+        cache.parse(self.asc_file_name)
+
+        entry_file_names = [_entry[2] for _entry in cache.entries()]
+        assert first_asc_entry not in entry_file_names
+        assert cache.entry_file_name(self.ras_file_name) in entry_file_names
+        assert cache.entry_file_name(self.asc_file_name) in entry_file_names
+        cache.close()
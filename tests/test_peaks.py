@@ -0,0 +1,182 @@
+from unittest import TestCase
+import os
+import numpy as np
+import pytest
+
+from notebooks.peaks import find_peaks_in_stack, peaks_of_scan, StreamingPeakFinder, refine_peaks
+from notebooks.utilities import find_peaks_above_threshold, from_theta_to_d
+from notebooks.xrd_file_parser import xrd_file_parser, iter_scan_blocks
+from notebooks.background import iter_background_blocks
+
+
+class TestFindPeaksInStack(TestCase):
+
+    TXT_FILE_NAME = "data/xrd_file_full.txt"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.txt_file_name = os.path.abspath(os.path.join(_file_path, self.TXT_FILE_NAME))
+        metadata_dict = xrd_file_parser(self.txt_file_name)
+        self.yaxis = metadata_dict['data']['intensity']
+        self.xaxis = metadata_dict['data']['2theta']
+        self.stack = np.outer([1., 0.5, 0.01, 2.], self.yaxis)
+
+    def test_same_peaks_as_single_scan(self):
+        peaks = find_peaks_in_stack(xaxis=self.xaxis, stack=self.stack, threshold=30000, distance=200)
+
+        assert len(peaks['offsets']) == 5
+        for _scan_index, _yaxis in enumerate(self.stack):
+            peaks_expected = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=_yaxis, threshold=30000)
+            peaks_returned = peaks_of_scan(peaks, _scan_index)
+
+            assert np.array_equal(peaks_expected['xaxis'], peaks_returned['xaxis'])
+            assert np.array_equal(peaks_expected['yaxis'], peaks_returned['yaxis'])
+
+        assert len(peaks_of_scan(peaks, 2)['xaxis']) == 0
+
+    def test_worker_processes(self):
+        peaks_expected = find_peaks_in_stack(xaxis=self.xaxis, stack=self.stack, threshold=30000)
+        peaks_returned = find_peaks_in_stack(xaxis=self.xaxis, stack=self.stack, threshold=30000,
+                                             max_workers=2, rows_per_task=1)
+
+        for key in peaks_expected.keys():
+            assert np.array_equal(peaks_expected[key], peaks_returned[key])
+
+    def test_bad_input(self):
+        with pytest.raises(AttributeError):
+            find_peaks_in_stack(xaxis=self.xaxis, stack=None)
+
+        with pytest.raises(ValueError):
+            find_peaks_in_stack(xaxis=self.xaxis[:10], stack=self.stack)
+
+
+class TestStreamingPeakFinder(TestCase):
+
+    TXT_FILE_NAME = "data/xrd_file_full.txt"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.txt_file_name = os.path.abspath(os.path.join(_file_path, self.TXT_FILE_NAME))
+        metadata_dict = xrd_file_parser(self.txt_file_name)
+        self.yaxis = metadata_dict['data']['intensity']
+        self.xaxis = metadata_dict['data']['2theta']
+
+    def test_same_peaks_as_full_scan(self):
+        for distance in [1, 20, 200]:
+            peaks_expected = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=self.yaxis, threshold=200,
+                                                        distance=distance)
+            for block in [1, 7, 1000]:
+                finder = StreamingPeakFinder(threshold=200, distance=distance)
+                for _start in range(0, len(self.yaxis), block):
+                    finder.update(self.xaxis[_start: _start + block], self.yaxis[_start: _start + block])
+                finder.flush()
+                peaks_returned = finder.peaks()
+
+                assert np.array_equal(peaks_expected['xaxis'], peaks_returned['xaxis'])
+                assert np.array_equal(peaks_expected['yaxis'], peaks_returned['yaxis'])
+
+    def test_file_blocks_pipeline(self):
+        peaks_expected = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=self.yaxis, threshold=50,
+                                                    distance=20, background='snip', background_half_width=10)
+
+        finder = StreamingPeakFinder(threshold=50, distance=20)
+        blocks = iter_background_blocks(iter_scan_blocks(self.txt_file_name, block_size=100), half_width=10)
+        for _block in blocks:
+            finder.update(_block['2theta'], _block['intensity'] - _block['background'])
+        finder.flush()
+
+        assert len(peaks_expected['xaxis'])
+        assert np.array_equal(peaks_expected['xaxis'], finder.peaks()['xaxis'])
+
+    def test_peaks_confirmed_after_distance(self):
+        finder = StreamingPeakFinder(threshold=5, distance=3)
+        assert len(finder.update([0, 1, 2, 3], [0, 10, 0, 0])['xaxis']) == 0
+        assert np.array_equal(finder.update([4], [0])['xaxis'], [1])
+
+        # a higher neighbour not yet received could still suppress the 8
+        assert len(finder.update([5, 6, 7, 8], [0, 8, 0, 9])['xaxis']) == 0
+        finder.update([9, 10, 11, 12], [0, 0, 0, 0])
+        assert np.array_equal(finder.peaks()['xaxis'], [1, 8])
+        assert len(finder.flush()['xaxis']) == 0
+
+    def test_open_plateau(self):
+        # the plateau 9, 9 only becomes a peak (at its midpoint) once the 2 is received
+        yaxis = np.array([0, 1, 2, 5, 1, 3, 4, 6, 9, 9, 2, 0, .5, 0])
+        xaxis = np.arange(len(yaxis), dtype=np.float64)
+        peaks_expected = find_peaks_above_threshold(xaxis=xaxis, yaxis=yaxis, threshold=0, distance=6)
+
+        finder = StreamingPeakFinder(threshold=0, distance=6)
+        for _index in range(len(yaxis)):
+            finder.update(xaxis[_index: _index + 1], yaxis[_index: _index + 1])
+        finder.flush()
+
+        assert np.array_equal(finder.peaks()['index'], [8])
+        assert np.array_equal(peaks_expected['xaxis'], finder.peaks()['xaxis'])
+
+
+def pseudo_voigt(xaxis, amplitude, center, fwhm, eta, background):
+    q = 4. * ((xaxis - center) / fwhm) ** 2
+    return amplitude * (eta / (1. + q) + (1. - eta) * np.exp(-np.log(2.) * q)) + background
+
+
+class TestRefinePeaks(TestCase):
+
+    def setUp(self):
+        self.xaxis = np.round(20. + np.arange(2000) * 0.01, 2)
+        self.centers = np.array([22.3456, 28.0123, 35.5, 39.876])
+        self.yaxis = 50. + sum(pseudo_voigt(self.xaxis, 1000., _center, 0.08, 0.3, 0.) for _center in self.centers)
+
+    def test_sub_step_centers(self):
+        peaks = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=self.yaxis, threshold=300, distance=20)
+        refined = refine_peaks(xaxis=self.xaxis, yaxis=self.yaxis, peaks=peaks)
+
+        assert refined['converged'].all()
+        assert np.allclose(refined['center'], self.centers, atol=1e-6)
+        assert np.allclose(refined['fwhm'], 0.08, atol=1e-6)
+        assert np.allclose(refined['eta'], 0.3, atol=1e-4)
+        assert np.allclose(refined['background'], 50., atol=0.1)
+
+        d, d_error = from_theta_to_d(refined['center'], units='deg', xrd_lambda_angstroms=1.54056,
+                                     two_theta_error=refined['center_error'])
+        assert d.shape == d_error.shape == (4,)
+
+    def test_stack(self):
+        rng = np.random.default_rng(0)
+        stack = rng.poisson(np.tile(self.yaxis, (20, 1))).astype(np.float64)
+        peaks = find_peaks_in_stack(xaxis=self.xaxis, stack=stack, threshold=300, distance=20)
+        refined = refine_peaks(xaxis=self.xaxis, yaxis=stack, peaks=peaks, profile='gaussian')
+
+        assert np.array_equal(refined['offsets'], peaks['offsets'])
+        assert refined['converged'].all()
+        assert 'eta' not in refined
+        centers = refined['center'].reshape(20, 4)
+        errors = refined['center_error'].reshape(20, 4)
+        assert np.all(np.abs(centers - self.centers) < 5 * errors)
+        assert np.all(errors < 0.005)
+
+    def test_peak_at_scan_edge(self):
+        refined = refine_peaks(xaxis=self.xaxis[:1240], yaxis=self.yaxis[:1240], peaks={'index': np.array([235, 801])})
+        assert np.allclose(refined['center'], self.centers[:2], atol=1e-6)
+
+    def test_wide_peaks(self):
+        # FWHM of 30 and 50 points, as the graphite peaks of the RAS scans
+        centers = np.array([26.5678, 38.1234])
+        yaxis = 100. + pseudo_voigt(self.xaxis, 30000., centers[0], 0.3, 0.5, 0.) + \
+            pseudo_voigt(self.xaxis, 500., centers[1], 0.5, 0.2, 0.)
+        peaks = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=yaxis, threshold=300, distance=200)
+
+        refined = refine_peaks(xaxis=self.xaxis, yaxis=yaxis, peaks=peaks)
+        assert refined['converged'].all()
+        # the flat background of the small peak sits on the tail of the large one
+        assert np.allclose(refined['center'], centers, atol=1e-3)
+        assert np.allclose(refined['fwhm'], [0.3, 0.5], atol=1e-3)
+        assert np.allclose(refined['background'], 100., atol=5.)
+
+        # fixed windows of 21 points are too narrow for these peaks
+        assert not refine_peaks(xaxis=self.xaxis, yaxis=yaxis, peaks=peaks, half_width=10)['converged'].all()
+
+    def test_wrong_input(self):
+        with pytest.raises(AttributeError):
+            refine_peaks(xaxis=self.xaxis, yaxis=self.yaxis)
+        with pytest.raises(ValueError):
+            refine_peaks(xaxis=self.xaxis, yaxis=self.yaxis, peaks={'index': [235]}, profile='lorentz')
@@ -0,0 +1,91 @@
+from unittest import TestCase
+import os
+import numpy as np
+import pytest
+
+from notebooks.scan_axis import UniformAxis
+from notebooks.xrd_file_parser import xrd_file_parser
+
+
+class TestUniformAxis(TestCase):
+
+    def setUp(self):
+        self.values = np.round(20 + 0.01 * np.arange(10001), 2)
+        self.axis = UniformAxis(start=20, step=0.01, n=10001, decimals=2)
+
+    def test_behaves_like_array(self):
+        assert len(self.axis) == 10001
+        assert np.array_equal(np.asarray(self.axis), self.values)
+        assert self.axis[0] == 20
+        assert self.axis[1] == 20.01
+        assert self.axis[-1] == 120
+        assert self.axis.stop == 120
+        assert np.array_equal(self.axis[[3, 5, -2]], self.values[[3, 5, -2]])
+        assert np.array_equal(self.axis[self.values > 119.95], self.values[self.values > 119.95])
+        assert np.array_equal(self.axis * 2, self.values * 2)
+        assert np.array_equal(np.deg2rad(self.axis), np.deg2rad(self.values))
+
+        with pytest.raises(IndexError):
+            self.axis[10001]
+
+    def test_slicing_stays_compact(self):
+        axis_slice = self.axis[100:200:4]
+        assert isinstance(axis_slice, UniformAxis)
+        assert np.array_equal(np.asarray(axis_slice), self.values[100:200:4])
+        assert np.array_equal(np.asarray(self.axis[::-1]), self.values[::-1])
+
+    def test_searchsorted(self):
+        for side in ['left', 'right']:
+            for value in [0, 20, 20.005, 55.55, 120, 130]:
+                assert self.axis.searchsorted(value, side=side) == np.searchsorted(self.values, value, side=side)
+
+            assert np.array_equal(self.axis.searchsorted(self.values, side=side),
+                                  np.searchsorted(self.values, self.values, side=side))
+
+        index_range = self.axis.index_range(30, 31)
+        assert self.values[index_range][0] == 30
+        assert self.values[index_range][-1] == 31
+        assert len(self.values[index_range]) == 101
+
+    def test_from_array(self):
+        axis = UniformAxis.from_array(self.values)
+        assert axis.decimals == 2
+        assert np.array_equal(np.asarray(axis), self.values)
+
+        assert UniformAxis.from_array(np.array([1., 2., 4.])) is None
+        assert UniformAxis.from_array(np.array([1.])) is None
+
+
+class TestParsersAxis(TestCase):
+
+    ASC_FILE_NAME = "data/xrd_file.asc"
+    RAS_FILE_NAME = "data/xrd_file.ras"
+    RAW_FILE_NAME = "data/xrd_file.raw"
+    TXT_FILE_NAME = "data/xrd_file_full.txt"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.asc_file_name = os.path.abspath(os.path.join(_file_path, self.ASC_FILE_NAME))
+        self.ras_file_name = os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME))
+        self.raw_file_name = os.path.abspath(os.path.join(_file_path, self.RAW_FILE_NAME))
+        self.txt_file_name = os.path.abspath(os.path.join(_file_path, self.TXT_FILE_NAME))
+
+    def test_ras_and_txt_axis(self):
+        metadata = xrd_file_parser(self.ras_file_name)
+        assert isinstance(metadata['data']['2theta'], UniformAxis)
+        assert list(metadata['data']['2theta']) == [20, 20.01, 20.02, 20.03, 20.04, 20.05, 20.06]
+
+        metadata = xrd_file_parser(self.txt_file_name)
+        assert isinstance(metadata['data']['2theta'], UniformAxis)
+        assert metadata['data']['2theta'].step == 0.017
+
+    def test_asc_and_raw_axis(self):
+        # truncated fixture: 12 points of a scan stopping at 120 degrees
+        with pytest.warns(UserWarning, match="2theta axis stops at 20.11 but the header stop is 120"):
+            metadata = xrd_file_parser(self.asc_file_name)
+        axis = metadata['2theta']['axis']
+        assert len(axis) == len(metadata['data']) == 12
+        assert axis[11] == 20.11
+
+        metadata = xrd_file_parser(self.raw_file_name)
+        assert np.array_equal(np.asarray(metadata['2theta']['axis']), np.asarray(axis))
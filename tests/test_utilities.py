@@ -3,9 +3,10 @@ import numpy as np
 import pytest
 import os
 
-from notebooks.utilities import retrieve_anode_material
+from notebooks.utilities import retrieve_anode_material, retrieve_anode_materials
+from notebooks.utilities import AnodeIndex, xrd_lambda_angstroms_dict
 from notebooks.utilities import from_theta_to_d
-from notebooks.utilities import find_peaks_above_threshold
+from notebooks.utilities import find_peaks_above_threshold, PeakTable
 from notebooks.xrd_file_parser import xrd_file_parser
 
 PRECISION = 0.0001
@@ -75,6 +76,36 @@ class TestRetrieveAnodeMaterial(TestCase):
         assert expected_element == returned_element
 
 
+class TestRetrieveAnodeMaterials(TestCase):
+
+    def test_batch(self):
+        alpha1 = [1.54056, None, 1.55, '1.540593', None]
+        alpha2 = [None, 0.71359, None, '1.544414', None]
+        beta = [None, None, None, '1.392250', None]
+
+        returned = retrieve_anode_materials(alpha1=alpha1, alpha2=alpha2, beta=beta)
+
+        assert list(returned['material']) == ['cu', 'mo', None, 'cu', None]
+        assert list(returned['unmatched']) == [False, False, True, False, True]
+        assert not returned['ambiguous'].any()
+
+    def test_custom_table_and_ambiguous_rows(self):
+        table = {_material: dict(_wavelengths) for _material, _wavelengths in xrd_lambda_angstroms_dict.items()}
+        anode_index = AnodeIndex(table)
+        anode_index.register('cu_like', average=1.5419, alpha1=1.5406, alpha2=1.5445, beta=None)
+
+        returned = anode_index.classify(alpha1=np.array([1.54056, 0.7093]),
+                                        beta=np.array([np.nan, np.nan]))
+
+        assert list(returned['material']) == ['cu', 'mo']
+        assert list(returned['count']) == [2, 1]
+        assert list(returned['ambiguous']) == [True, False]
+
+        returned = anode_index.classify(beta=1.39222)
+        assert list(returned['material']) == ['cu']
+        assert 'cu_like' not in xrd_lambda_angstroms_dict
+
+
 class TestFromThetaTod(TestCase):
 
     def test_simple_conversion_with_rad(self):
@@ -146,3 +177,68 @@ class TestFindPeaks(TestCase):
 
         for _x_exp, _x_ret in zip(xaxis_peaks_expected, xaxis_peaks_returned):
             assert _x_exp == _x_ret
+
+
+class TestFromThetaTodVectorized(TestCase):
+
+    def test_stack_and_wavelengths(self):
+        two_theta_deg = np.array([[90, 60], [60, 90], [90, 90]])
+        xrd_lambda_angstroms = np.array([1.25, 2.5])
+
+        d_returned = from_theta_to_d(two_theta=two_theta_deg,
+                                     units='deg',
+                                     xrd_lambda_angstroms=xrd_lambda_angstroms)
+
+        assert d_returned.shape == (2, 3, 2)
+        assert np.allclose(d_returned[0, 0], [0.88388, 1.25], atol=PRECISION)
+        assert np.allclose(d_returned[1], 2 * d_returned[0])
+
+    def test_output_buffer(self):
+        out = np.empty(2)
+        d_returned = from_theta_to_d(two_theta=[90, 60], units='deg', xrd_lambda_angstroms=1.25, out=out)
+
+        assert d_returned is out
+        assert np.allclose(out, [0.88388, 1.25], atol=PRECISION)
+
+    def test_propagated_error(self):
+        two_theta_deg = np.array([30., 60., 90.])
+        d_returned, d_error_returned = from_theta_to_d(two_theta=two_theta_deg,
+                                                       units='deg',
+                                                       xrd_lambda_angstroms=1.54,
+                                                       two_theta_error=0.001)
+
+        d_shifted = from_theta_to_d(two_theta=two_theta_deg + 0.001, units='deg', xrd_lambda_angstroms=1.54)
+        assert np.allclose(d_error_returned, np.abs(d_shifted - d_returned), rtol=1e-2)
+
+
+class TestPeakTable(TestCase):
+
+    TXT_FILE_NAME = "data/xrd_file_full.txt"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.txt_file_name = os.path.abspath(os.path.join(_file_path, self.TXT_FILE_NAME))
+        metadata_dict = xrd_file_parser(self.txt_file_name)
+        self.yaxis = metadata_dict['data']['intensity']
+        self.xaxis = metadata_dict['data']['2theta']
+
+    def test_same_peaks_as_find_peaks_above_threshold(self):
+        peak_table = PeakTable(xaxis=self.xaxis, yaxis=self.yaxis)
+
+        for threshold in [0, 200, 30000, 79633.2479, 1e9]:
+            peaks_expected = find_peaks_above_threshold(xaxis=self.xaxis, yaxis=self.yaxis, threshold=threshold)
+            peaks_returned = peak_table.above(threshold)
+
+            assert np.array_equal(np.sort(peaks_expected['xaxis']), np.sort(peaks_returned['xaxis']))
+            assert np.all(np.diff(peaks_returned['yaxis']) <= 0)
+
+    def test_above_prominence(self):
+        peak_table = PeakTable(xaxis=self.xaxis, yaxis=self.yaxis)
+
+        peaks_returned = peak_table.above_prominence(50000)
+        assert len(peaks_returned['xaxis']) == 4
+        assert peaks_returned['xaxis'][0] == 25.0684
+        assert np.all(peaks_returned['prominence'] > 50000)
+
+        with pytest.raises(AttributeError):
+            PeakTable(xaxis=None, yaxis=self.yaxis)
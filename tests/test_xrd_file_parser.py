@@ -1,12 +1,20 @@
 import pytest
 from unittest import TestCase
 import os
+import sys
+import shutil
+import subprocess
+import tempfile
 import numpy as np
 from io import StringIO
 
 from notebooks.xrd_file_parser import file_content, _pattern_match, xrd_file_parser
-from notebooks.xrd_file_parser import txt_file_parser, ras_file_parser, asc_file_parser
-from notebooks.xrd_file_parser import XrdFileType
+from notebooks.xrd_file_parser import txt_file_parser, ras_file_parser, asc_file_parser, raw_file_parser
+from notebooks.xrd_file_parser import XrdFileType, scan_header, decode_asc_counts
+from notebooks.xrd_file_parser import batch_file_parser, list_xrd_files, LazyData, RasFileFollower
+from notebooks.xrd_file_parser import ScanBlockReader, iter_scan_blocks, decode_ras_data, RasSegments
+from notebooks.instrumentation import instrument
+from tests import truncated_asc_fixture
 
 
 class TestXrdRasFileParser(TestCase):
@@ -86,6 +94,7 @@ class TestXrdAscFileParser(TestCase):
 
         assert value_expected == value_returned
 
+    @truncated_asc_fixture
     def test_asc_file_parser(self):
 
         metadata_returned = asc_file_parser(self.asc_file_name)
@@ -171,6 +180,7 @@ class TestXrdFileParser(TestCase):
             for _exp, _return in zip(data_returned[key], data_expected[key]):
                 assert _exp == _return
 
+    @truncated_asc_fixture
     def test_asc_file_parser(self):
 
         metadata_returned = xrd_file_parser(self.asc_file_name)
@@ -265,6 +275,7 @@ class TestContentFileParser(TestCase):
         for _exp, _ret in zip(y_axis_expected, y_axis_returned):
             assert _exp == _ret
 
+    @truncated_asc_fixture
     def test_asc(self):
 
         content_of_file = file_content(self.asc_file_name)
@@ -293,6 +304,7 @@ class TestContentFileParser(TestCase):
         for _exp, _ret in zip(data_expected, data_returned):
             assert _exp == _ret
 
+    @truncated_asc_fixture
     def test_asc_via_xrd_file_parser(self):
 
         content_of_file = file_content(self.asc_file_name)
@@ -374,4 +386,459 @@ class TestContentFileParser(TestCase):
 
         for key in data_returned.keys():
             for _exp, _return in zip(data_returned[key], data_expected[key]):
-                assert _exp == _return
\ No newline at end of file
+                assert _exp == _return
+
+
+class TestScanHeader(TestCase):
+
+    ASC_FILE_NAME = "data/xrd_file.asc"
+    RAS_FILE_NAME = "data/xrd_file.ras"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.asc_file_name = os.path.abspath(os.path.join(_file_path, self.ASC_FILE_NAME))
+        self.ras_file_name = os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME))
+
+    def test_ras_header(self):
+        content = file_content(self.ras_file_name)
+        metadata = {}
+        first_data_row = scan_header(content=content, file_type='ras', metadata=metadata)
+
+        assert first_data_row == 19
+        assert metadata['alpha1'] == '1.540593'
+        assert metadata['beta'] == '1.392250'
+        assert metadata['header']['HW_XG_VOLTAGE_UNIT'] == 'kV'
+        assert metadata['header']['MEAS_COND_AXIS_NAME-0'] == 'Theta/2-Theta'
+        assert metadata['header']['RAS_INT_START'] == ''
+
+    def test_asc_header(self):
+        content = file_content(self.asc_file_name)
+        metadata = {'2theta': {}}
+        first_data_row = scan_header(content=content, file_type='asc', metadata=metadata)
+
+        assert first_data_row == 28
+        assert metadata['2theta'] == {'start': '20', 'stop': '120', 'step': '0.01'}
+        assert metadata['header']['COUNT'] == '10001'
+        assert metadata['header']['SLIT_NAME'] == ['1, DS', '2, SS', '3, RS']
+
+    def test_ras_data_is_not_truncated(self):
+        metadata = ras_file_parser(self.ras_file_name)
+        assert len(metadata['data']['2theta']) == 7
+        assert metadata['data']['intensity'].dtype == np.float64
+
+
+class TestDecodeAscCounts(TestCase):
+
+    ASC_FILE_NAME = "data/xrd_file.asc"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.asc_file_name = os.path.abspath(os.path.join(_file_path, self.ASC_FILE_NAME))
+
+    def test_decode_block(self):
+        data_returned = decode_asc_counts(b"165, 187, 159, 160\r\n153, 203\r\n")
+        data_expected = np.array([165, 187, 159, 160, 153, 203])
+
+        assert data_returned.dtype == np.int64
+        assert np.array_equal(data_expected, data_returned)
+
+    @truncated_asc_fixture
+    def test_data_stops_at_end_marker(self):
+        content = file_content(self.asc_file_name) + ["*END\n", "\n", "*EOF\n"]
+        metadata_from_content = asc_file_parser(xrd_file_content=content)
+        metadata_from_file = asc_file_parser(self.asc_file_name)
+
+        assert len(metadata_from_content['data']) == 12
+        assert np.array_equal(metadata_from_content['data'], metadata_from_file['data'])
+
+
+class TestXrdRawFileParser(TestCase):
+
+    RAW_FILE_NAME = "data/xrd_file.raw"
+    ASC_FILE_NAME = "data/xrd_file.asc"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.raw_file_name = os.path.abspath(os.path.join(_file_path, self.RAW_FILE_NAME))
+        self.asc_file_name = os.path.abspath(os.path.join(_file_path, self.ASC_FILE_NAME))
+
+    @truncated_asc_fixture
+    def test_raw_file_parser(self):
+
+        metadata_returned = xrd_file_parser(self.raw_file_name)
+
+        metadata_expected = {'alpha1': '1.540593',
+                             'alpha2': '1.544414',
+                             'beta': '1.39225',
+                             'data_offset': 3158,
+                             }
+        for key in metadata_expected.keys():
+            assert metadata_returned[key] == metadata_expected[key]
+
+        twotheta_expected = {'start': '20',
+                             'stop': '20.11',
+                             'step': '0.01',
+                             }
+        for key in twotheta_expected.keys():
+            assert metadata_returned['2theta'][key] == twotheta_expected[key]
+
+        assert metadata_returned['header']['SAMPLE'] == 'powder'
+        assert metadata_returned['header']['TARGET'] == 'Cu'
+
+        data_expected = asc_file_parser(self.asc_file_name)['data']
+        assert np.array_equal(data_expected, metadata_returned['data'])
+
+    def test_raw_content(self):
+        with open(self.raw_file_name, 'rb') as f:
+            content_of_file = f.read()
+
+        with pytest.raises(AttributeError):
+            raw_file_parser()
+
+        metadata_returned = xrd_file_parser(xrd_file_content=content_of_file, xrd_file_type=XrdFileType.raw)
+        assert len(metadata_returned['data']) == 12
+
+        with pytest.raises(ValueError):
+            raw_file_parser(xrd_file_content=content_of_file[:-4])
+
+        with pytest.raises(ValueError):
+            raw_file_parser(xrd_file_content=b"*RAS_DATA_START" + content_of_file)
+
+
+class TestBatchFileParser(TestCase):
+
+    DATA_FOLDER = "data"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.data_folder = os.path.abspath(os.path.join(_file_path, self.DATA_FOLDER))
+        self.tmp_folder = tempfile.mkdtemp()
+        for _name in ["xrd_file.asc", "xrd_file.ras", "xrd_file.raw"]:
+            shutil.copy(os.path.join(self.data_folder, _name), self.tmp_folder)
+        with open(os.path.join(self.tmp_folder, "broken.raw"), 'wb') as f:
+            f.write(b"not a raw file")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def test_list_xrd_files(self):
+        file_names = list_xrd_files(self.data_folder)
+        assert [os.path.basename(_name) for _name in file_names] == ['xrd_file.asc',
+                                                                      'xrd_file.ras',
+                                                                      'xrd_file.raw',
+                                                                      'xrd_file.txt',
+                                                                      'xrd_file_full.txt']
+
+        file_names = list_xrd_files(os.path.join(self.data_folder, "*.txt"))
+        assert len(file_names) == 2
+
+    def test_list_xrd_files_recursive(self):
+        os.makedirs(os.path.join(self.tmp_folder, "sub", "folder"))
+        shutil.copy(os.path.join(self.data_folder, "xrd_file.ras"), os.path.join(self.tmp_folder, "sub", "folder"))
+
+        assert len(list_xrd_files(self.tmp_folder)) == 4
+        assert len(list_xrd_files(self.tmp_folder, recursive=True)) == 5
+        file_names = list_xrd_files(os.path.join(self.tmp_folder, "**", "*.ras"), recursive=True)
+        assert file_names == [os.path.join(self.tmp_folder, "sub", "folder", "xrd_file.ras"),
+                              os.path.join(self.tmp_folder, "xrd_file.ras")]
+
+    @truncated_asc_fixture
+    def test_batch_with_errors(self):
+        for max_workers in [1, 2]:
+            scans = batch_file_parser(self.tmp_folder, max_workers=max_workers, max_pending=1)
+
+            assert [os.path.basename(_name) for _name in scans['file_name']] == ['xrd_file.asc',
+                                                                                  'xrd_file.ras',
+                                                                                  'xrd_file.raw']
+            assert list(scans['errors'].keys()) == [os.path.join(self.tmp_folder, "broken.raw")]
+            assert scans['alpha1'] == ['1.54059', '1.540593', '1.540593']
+            assert len(scans['intensity'][0]) == len(scans['2theta'][0]) == 12
+            assert np.allclose(scans['2theta'][1][:3], [20, 20.01, 20.02])
+            assert np.array_equal(scans['intensity'][0], scans['intensity'][2])
+
+
+class TestLazyParsing(TestCase):
+
+    ASC_FILE_NAME = "data/xrd_file.asc"
+    RAS_FILE_NAME = "data/xrd_file.ras"
+    RAW_FILE_NAME = "data/xrd_file.raw"
+    TXT_FILE_NAME = "data/xrd_file.txt"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.file_names = [os.path.abspath(os.path.join(_file_path, _name)) for _name in [self.ASC_FILE_NAME,
+                                                                                          self.RAS_FILE_NAME,
+                                                                                          self.RAW_FILE_NAME,
+                                                                                          self.TXT_FILE_NAME]]
+
+    def test_header_only(self):
+        metadata_returned = xrd_file_parser(self.file_names[1], lazy=True)
+
+        assert metadata_returned['alpha1'] == '1.540593'
+        assert metadata_returned['data_first_line'] == 19
+        assert isinstance(metadata_returned['data'], LazyData)
+        assert not metadata_returned['data'].loaded
+
+        with open(self.file_names[1], 'rb') as f:
+            f.seek(metadata_returned['data_offset'])
+            assert f.readline().startswith(b"20.0000 165.0000")
+
+    @truncated_asc_fixture
+    def test_lazy_data_matches_eager_data(self):
+        for _file_name in self.file_names:
+            metadata_expected = xrd_file_parser(_file_name)
+            metadata_returned = xrd_file_parser(_file_name, lazy=True)
+
+            data_expected = metadata_expected['data']
+            data_returned = metadata_returned['data']
+            if isinstance(data_expected, dict):
+                for key in data_expected.keys():
+                    assert np.array_equal(data_expected[key], data_returned[key])
+            else:
+                assert np.array_equal(data_expected, np.asarray(data_returned))
+                assert len(data_expected) == len(data_returned)
+
+            assert data_returned.loaded
+
+
+class TestRasFileFollower(TestCase):
+
+    RAS_FILE_NAME = "data/xrd_file.ras"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        with open(os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME)), 'rb') as f:
+            self.content = f.read()
+        self.tmp_folder = tempfile.mkdtemp()
+        self.ras_file_name = os.path.join(self.tmp_folder, "xrd_file.ras")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def write(self, content):
+        with open(self.ras_file_name, 'ab') as f:
+            f.write(content)
+
+    def test_rows_appended_between_polls(self):
+        follower = RasFileFollower(self.ras_file_name)
+        assert len(follower.poll()['2theta']) == 0
+
+        data_start = self.content.index(b"*RAS_INT_START")
+        self.write(self.content[:data_start])
+        assert len(follower.poll()['2theta']) == 0
+        assert follower.metadata is None
+
+        # the instrument stops in the middle of a line
+        half = self.content.index(b"20.0300") + 3
+        self.write(self.content[data_start:half])
+        rows = follower.poll()
+        assert follower.metadata is not None
+        assert np.array_equal(rows['2theta'], [20., 20.01, 20.02])
+        assert not follower.finished
+
+        self.write(self.content[half:] + b"*RAS_INT_END\n*RAS_DATA_END\n")
+        rows = follower.poll()
+        assert np.array_equal(rows['2theta'], [20.03, 20.04, 20.05, 20.06])
+        assert rows['intensity'][-1] == 168
+        assert follower.finished
+        assert follower.rows_read == 7
+
+    def test_follow(self):
+        self.write(self.content + b"*RAS_INT_END\n")
+        blocks = list(RasFileFollower(self.ras_file_name).follow(poll_interval=0.01, timeout=1))
+
+        assert len(blocks) == 1
+        assert len(blocks[0]['intensity']) == 7
+
+
+class TestScanBlockReader(TestCase):
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.file_names = [os.path.abspath(os.path.join(_file_path, "data", _name))
+                           for _name in ["xrd_file.ras", "xrd_file.asc", "xrd_file.txt", "xrd_file_full.txt",
+                                         "xrd_file.raw"]]
+
+    @truncated_asc_fixture
+    def test_blocks_match_full_parse(self):
+        for _file_name in self.file_names:
+            metadata = xrd_file_parser(_file_name)
+            if isinstance(metadata['data'], dict):
+                expected = metadata['data']
+            else:
+                expected = {'2theta': metadata['2theta']['axis'], 'intensity': metadata['data']}
+
+            for block_size in [1, 3, 1000, 10 ** 6]:
+                blocks = list(iter_scan_blocks(_file_name, block_size=block_size))
+                assert all(len(_block['intensity']) == block_size for _block in blocks[:-1])
+                assert 0 < len(blocks[-1]['intensity']) <= block_size
+                for _key in expected.keys():
+                    returned = np.concatenate([_block[_key] for _block in blocks])
+                    assert np.array_equal(returned, np.asarray(expected[_key]))
+                    assert returned.dtype == np.asarray(expected[_key]).dtype
+
+    def test_header(self):
+        reader = ScanBlockReader(self.file_names[0], block_size=4)
+        assert reader.metadata['alpha1'] == '1.540593'
+        assert isinstance(reader.metadata['data'], LazyData)
+        assert not reader.metadata['data'].loaded
+
+        # the reader can be iterated more than once
+        assert len(list(reader)) == len(list(reader)) == 2
+
+    def test_wrong_input(self):
+        with pytest.raises(AttributeError):
+            ScanBlockReader()
+        with pytest.raises(ValueError):
+            ScanBlockReader("do_not_exist.ras")
+        with pytest.raises(ValueError):
+            ScanBlockReader(self.file_names[0], block_size=0)
+        with pytest.raises(ValueError):
+            ScanBlockReader(os.path.abspath(__file__))
+
+
+def multi_segment_ras(content=None, n_segments=3, finished=True):
+    """RAS file of n_segments scans: the test file then scans shifted by 10 degrees and 1000 counts"""
+    segments = [content + b"*RAS_INT_END\r\n"]
+    for _segment in range(1, n_segments):
+        rows = "".join("{:.4f} {:.4f} 1.0000\r\n".format(20. + 10 * _segment + 0.01 * _row,
+                                                         1000. * _segment + _row) for _row in range(5))
+        segments.append(b"*RAS_HEADER_START\r\n"
+                        + b'*HW_XG_WAVE_LENGTH_ALPHA1 "1.5406"\r\n'
+                        + '*MEAS_COND_TEMPERATURE "{}"\r\n'.format(100 * _segment).encode()
+                        + b"*RAS_HEADER_END\r\n*RAS_INT_START\r\n"
+                        + rows.encode()
+                        + b"*RAS_INT_END\r\n")
+    if finished:
+        segments.append(b"*RAS_DATA_END\r\n")
+    else:
+        # the last scan is still being written
+        segments[-1] = segments[-1][:-len(b"*RAS_INT_END\r\n")]
+    return b"".join(segments)
+
+
+class TestMultiSegmentRas(TestCase):
+
+    RAS_FILE_NAME = "data/xrd_file.ras"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        with open(os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME)), 'rb') as f:
+            self.content = f.read()
+
+        self.tmp_folder = tempfile.mkdtemp()
+        self.ras_file_name = os.path.join(self.tmp_folder, "multi_segment.ras")
+        with open(self.ras_file_name, 'wb') as f:
+            f.write(multi_segment_ras(self.content))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def check_segments(self, metadata):
+        segments = metadata['segments']
+        assert len(segments) == 3
+        assert metadata['alpha1'] == segments[0]['alpha1'] == '1.540593'
+        assert metadata['data_first_line'] == segments[0]['data_first_line'] == 19
+        assert np.array_equal(metadata['data']['intensity'], [165., 187., 159., 160., 153., 203., 168.])
+
+        assert segments[1]['alpha1'] == segments[2]['alpha1'] == '1.5406'
+        assert segments[1]['alpha2'] is None
+        assert segments[2]['header']['MEAS_COND_TEMPERATURE'] == '200'
+        assert 'FILE_SAMPLE' not in segments[2]['header']
+        assert segments[1]['data_first_line'] == 32
+        assert np.array_equal(segments[2]['data']['2theta'], [40., 40.01, 40.02, 40.03, 40.04])
+        assert np.array_equal(segments[2]['data']['intensity'], [2000., 2001., 2002., 2003., 2004.])
+
+    def test_segments(self):
+        self.check_segments(xrd_file_parser(self.ras_file_name))
+        self.check_segments(ras_file_parser(xrd_file_content=file_content(self.ras_file_name)))
+
+    def test_segment_offsets(self):
+        metadata = xrd_file_parser(self.ras_file_name)
+
+        # a segment can be read back from its offsets alone
+        for _segment in metadata['segments']:
+            with open(self.ras_file_name, 'rb') as f:
+                f.seek(_segment['data_offset'])
+                data = decode_ras_data(f.read(_segment['data_end'] - _segment['data_offset']))
+            assert np.array_equal(data['intensity'], _segment['data']['intensity'])
+
+    def test_lazy_segments(self):
+        metadata = xrd_file_parser(self.ras_file_name, lazy=True)
+        segments = metadata['segments']
+        assert all(isinstance(_segment['data'], LazyData) for _segment in segments)
+        assert segments[1]['header']['MEAS_COND_TEMPERATURE'] == '100'
+
+        assert np.array_equal(segments[2]['data']['intensity'], [2000., 2001., 2002., 2003., 2004.])
+        assert not segments[0]['data'].loaded
+        assert not segments[1]['data'].loaded
+        self.check_segments(metadata)
+
+    def test_lazy_segments_found_on_demand(self):
+        with instrument() as stats:
+            metadata = xrd_file_parser(self.ras_file_name, lazy=True)
+            assert isinstance(metadata['segments'], RasSegments)
+            assert stats['xrd_file_parser/ras_file_parser/header']['bytes_read'] == metadata['data_offset']
+            assert 'segments' not in stats
+
+            # the data of the first segment stops at its *RAS_INT_END
+            assert np.array_equal(metadata['data']['intensity'], [165., 187., 159., 160., 153., 203., 168.])
+            assert metadata['segments'][1]['header']['MEAS_COND_TEMPERATURE'] == '100'
+            assert stats['segments']['calls'] == 1
+            assert stats['segments']['bytes_read'] == metadata['segments'][1]['data_offset'] - metadata['data_offset']
+            assert metadata['segments'][0]['data_end'] < metadata['segments'][1]['data_offset']
+            assert metadata['segments'][1]['data_end'] is None
+
+            assert len(metadata['segments']) == 3
+            assert stats['segments']['calls'] == 3
+            assert metadata['segments'][-1]['data_end'] < os.path.getsize(self.ras_file_name)
+
+    def test_empty_segment(self):
+        # aborted first scan: *RAS_INT_START directly followed by *RAS_INT_END
+        header = self.content[:self.content.index(b"*RAS_INT_START")]
+        with open(self.ras_file_name, 'wb') as f:
+            f.write(multi_segment_ras(header + b"*RAS_INT_START\r\n"))
+
+        for _lazy in [False, True]:
+            segments = xrd_file_parser(self.ras_file_name, lazy=_lazy)['segments']
+            assert len(segments) == 3
+            assert len(segments[0]['data']['intensity']) == 0
+            assert segments[0]['data']['error'].shape == (0,)
+            assert np.array_equal(segments[2]['data']['intensity'], [2000., 2001., 2002., 2003., 2004.])
+
+        # header only file
+        with open(self.ras_file_name, 'wb') as f:
+            f.write(header)
+        assert len(xrd_file_parser(self.ras_file_name)['data']['2theta']) == 0
+
+    def test_segment_being_written(self):
+        with open(self.ras_file_name, 'wb') as f:
+            f.write(multi_segment_ras(self.content, n_segments=2, finished=False))
+
+        segments = xrd_file_parser(self.ras_file_name)['segments']
+        assert len(segments) == 2
+        assert segments[1]['data_end'] == os.path.getsize(self.ras_file_name)
+        assert len(segments[1]['data']['intensity']) == 5
+
+    def test_single_segment(self):
+        metadata = xrd_file_parser(os.path.join(os.path.dirname(__file__), self.RAS_FILE_NAME))
+        assert len(metadata['segments']) == 1
+        assert metadata['segments'][0]['data'] is metadata['data']
+
+    def test_blocks_of_a_segment(self):
+        blocks = list(iter_scan_blocks(self.ras_file_name, block_size=2, segment=1))
+        assert len(blocks) == 3
+        assert np.array_equal(np.concatenate([_block['intensity'] for _block in blocks]),
+                              [1000., 1001., 1002., 1003., 1004.])
+
+
+class TestLeanImports(TestCase):
+
+    def test_core_does_not_import_pandas_or_scipy(self):
+        code = ("import sys\n"
+                "import notebooks.xrd_file_parser, notebooks.utilities, notebooks.background, notebooks.kalpha2\n"
+                "assert 'pandas' not in sys.modules, 'pandas'\n"
+                "assert 'scipy' not in sys.modules, 'scipy'\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
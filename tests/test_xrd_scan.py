@@ -0,0 +1,62 @@
+from unittest import TestCase
+import os
+import numpy as np
+import pytest
+
+from notebooks.xrd_scan import XrdScan, load_xrd_scan
+from notebooks.xrd_file_parser import xrd_file_parser
+from notebooks.scan_axis import UniformAxis
+
+
+class TestXrdScan(TestCase):
+
+    RAS_FILE_NAME = "data/xrd_file.ras"
+    RAW_FILE_NAME = "data/xrd_file.raw"
+
+    def setUp(self):
+        _file_path = os.path.dirname(__file__)
+        self.ras_file_name = os.path.abspath(os.path.join(_file_path, self.RAS_FILE_NAME))
+        self.raw_file_name = os.path.abspath(os.path.join(_file_path, self.RAW_FILE_NAME))
+
+    def test_typed_fields(self):
+        scan = load_xrd_scan(self.ras_file_name)
+
+        assert not hasattr(scan, '__dict__')
+        assert scan.alpha1 == 1.540593
+        assert scan.alpha2 == 1.544414
+        assert scan.beta == 1.39225
+        assert scan.sample is None
+        assert isinstance(scan.two_theta, UniformAxis)
+        assert scan.intensity.dtype == np.float64
+        assert np.array_equal(scan.intensity, [165., 187., 159., 160., 153., 203., 168.])
+        assert np.array_equal(scan.error, np.ones(7))
+
+    def test_float32_storage(self):
+        scan = load_xrd_scan(self.raw_file_name, dtype=np.float32)
+
+        assert scan.intensity.dtype == np.float32
+        assert scan.nbytes == 12 * 4
+        assert scan.sample == 'powder'
+
+    def test_dict_view(self):
+        scan = load_xrd_scan(self.ras_file_name)
+        metadata = xrd_file_parser(self.ras_file_name)
+
+        assert float(scan['alpha1']) == float(metadata['alpha1'])
+        assert scan['data_first_line'] == metadata['data_first_line']
+        for key in metadata['data'].keys():
+            assert np.array_equal(scan['data'][key], metadata['data'][key])
+
+        scan = load_xrd_scan(self.raw_file_name)
+        assert np.array_equal(scan['data'], xrd_file_parser(self.raw_file_name)['data'])
+        assert scan['2theta']['start'] == 20
+        assert scan['2theta']['step'] == 0.01
+        assert 'beta' in scan
+        assert 'intensity' not in scan
+
+        with pytest.raises(KeyError):
+            scan['intensity']
+
+    def test_length_mismatch(self):
+        with pytest.raises(ValueError):
+            XrdScan(two_theta=np.arange(3), intensity=np.arange(4))